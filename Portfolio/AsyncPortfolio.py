@@ -0,0 +1,263 @@
+import asyncio
+import traceback
+import numpy as np
+from functools import partial
+from time import time
+from .Portfolio import Portfolio
+from .PortfolioMgr import PortfolioMgr
+
+
+async def broker_call(obj,name,*args,**kwargs):
+    """
+    call obj.name, awaiting obj.async_name instead when the object provides it,
+    blocking calls run on the event loop's default executor
+
+    obj (object): trader or order
+    name (str): method name
+    """
+    fn = getattr(obj,'async_'+name,None)
+    if fn is not None:
+        return await fn(*args,**kwargs)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None,partial(getattr(obj,name),*args,**kwargs))
+
+
+class AsyncPortfolio(Portfolio):
+    """
+    Portfolio whose broker I/O can be driven from an asyncio event loop
+
+    every async_ method is a coroutine. with a trader providing async_ variants of its methods
+    (async_place_market_buy_order, async_last_trade_price, ... and async_check/async_cancel on
+    orders) no thread is used at all, otherwise the blocking call runs on the loop's executor.
+    bookkeeping (queue, positions, trading record) is shared with the blocking methods.
+    """
+
+    def __init__(self,*args,**kwargs):
+        self.background = set()
+        Portfolio.__init__(self,*args,**kwargs)
+
+    async def async_quote_last_price(self,*scodes):
+        """
+        get last trading price of given stocks, served from the quote cache when fresh enough,
+        nan for symbols the broker returned no price for
+        """
+        res,missing = self.quotes.cached(*scodes)
+        if len(missing):
+            flights = self.quotes.async_flights
+            need = [scode for scode in missing if scode not in flights]
+            waits = {flights[scode] for scode in missing if scode in flights}
+            if len(need):
+                flight = asyncio.get_running_loop().create_future()
+                for scode in need:
+                    flights[scode] = flight
+                try:
+                    rows = await broker_call(self.trader,'last_trade_price',','.join(need))
+                    flight.set_result(self.quotes.store(need,rows))
+                except Exception as e:
+                    flight.set_exception(e)
+                    raise
+                finally:
+                    for scode in need:
+                        if flights.get(scode) is flight:
+                            del flights[scode]
+            if len(need):
+                waits.add(flight)
+            for flight in waits:
+                for scode,price in (await flight).items():
+                    res.setdefault(scode,price)
+        return np.array([res.get(scode,np.nan) for scode in scodes],dtype = np.float64)
+
+    async def async_instrument(self,scode):
+        instrument = self.converter.SI.get(scode)
+        if instrument is not None:
+            return instrument
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None,self.converter,scode)
+
+    async def async_place(self,side,kind,scode,n,force_buy = False,**kw):
+        """
+        place an order and put it into the queue
+
+        side (str): buy or sell
+        kind (str): market, limit, stop_loss or stop_limit
+        scode (str): symbol of stock
+        n (int): shares
+        force_buy (bool): allow using back up buying power to buy
+        kw: price, stop_price, time_in_force passed to the trader
+        return (order|None): the placed order
+        """
+        if side == 'buy':
+            price = self.checked_quote(scode,(await self.async_quote_last_price(scode))[0])
+            if price is None:
+                return None
+            if self.bp < price*n*1.005 and not force_buy:
+                self.log.warning("no enough buying power for this portfolio to buy {} shares of {}",n,scode,scode = scode)
+                return None
+        else:
+            assert scode in self.portfolio_record
+            if self.portfolio_record.shares_of(scode) < n:
+                self.log.warning("no enough shares for this portfolio to sell {} shares of {}",n,scode,scode = scode)
+                return None
+        instrument = await self.async_instrument(scode)
+        order = await broker_call(
+            self.trader,
+            'place_{}_{}_order'.format(kind,side),
+            instrument,
+            scode,
+            n,
+            **kw
+        )
+        if order is None or getattr(order,'order',True) is None:
+            self.log.error("fail to place {} {} order {} shares of {}",kind.replace('_',' '),side,n,scode,scode = scode)
+            return None
+        self.enqueue(scode,order,market = kind == 'market')
+        return order
+
+    async def async_market_buy(self,scode,n,force_buy = False,time_in_force = 'gfd'):
+        return await self.async_place('buy','market',scode,n,force_buy,time_in_force = time_in_force)
+
+    async def async_market_sell(self,scode,n,time_in_force = 'gfd'):
+        return await self.async_place('sell','market',scode,n,time_in_force = time_in_force)
+
+    async def async_limit_buy(self,scode,price,n,force_buy = False,time_in_force = 'gtc'):
+        return await self.async_place('buy','limit',scode,n,force_buy,price = price,time_in_force = time_in_force)
+
+    async def async_limit_sell(self,scode,price,n,time_in_force = 'gtc'):
+        return await self.async_place('sell','limit',scode,n,price = price,time_in_force = time_in_force)
+
+    async def async_stop_loss_buy(self,scode,stop_price,n,force_buy = False,time_in_force = 'gtc'):
+        return await self.async_place('buy','stop_loss',scode,n,force_buy,stop_price = stop_price,time_in_force = time_in_force)
+
+    async def async_stop_loss_sell(self,scode,stop_price,n,time_in_force = 'gtc'):
+        return await self.async_place('sell','stop_loss',scode,n,stop_price = stop_price,time_in_force = time_in_force)
+
+    async def async_stop_limit_buy(self,scode,stop_price,n,force_buy = False,time_in_force = 'gtc'):
+        return await self.async_place('buy','stop_limit',scode,n,force_buy,stop_price = stop_price,time_in_force = time_in_force)
+
+    async def async_stop_limit_sell(self,scode,stop_price,n,time_in_force = 'gtc'):
+        return await self.async_place('sell','stop_limit',scode,n,stop_price = stop_price,time_in_force = time_in_force)
+
+    async def async_check_orders(self,orders):
+        """
+        get the state of many orders at once, None for orders that could not be checked
+        """
+        if hasattr(self.trader,'async_check_orders'):
+            try:
+                return await self.trader.async_check_orders(orders)
+            except Exception as e:
+                self.log.error("fail to check {} orders: {!r}",len(orders),e)
+                return [None]*len(orders)
+        async def check(order):
+            try:
+                return await broker_call(order,'check')
+            except:
+                return None
+        return await asyncio.gather(*[check(order) for order in orders])
+
+    async def async_confirm_pass(self):
+        """
+        check every order that is due and book the executed ones
+        """
+        entries = self.queue.pop_due()
+        if not len(entries):
+            return
+        states = await self.async_check_orders([entry.order for entry in entries])
+        for entry,d in zip(entries,states):
+            self.settle(entry,d)
+        if self.snapshot_due():
+            # writing the snapshot blocks on the disk, keep it off the loop
+            await asyncio.get_running_loop().run_in_executor(None,self.maybe_snapshot)
+
+    async def async_confirm_order(self,gap_time = 5):
+        """
+        keep on confirming orders until stop_confirm is called
+
+        gap_time (float|int): longest pause between two confirms, in sec
+        """
+        gap_time = float(gap_time)
+        assert gap_time > 0
+        self.confirm_signal = True
+        while self.confirm_signal:
+            try:
+                await self.async_confirm_pass()
+            except Exception as e:
+                self.log.error("confirm pass failed: {!r}",e,traceback = traceback.format_exc())
+            pause = gap_time
+            due = self.queue.next_due()
+            if due is not None:
+                pause = min(pause,max(due - time(),0))
+            await asyncio.sleep(pause)
+
+    def cancel_stale_order(self,entry):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return Portfolio.cancel_stale_order(self,entry)
+        task = loop.create_task(broker_call(entry.order,'cancel'))
+        self.background.add(task)
+        task.add_done_callback(self.background.discard)
+
+    async def async_cancel_all_orders_in_queue(self):
+        """
+        cancel all orders in the queue that havent been executed yet
+        """
+        entries = self.queue.pending()
+        await asyncio.gather(*[broker_call(entry.order,'cancel') for entry in entries])
+        if len(entries):
+            self.settle_cancelled(entries,await self.async_check_orders([entry.order for entry in entries]))
+        self.log.info("all orders in queue been cancelled")
+
+    async def async_get_market_value(self):
+        """
+        get market value of current portfolio
+        """
+        snap = self.portfolio_record.snapshot()
+        if not len(snap):
+            return self.bp
+        return float(np.dot(self.priced(snap,await self.async_quote_last_price(*snap.scodes)),snap.shares))+self.bp
+
+
+class AsyncPortfolioMgr(PortfolioMgr):
+    """
+    PortfolioMgr creating AsyncPortfolio, with coroutine variants of the account queries
+    """
+    portfolio_class = AsyncPortfolio
+
+    async def async_get_bp_owned(self):
+        """
+        get buying power owned by the user
+        """
+        account = await broker_call(self.trader,'get_account')
+        return float(account['margin_balances']['unallocated_margin_cash'])
+
+    async def async_get_securities_owned(self):
+        """
+        get shares owned by the user
+        """
+        owned = (await broker_call(self.trader,'securities_owned'))['results']
+        loop = asyncio.get_running_loop()
+        scodes = await loop.run_in_executor(None,self.converter.prefetch,[d['instrument'] for d in owned])
+        return {
+            scodes[d['instrument']]:int(float(d['quantity'])) for d in owned
+        }
+
+    async def async_update_allocatable_buying_power(self):
+        """
+        update the unassigned_bp variable
+        """
+        owned = await self.async_get_bp_owned()
+        self.unassigned_bp = owned - sum(p.bp for p in self.portfolios.values())
+
+    async def async_confirm_pass(self):
+        """
+        confirm due orders of every portfolio concurrently
+        """
+        await asyncio.gather(*[p.async_confirm_pass() for p in self.portfolios.values()])
+
+    async def async_get_market_values(self):
+        """
+        market value of every portfolio
+        """
+        names = list(self.portfolios)
+        values = await asyncio.gather(*[self.portfolios[k].async_get_market_value() for k in names])
+        return dict(zip(names,values))
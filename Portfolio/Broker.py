@@ -0,0 +1,201 @@
+from email.utils import parsedate_to_datetime
+from six.moves.urllib.parse import unquote
+
+
+class Broker:
+    """
+    what Portfolio, PortfolioMgr and SIconverter need from a broker
+
+    orders returned by place_*_order must provide check() (returning a dict with state, side, type,
+    quantity, trigger and executions), cancel(), and an order attribute that is a dict with an id,
+    or None if the order could not be placed.
+
+    optional:
+        check_orders(orders): states of many orders with one request
+        async_<method>: coroutine variants used by AsyncPortfolio
+    """
+
+    def get_account(self):
+        """
+        return (dict): account, with margin_balances.unallocated_margin_cash
+        """
+        raise NotImplementedError
+
+    def securities_owned(self):
+        """
+        return (dict): results, a list of dicts with instrument, quantity and average_buy_price
+        """
+        raise NotImplementedError
+
+    def instruments(self,scode):
+        """
+        return (dict): instrument of a symbol, with its url
+        """
+        raise NotImplementedError
+
+    def instrument_symbol(self,instrument):
+        """
+        return (str): symbol of an instrument url
+        """
+        raise NotImplementedError
+
+    def last_trade_price(self,scodes):
+        """
+        scodes (str): comma separated symbols
+        return (list): one row per symbol, price first
+        """
+        raise NotImplementedError
+
+    def market_hours(self,market,day):
+        """
+        market (str): market identifier code
+        day (date): the day
+        return (dict,float|None): hours with is_open, opens_at and closes_at, and the server time
+            (seconds since epoch) the answer was sent, if known
+        """
+        raise NotImplementedError
+
+    def get_order(self,oid):
+        """
+        oid (str): id of an order placed earlier, e.g. before a restart
+        return (order|None): the order, as returned by place_*_order, None if the broker does not know it
+        """
+        raise NotImplementedError
+
+    def place_market_buy_order(self,instrument,scode,n,time_in_force = 'gfd'):
+        raise NotImplementedError
+
+    def place_market_sell_order(self,instrument,scode,n,time_in_force = 'gfd'):
+        raise NotImplementedError
+
+    def place_limit_buy_order(self,instrument,scode,n,price = None,time_in_force = 'gtc'):
+        raise NotImplementedError
+
+    def place_limit_sell_order(self,instrument,scode,n,price = None,time_in_force = 'gtc'):
+        raise NotImplementedError
+
+    def place_stop_loss_buy_order(self,instrument,scode,n,stop_price = None,time_in_force = 'gtc'):
+        raise NotImplementedError
+
+    def place_stop_loss_sell_order(self,instrument,scode,n,stop_price = None,time_in_force = 'gtc'):
+        raise NotImplementedError
+
+    def place_stop_limit_buy_order(self,instrument,scode,n,stop_price = None,time_in_force = 'gtc'):
+        raise NotImplementedError
+
+    def place_stop_limit_sell_order(self,instrument,scode,n,stop_price = None,time_in_force = 'gtc'):
+        raise NotImplementedError
+
+
+class RobinhoodOrder:
+    """
+    an order of the account looked up by id, offers what Portfolio uses of a placed order
+    """
+
+    def __init__(self,session,order):
+        self.session = session
+        self.order = order
+
+    def check(self):
+        self.order = self.session.get(self.order['url']).json()
+        return self.order
+
+    def cancel(self):
+        if self.order.get('cancel') is not None:
+            self.session.post(self.order['cancel'])
+
+
+class RobinhoodBroker(Broker):
+    HOURS_URL = 'https://api.robinhood.com/markets/{}/hours/{}/'
+    ORDER_URL = 'https://api.robinhood.com/orders/{}/'
+
+    def __init__(self,trader = None):
+        """
+        Broker backed by a logged in Robinhood trader, anything not in the Broker interface
+        is forwarded to the trader
+
+        trader (Robinhood): robinhood account trader
+        """
+        assert trader is not None
+        self.trader = trader
+
+    @classmethod
+    def login(cls,robin_un,robin_pd):
+        from Robinhood import Robinhood
+        trader = Robinhood()
+        trader.login(robin_un,robin_pd)
+        return cls(trader)
+
+    def __getattr__(self,name):
+        if name == 'trader':
+            raise AttributeError(name)
+        return getattr(self.trader,name)
+
+    def __eq__(self,oth):
+        return isinstance(oth,RobinhoodBroker) and oth.trader is self.trader
+
+    def __hash__(self):
+        return hash(id(self.trader))
+
+    def get_account(self):
+        return self.trader.get_account()
+
+    def securities_owned(self):
+        return self.trader.securities_owned()
+
+    def instruments(self,scode):
+        return self.trader.instruments(scode)
+
+    def instrument_symbol(self,instrument):
+        return self.trader.session.get(unquote(instrument)).json()['symbol']
+
+    def last_trade_price(self,scodes):
+        return self.trader.last_trade_price(scodes)
+
+    def market_hours(self,market,day):
+        response = self.trader.session.get(self.HOURS_URL.format(market,day.isoformat()))
+        try:
+            server = parsedate_to_datetime(response.headers['Date']).timestamp()
+        except:
+            server = None
+        return response.json(),server
+
+    def get_order(self,oid):
+        response = self.trader.session.get(self.ORDER_URL.format(oid))
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return RobinhoodOrder(self.trader.session,response.json())
+
+    def place_market_buy_order(self,*args,**kwargs):
+        return self.trader.place_market_buy_order(*args,**kwargs)
+
+    def place_market_sell_order(self,*args,**kwargs):
+        return self.trader.place_market_sell_order(*args,**kwargs)
+
+    def place_limit_buy_order(self,*args,**kwargs):
+        return self.trader.place_limit_buy_order(*args,**kwargs)
+
+    def place_limit_sell_order(self,*args,**kwargs):
+        return self.trader.place_limit_sell_order(*args,**kwargs)
+
+    def place_stop_loss_buy_order(self,*args,**kwargs):
+        return self.trader.place_stop_loss_buy_order(*args,**kwargs)
+
+    def place_stop_loss_sell_order(self,*args,**kwargs):
+        return self.trader.place_stop_loss_sell_order(*args,**kwargs)
+
+    def place_stop_limit_buy_order(self,*args,**kwargs):
+        return self.trader.place_stop_limit_buy_order(*args,**kwargs)
+
+    def place_stop_limit_sell_order(self,*args,**kwargs):
+        return self.trader.place_stop_limit_sell_order(*args,**kwargs)
+
+
+def as_broker(trader):
+    """
+    use trader as it is if it implements Broker, wrap it into a RobinhoodBroker otherwise
+    """
+    if isinstance(trader,Broker):
+        return trader
+    return RobinhoodBroker(trader)
@@ -0,0 +1,217 @@
+import datetime
+import os
+from collections import deque
+from threading import Condition
+from threading import Lock
+from threading import Thread
+from time import time
+
+
+class Event:
+    """
+    one log event, msg is formatted with args only when the event is turned into a string
+    """
+    __slots__ = ('seq','when','level','msg','args','scode','fields')
+
+    def __init__(self,seq,when,level,msg,args,scode,fields):
+        self.seq = seq
+        self.when = when
+        self.level = level
+        self.msg = msg
+        self.args = args
+        self.scode = scode
+        self.fields = fields
+
+    def message(self):
+        return self.msg.format(*self.args) if self.args else self.msg
+
+    def __str__(self):
+        line = "{} {}: {}".format(
+            datetime.datetime.fromtimestamp(self.when).strftime('%Y-%m-%d %H:%M:%S.%f'),
+            EventLog.NAMES[self.level],
+            self.message()
+        )
+        if self.scode is not None:
+            line += " scode={}".format(self.scode)
+        for k,v in self.fields.items():
+            line += " {}={}".format(k,v)
+        return line
+
+    def __repr__(self):
+        return "Event({})".format(self)
+
+
+class EventLog:
+    DEBUG = 10
+    INFO = 20
+    WARNING = 30
+    ERROR = 40
+    NAMES = {DEBUG : 'DEBUG',INFO : 'INFO',WARNING : 'WARNING',ERROR : 'ERROR'}
+
+    def __init__(self,capacity = 10000,path = None,max_bytes = 1<<22,backups = 5,flush_interval = 1.0,lock = None):
+        """
+        bounded in memory log of structured events
+
+        the latest capacity events are kept, older ones fall off. events are stored as given
+        (message template, arguments, symbol, extra fields) and only formatted when read or written.
+        with a path, a background thread appends the events to that file every flush_interval sec,
+        the file is rotated into path.1 ... path.<backups> once it grows over max_bytes.
+
+        capacity (int): events kept in memory
+        path (str|None): log file, see open()
+        max_bytes (int): size of the log file before it is rotated
+        backups (int): rotated files kept
+        flush_interval (float): longest time an event waits before it is written, in sec
+        lock (Lock|None): lock guarding the buffer, e.g. a TimedLock
+        """
+        self.events = deque(maxlen = max(int(capacity),1))
+        self.lock = Lock() if lock is None else lock
+        self.seq = 0
+        self.written_seq = 0
+        self.path = None
+        self.max_bytes = int(max_bytes)
+        self.backups = int(backups)
+        self.flush_interval = float(flush_interval)
+        self.io_lock = Lock()
+        self.cv = Condition(Lock())
+        self.closed = False
+        self.flusher = None
+        if path is not None:
+            self.open(path)
+
+    def emit(self,level,msg,*args,scode = None,**fields):
+        """
+        record an event
+
+        level (int): one of DEBUG, INFO, WARNING, ERROR
+        msg (str): message, a str.format template for args
+        scode (str|None): symbol the event is about
+        fields: anything else worth keeping
+        """
+        when = time()
+        self.lock.acquire()
+        self.seq += 1
+        self.events.append(Event(self.seq,when,level,msg,args,scode,fields))
+        self.lock.release()
+
+    def debug(self,msg,*args,**kw):
+        self.emit(EventLog.DEBUG,msg,*args,**kw)
+
+    def info(self,msg,*args,**kw):
+        self.emit(EventLog.INFO,msg,*args,**kw)
+
+    def warning(self,msg,*args,**kw):
+        self.emit(EventLog.WARNING,msg,*args,**kw)
+
+    def error(self,msg,*args,**kw):
+        self.emit(EventLog.ERROR,msg,*args,**kw)
+
+    def append(self,line):
+        """
+        record an already formatted message, as the old list based log did
+        """
+        self.emit(EventLog.INFO,str(line))
+
+    def query(self,level = None,scode = None,since = None,limit = None):
+        """
+        events in memory, oldest first
+
+        level (int|None): lowest level returned
+        scode (str|None): only events about this symbol
+        since (float|None): only events at or after this timestamp
+        limit (int|None): only the latest limit matching events
+        return (list): Event
+        """
+        self.lock.acquire()
+        events = list(self.events)
+        self.lock.release()
+        out = [
+            e for e in events
+            if (level is None or e.level >= level)
+            and (scode is None or e.scode == scode)
+            and (since is None or e.when >= since)
+        ]
+        if limit is not None:
+            out = out[-int(limit):] if limit > 0 else []
+        return out
+
+    def __len__(self):
+        return len(self.events)
+
+    def __iter__(self):
+        return iter(str(e) for e in self.query())
+
+    def open(self,path):
+        """
+        stream the events to path from now on, starting with those still in memory,
+        does nothing if already streaming to path
+        """
+        path = os.path.abspath(path)
+        self.io_lock.acquire()
+        try:
+            if self.path == path:
+                return
+            self.path = path
+            self.written_seq = 0
+        finally:
+            self.io_lock.release()
+        if self.flusher is None:
+            self.flusher = Thread(target = self.flush_loop,daemon = True)
+            self.flusher.start()
+
+    def flush(self):
+        """
+        write the events not written yet, if streaming to a file
+        """
+        self.io_lock.acquire()
+        try:
+            if self.path is None:
+                return
+            self.lock.acquire()
+            events = [e for e in self.events if e.seq > self.written_seq]
+            lost = events[0].seq - self.written_seq - 1 if len(events) else 0
+            self.lock.release()
+            if not len(events):
+                return
+            data = ''.join(str(e)+'\n' for e in events)
+            if lost > 0:
+                data = "{} events dropped before being written\n".format(lost) + data
+            if os.path.exists(self.path) and os.path.getsize(self.path) + len(data) > self.max_bytes:
+                self.rotate()
+            with open(self.path,'a') as f:
+                f.write(data)
+            self.written_seq = events[-1].seq
+        finally:
+            self.io_lock.release()
+
+    def rotate(self):
+        for i in range(self.backups - 1,0,-1):
+            if os.path.exists('{}.{}'.format(self.path,i)):
+                os.replace('{}.{}'.format(self.path,i),'{}.{}'.format(self.path,i+1))
+        if self.backups > 0:
+            os.replace(self.path,self.path+'.1')
+        else:
+            os.remove(self.path)
+
+    def flush_loop(self):
+        while True:
+            self.cv.acquire()
+            if not self.closed:
+                self.cv.wait(self.flush_interval)
+            closed = self.closed
+            self.cv.release()
+            self.flush()
+            if closed:
+                return
+
+    def close(self):
+        """
+        write what is left and stop the background thread
+        """
+        self.cv.acquire()
+        self.closed = True
+        self.cv.notify_all()
+        self.cv.release()
+        if self.flusher is not None:
+            self.flusher.join()
+        self.flush()
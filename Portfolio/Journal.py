@@ -0,0 +1,252 @@
+import os
+import struct
+import zlib
+from threading import Condition
+from threading import Lock
+from threading import Thread
+
+
+class Journal:
+    MAGIC = b'RHPJ'
+    VERSION = 1
+    HEADER = struct.Struct('<4sHH')
+    # payload length, sequence number, crc32 of sequence number and payload
+    RECORD = struct.Struct('<IQI')
+    # kind -> (code, field types), s: str, d: float64, q: int64
+    KINDS = {
+        'fill' : (1,'sssddsq'),
+        'ledger' : (2,'ssddsq'),
+        'bp' : (3,'d'),
+        'bp_set' : (4,'d'),
+        'book' : (5,'sdd'),
+        'order' : (6,'ssq'),
+        'done' : (7,'s')
+    }
+    NAMES = {code:(kind,types) for kind,(code,types) in KINDS.items()}
+
+    def __init__(self,path,sync_every = 64,sync_interval = 0.05,base_seq = 0):
+        """
+        append only binary journal of state changes
+
+        records are buffered in memory and written + fsynced by a background thread, in a batch
+        every sync_interval sec or as soon as sync_every records are waiting, sync() waits until
+        everything written so far is on disk. a torn record at the end of the file (crash in the
+        middle of a write) is detected by its checksum and cut off when the journal is reopened.
+
+        path (str): journal file, created if missing
+        sync_every (int): records waiting before a batch is written without waiting for sync_interval
+        sync_interval (float): longest time a record stays in memory, in sec
+        base_seq (int): sequence number already covered by a snapshot, numbering continues after it
+        """
+        self.path = path
+        self.sync_every = int(sync_every)
+        self.sync_interval = float(sync_interval)
+        last_seq,end = Journal.scan(path)
+        if end is None:
+            with open(path,'wb') as f:
+                f.write(Journal.HEADER.pack(Journal.MAGIC,Journal.VERSION,0))
+                f.flush()
+                os.fsync(f.fileno())
+        else:
+            os.truncate(path,end)
+        self.fd = os.open(path,os.O_WRONLY|os.O_APPEND)
+        self.seq = max(last_seq,int(base_seq))
+        self.synced_seq = self.seq
+        self.pending = 0
+        self.buffer = bytearray()
+        self.buf_lock = Lock()
+        self.io_lock = Lock()
+        self.cv = Condition(self.buf_lock)
+        self.closed = False
+        self.flusher = Thread(target = self.flush_loop,daemon = True)
+        self.flusher.start()
+
+    @staticmethod
+    def encode(kind,fields):
+        code,types = Journal.KINDS[kind]
+        assert len(types) == len(fields)
+        out = [bytes((code,))]
+        for t,v in zip(types,fields):
+            if t == 's':
+                b = str(v).encode('utf-8')
+                out.append(struct.pack('<H',len(b)))
+                out.append(b)
+            else:
+                out.append(struct.pack('<'+t,v))
+        return b''.join(out)
+
+    @staticmethod
+    def decode(payload):
+        kind,types = Journal.NAMES[payload[0]]
+        fields = []
+        i = 1
+        for t in types:
+            if t == 's':
+                n, = struct.unpack_from('<H',payload,i)
+                fields.append(payload[i+2:i+2+n].decode('utf-8'))
+                i += 2+n
+            else:
+                fields.append(struct.unpack_from('<'+t,payload,i)[0])
+                i += 8
+        return kind,fields
+
+    @staticmethod
+    def frames(data):
+        """
+        walk the records of a journal file content
+
+        return (generator): (seq,payload,start,end) up to the first torn or corrupted record
+        """
+        if len(data) < Journal.HEADER.size:
+            return
+        magic,version,_ = Journal.HEADER.unpack_from(data,0)
+        assert magic == Journal.MAGIC and version == Journal.VERSION
+        i = Journal.HEADER.size
+        while i + Journal.RECORD.size <= len(data):
+            n,seq,crc = Journal.RECORD.unpack_from(data,i)
+            j = i + Journal.RECORD.size
+            payload = data[j:j+n]
+            if len(payload) < n or zlib.crc32(payload,zlib.crc32(struct.pack('<Q',seq))) != crc:
+                return
+            yield seq,payload,i,j+n
+            i = j+n
+
+    @staticmethod
+    def scan(path):
+        """
+        return (int,int|None): last sequence number and end of the last complete record,
+            None if the file does not exist or has no header
+        """
+        if not os.path.exists(path):
+            return 0,None
+        with open(path,'rb') as f:
+            data = f.read()
+        if len(data) < Journal.HEADER.size:
+            return 0,None
+        last,end = 0,Journal.HEADER.size
+        for seq,_,_,end in Journal.frames(data):
+            last = seq
+        return last,end
+
+    @staticmethod
+    def read(path,after = 0):
+        """
+        records of a journal file
+
+        after (int): skip records with a sequence number up to after (already in a snapshot)
+        return (list): (seq,kind,fields)
+        """
+        if not os.path.exists(path):
+            return []
+        with open(path,'rb') as f:
+            data = f.read()
+        return [(seq,)+Journal.decode(payload) for seq,payload,_,_ in Journal.frames(data) if seq > after]
+
+    def write(self,kind,*fields):
+        """
+        append a record, it reaches the disk with the next batch
+
+        return (int): sequence number of the record
+        """
+        payload = Journal.encode(kind,fields)
+        self.buf_lock.acquire()
+        self.seq += 1
+        seq = self.seq
+        self.buffer += Journal.RECORD.pack(len(payload),seq,zlib.crc32(payload,zlib.crc32(struct.pack('<Q',seq))))
+        self.buffer += payload
+        self.pending += 1
+        if self.pending >= self.sync_every:
+            self.cv.notify_all()
+        self.buf_lock.release()
+        return seq
+
+    def flush(self):
+        """
+        write and fsync everything buffered
+        """
+        self.io_lock.acquire()
+        self.buf_lock.acquire()
+        data = self.buffer
+        seq = self.seq
+        self.buffer = bytearray()
+        self.pending = 0
+        self.buf_lock.release()
+        try:
+            if len(data):
+                os.write(self.fd,data)
+                os.fsync(self.fd)
+        finally:
+            self.io_lock.release()
+        self.buf_lock.acquire()
+        self.synced_seq = max(self.synced_seq,seq)
+        self.cv.notify_all()
+        self.buf_lock.release()
+
+    def flush_loop(self):
+        while True:
+            self.buf_lock.acquire()
+            if not self.closed and self.pending < self.sync_every:
+                self.cv.wait(self.sync_interval)
+            closed = self.closed
+            self.buf_lock.release()
+            if closed:
+                return
+            self.flush()
+
+    def sync(self):
+        """
+        wait until every record written so far is on disk
+        """
+        self.buf_lock.acquire()
+        target = self.seq
+        self.buf_lock.release()
+        if self.synced_seq < target:
+            self.flush()
+
+    def truncate(self,seq):
+        """
+        drop the records up to seq, once they are covered by a snapshot
+        """
+        self.io_lock.acquire()
+        try:
+            self.buf_lock.acquire()
+            data = self.buffer
+            last = self.seq
+            self.buffer = bytearray()
+            self.pending = 0
+            self.buf_lock.release()
+            if len(data):
+                os.write(self.fd,data)
+            with open(self.path,'rb') as f:
+                old = f.read()
+            tmp = '{}.tmp'.format(self.path)
+            with open(tmp,'wb') as f:
+                f.write(Journal.HEADER.pack(Journal.MAGIC,Journal.VERSION,0))
+                for s,_,start,end in Journal.frames(old):
+                    if s > seq:
+                        f.write(old[start:end])
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp,self.path)
+            os.close(self.fd)
+            self.fd = os.open(self.path,os.O_WRONLY|os.O_APPEND)
+        finally:
+            self.io_lock.release()
+        self.buf_lock.acquire()
+        self.synced_seq = max(self.synced_seq,last)
+        self.cv.notify_all()
+        self.buf_lock.release()
+
+    def close(self):
+        """
+        write what is left and stop the background thread
+        """
+        if self.closed:
+            return
+        self.buf_lock.acquire()
+        self.closed = True
+        self.cv.notify_all()
+        self.buf_lock.release()
+        self.flusher.join()
+        self.flush()
+        os.close(self.fd)
@@ -0,0 +1,119 @@
+import datetime
+from threading import Lock
+from time import time
+from .Broker import as_broker
+
+
+class MarketCalendar:
+    def __init__(
+        self,
+        trader = None,
+        market = 'XNAS',
+        days = 7
+    ):
+        """
+        market hours fetched once per day and kept in memory
+
+        is_open compares the cached hours with the local clock corrected by an estimate of the
+        offset to the server clock, taken from the server time of the hours responses
+        (observe can feed it any other server time), so no order has to be placed to know the time.
+
+        trader (Broker): broker to send requests, a Robinhood trader is wrapped into a RobinhoodBroker
+        market (str): market identifier code
+        days (int): days fetched together when the hours of a day are missing
+        """
+        assert trader is not None
+        assert days > 0
+        self.trader = as_broker(trader)
+        self.market = market
+        self.days = int(days)
+        self.hours = {}
+        self.offsets = []
+        self.offset = 0.0
+        self.lock = Lock()
+        self.fetch_lock = Lock()
+
+    def observe(self,server,sent_at,received_at):
+        """
+        update the clock offset from the time a broker answer was sent
+
+        server (float|None): server time of the answer, seconds since epoch, ignored if None
+        sent_at (float): local time.time() the request was sent
+        received_at (float): local time.time() the response arrived
+        """
+        if server is None:
+            return
+        # Date headers have a resolution of a second, keep the median of recent samples
+        self.lock.acquire()
+        self.offsets.append(server + 0.5 - (sent_at + received_at)/2)
+        self.offsets = self.offsets[-15:]
+        self.offset = sorted(self.offsets)[len(self.offsets)//2]
+        self.lock.release()
+
+    def now(self):
+        """
+        return (datetime): estimated server time, naive UTC
+        """
+        return datetime.datetime.fromtimestamp(time() + self.offset,datetime.timezone.utc).replace(tzinfo = None)
+
+    def fetch(self,day):
+        """
+        request the hours of day from the server
+
+        return (tuple): (is_open,opens_at,closes_at) with naive UTC datetimes
+        """
+        sent_at = time()
+        info,server = self.trader.market_hours(self.market,day)
+        self.observe(server,sent_at,time())
+        if not info['is_open']:
+            return (False,None,None)
+        return (
+            True,
+            datetime.datetime.strptime(info['opens_at'],"%Y-%m-%dT%H:%M:%SZ"),
+            datetime.datetime.strptime(info['closes_at'],"%Y-%m-%dT%H:%M:%SZ")
+        )
+
+    def hours_of(self,day):
+        """
+        hours of the market on day, the day and the following days-1 days are fetched if not cached
+
+        day (date): the day
+        return (tuple): (is_open,opens_at,closes_at)
+        """
+        res = self.hours.get(day)
+        if res is not None:
+            return res
+        self.fetch_lock.acquire()
+        try:
+            hours = dict(self.hours)
+            for i in range(self.days):
+                d = day + datetime.timedelta(days = i)
+                if d not in hours:
+                    hours[d] = self.fetch(d)
+            self.hours = {d:h for d,h in hours.items() if d >= day - datetime.timedelta(days = 7)}
+        finally:
+            self.fetch_lock.release()
+        return self.hours[day]
+
+    def is_open(self,now = None):
+        """
+        check if the market is open
+
+        now (datetime|None): naive UTC time to check, estimated server time by default
+        """
+        if now is None:
+            now = self.now()
+        is_open,opens_at,closes_at = self.hours_of(now.date())
+        return is_open and opens_at <= now <= closes_at
+
+    def next_open(self,now = None):
+        """
+        return (datetime|None): next time the market opens within days days, naive UTC
+        """
+        if now is None:
+            now = self.now()
+        for i in range(self.days):
+            is_open,opens_at,closes_at = self.hours_of(now.date() + datetime.timedelta(days = i))
+            if is_open and opens_at > now:
+                return opens_at
+        return None
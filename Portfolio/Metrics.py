@@ -0,0 +1,335 @@
+import inspect
+import os
+from bisect import bisect_left
+from threading import Lock
+from time import perf_counter
+from .Broker import Broker
+
+
+class Histogram:
+    # upper bounds in sec, 10us to ~84s, doubling
+    BOUNDS = tuple(1e-5*2**i for i in range(24))
+
+    def __init__(self):
+        """
+        latency histogram with fixed log spaced buckets, O(1) memory whatever the number of samples
+        """
+        self.counts = [0]*(len(Histogram.BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self,seconds):
+        self.counts[bisect_left(Histogram.BOUNDS,seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self,q):
+        """
+        upper bound of the bucket holding the q-th percentile (capped by the largest sample)
+        """
+        if not self.count:
+            return 0.0
+        rank = q/100*self.count
+        seen = 0
+        for i,c in enumerate(self.counts):
+            seen += c
+            if c and seen >= rank:
+                return min(Histogram.BOUNDS[i],self.max) if i < len(Histogram.BOUNDS) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            "count" : self.count,
+            "mean" : self.sum/self.count if self.count else 0.0,
+            "p50" : self.percentile(50),
+            "p95" : self.percentile(95),
+            "p99" : self.percentile(99),
+            "max" : self.max
+        }
+
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def label_str(key):
+    return ','.join('{}={}'.format(k,v) for k,v in key)
+
+
+class Metrics:
+    PREFIX = 'robinhood_portfolio_'
+
+    def __init__(self):
+        """
+        latency histograms, counters and gauges, each keyed by a metric name and labels
+
+        histograms: broker_latency (endpoint), lock_wait (lock), confirm_wait and confirm_pass (portfolio)
+        counters: broker_errors (endpoint), broker_retries (endpoint), order_rechecks (portfolio)
+        gauges: queue_depth (portfolio), executor_queue_depth
+        """
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.lock = Lock()
+
+    def observe(self,metric,seconds,**labels):
+        key = (metric,label_key(labels))
+        self.lock.acquire()
+        hist = self.histograms.get(key)
+        if hist is None:
+            hist = self.histograms[key] = Histogram()
+        hist.observe(seconds)
+        self.lock.release()
+
+    def count(self,metric,n = 1,**labels):
+        key = (metric,label_key(labels))
+        self.lock.acquire()
+        self.counters[key] = self.counters.get(key,0) + n
+        self.lock.release()
+
+    def gauge(self,metric,fn,**labels):
+        """
+        fn (function): called to read the gauge when stats are taken
+        """
+        self.lock.acquire()
+        self.gauges[(metric,label_key(labels))] = fn
+        self.lock.release()
+
+    def stats(self):
+        """
+        return (dict): metric -> labels -> value, histograms are summarized with count, mean,
+            p50, p95, p99 and max in sec
+        """
+        self.lock.acquire()
+        hists = {key:hist.summary() for key,hist in self.histograms.items()}
+        counters = dict(self.counters)
+        gauges = dict(self.gauges)
+        self.lock.release()
+        res = {}
+        for (metric,labels),v in hists.items():
+            res.setdefault(metric,{})[label_str(labels)] = v
+        for (metric,labels),v in counters.items():
+            res.setdefault(metric,{})[label_str(labels)] = v
+        for (metric,labels),fn in gauges.items():
+            res.setdefault(metric,{})[label_str(labels)] = fn()
+        return res
+
+    def prometheus(self):
+        """
+        return (str): every metric in the prometheus text exposition format
+        """
+        def fmt(labels,extra = ()):
+            items = list(labels) + list(extra)
+            if not len(items):
+                return ''
+            return '{' + ','.join('{}="{}"'.format(k,v) for k,v in items) + '}'
+        self.lock.acquire()
+        hists = {key:(list(h.counts),h.count,h.sum) for key,h in self.histograms.items()}
+        counters = dict(self.counters)
+        gauges = dict(self.gauges)
+        self.lock.release()
+        lines = []
+        typed = set()
+        for (metric,labels),(counts,count,total) in sorted(hists.items()):
+            name = self.PREFIX + metric + '_seconds'
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE {} histogram'.format(name))
+            seen = 0
+            for bound,c in zip(Histogram.BOUNDS,counts):
+                seen += c
+                lines.append('{}_bucket{} {}'.format(name,fmt(labels,[('le',repr(bound))]),seen))
+            lines.append('{}_bucket{} {}'.format(name,fmt(labels,[('le','+Inf')]),count))
+            lines.append('{}_sum{} {}'.format(name,fmt(labels),repr(total)))
+            lines.append('{}_count{} {}'.format(name,fmt(labels),count))
+        for (metric,labels),v in sorted(counters.items()):
+            name = self.PREFIX + metric + '_total'
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE {} counter'.format(name))
+            lines.append('{}{} {}'.format(name,fmt(labels),v))
+        for (metric,labels),fn in sorted(gauges.items(),key = lambda kv:kv[0]):
+            name = self.PREFIX + metric
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE {} gauge'.format(name))
+            lines.append('{}{} {}'.format(name,fmt(labels),fn()))
+        return '\n'.join(lines) + '\n'
+
+    def dump(self,path):
+        """
+        write the prometheus text to path, atomically so a scraper never reads half a file
+        """
+        tmp = '{}.tmp'.format(path)
+        with open(tmp,'w') as f:
+            f.write(self.prometheus())
+        os.replace(tmp,path)
+
+
+class TimedLock:
+    def __init__(self,metrics,name):
+        """
+        Lock recording how long acquire waited, as lock_wait{lock=name}
+
+        metrics (Metrics): where waits are recorded
+        name (str): label of the lock
+        """
+        self.lock = Lock()
+        self.metrics = metrics
+        self.name = name
+
+    def acquire(self,blocking = True,timeout = -1):
+        t0 = perf_counter()
+        res = self.lock.acquire(blocking,timeout)
+        self.metrics.observe('lock_wait',perf_counter() - t0,lock = self.name)
+        return res
+
+    def release(self):
+        self.lock.release()
+
+    def locked(self):
+        return self.lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self,*exc):
+        self.release()
+
+
+class InstrumentedOrder:
+    def __init__(self,order,broker):
+        """
+        order whose check and cancel calls are timed by an InstrumentedBroker
+        """
+        self.inner = order
+        self.broker = broker
+
+    @property
+    def order(self):
+        return self.inner.order
+
+    def check(self):
+        return self.broker.timed('check',self.inner.check)
+
+    def cancel(self):
+        return self.broker.timed('cancel',self.inner.cancel)
+
+    def __getattr__(self,name):
+        if name == 'inner':
+            raise AttributeError(name)
+        return self.broker.wrap(name,getattr(self.inner,name))
+
+
+def unwrap(arg):
+    if isinstance(arg,InstrumentedOrder):
+        return arg.inner
+    if isinstance(arg,list):
+        return [unwrap(a) for a in arg]
+    return arg
+
+
+class InstrumentedBroker(Broker):
+    def __init__(self,broker,metrics):
+        """
+        Broker recording the latency and the errors of every call made through it into metrics,
+        as broker_latency{endpoint} and broker_errors{endpoint}, orders it places are timed as well
+
+        broker (Broker): the broker doing the work
+        metrics (Metrics): where calls are recorded
+        """
+        self.broker = broker
+        self.metrics = metrics
+
+    def __eq__(self,oth):
+        return isinstance(oth,InstrumentedBroker) and oth.broker == self.broker
+
+    def __hash__(self):
+        return hash(self.broker)
+
+    def timed(self,endpoint,fn,*args,**kwargs):
+        t0 = perf_counter()
+        try:
+            res = fn(*unwrap(list(args)),**kwargs)
+        except:
+            self.metrics.count('broker_errors',endpoint = endpoint)
+            raise
+        finally:
+            self.metrics.observe('broker_latency',perf_counter() - t0,endpoint = endpoint)
+        if hasattr(res,'check'):
+            return InstrumentedOrder(res,self)
+        return res
+
+    async def async_timed(self,endpoint,fn,*args,**kwargs):
+        t0 = perf_counter()
+        try:
+            res = await fn(*unwrap(list(args)),**kwargs)
+        except:
+            self.metrics.count('broker_errors',endpoint = endpoint)
+            raise
+        finally:
+            self.metrics.observe('broker_latency',perf_counter() - t0,endpoint = endpoint)
+        if hasattr(res,'check'):
+            return InstrumentedOrder(res,self)
+        return res
+
+    def wrap(self,name,fn):
+        """
+        time fn as endpoint name, async_ variants are recorded under the name of their blocking twin
+        """
+        if not callable(fn):
+            return fn
+        if inspect.iscoroutinefunction(fn):
+            endpoint = name[len('async_'):] if name.startswith('async_') else name
+            return lambda *args,**kwargs:self.async_timed(endpoint,fn,*args,**kwargs)
+        return lambda *args,**kwargs:self.timed(name,fn,*args,**kwargs)
+
+    def __getattr__(self,name):
+        if name in ('broker','metrics'):
+            raise AttributeError(name)
+        return self.wrap(name,getattr(self.broker,name))
+
+    def get_account(self):
+        return self.timed('get_account',self.broker.get_account)
+
+    def securities_owned(self):
+        return self.timed('securities_owned',self.broker.securities_owned)
+
+    def instruments(self,scode):
+        return self.timed('instruments',self.broker.instruments,scode)
+
+    def instrument_symbol(self,instrument):
+        return self.timed('instrument_symbol',self.broker.instrument_symbol,instrument)
+
+    def last_trade_price(self,scodes):
+        return self.timed('last_trade_price',self.broker.last_trade_price,scodes)
+
+    def market_hours(self,market,day):
+        return self.timed('market_hours',self.broker.market_hours,market,day)
+
+    def place_market_buy_order(self,*args,**kwargs):
+        return self.timed('place_market_buy_order',self.broker.place_market_buy_order,*args,**kwargs)
+
+    def place_market_sell_order(self,*args,**kwargs):
+        return self.timed('place_market_sell_order',self.broker.place_market_sell_order,*args,**kwargs)
+
+    def place_limit_buy_order(self,*args,**kwargs):
+        return self.timed('place_limit_buy_order',self.broker.place_limit_buy_order,*args,**kwargs)
+
+    def place_limit_sell_order(self,*args,**kwargs):
+        return self.timed('place_limit_sell_order',self.broker.place_limit_sell_order,*args,**kwargs)
+
+    def place_stop_loss_buy_order(self,*args,**kwargs):
+        return self.timed('place_stop_loss_buy_order',self.broker.place_stop_loss_buy_order,*args,**kwargs)
+
+    def place_stop_loss_sell_order(self,*args,**kwargs):
+        return self.timed('place_stop_loss_sell_order',self.broker.place_stop_loss_sell_order,*args,**kwargs)
+
+    def place_stop_limit_buy_order(self,*args,**kwargs):
+        return self.timed('place_stop_limit_buy_order',self.broker.place_stop_limit_buy_order,*args,**kwargs)
+
+    def place_stop_limit_sell_order(self,*args,**kwargs):
+        return self.timed('place_stop_limit_sell_order',self.broker.place_stop_limit_sell_order,*args,**kwargs)
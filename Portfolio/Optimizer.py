@@ -0,0 +1,157 @@
+import numpy as np
+from scipy.optimize import minimize
+
+
+class Optimizer:
+    def __init__(self,returns,scodes = None,shrinkage = 'ledoit_wolf',periods = 252):
+        """
+        portfolio weights from a history of returns
+
+        mean and covariance are estimated once, vectorized. with shrinkage the sample covariance is
+        pulled towards a scaled identity, which keeps it well conditioned when there are about as many
+        assets as observations. every problem is solved with L-BFGS-B and analytic gradients, as a bound
+        constrained problem whose solution is scaled to weights adding up to 1. it stops once the
+        weights are good to about 1e-6, 1000 assets take a few tenths of a second
+        (benchmarks/bench_optimizer.py).
+
+        returns (np.array|pd.DataFrame): one row per period, one column per asset
+        scodes (list|None): symbol of each column, taken from the DataFrame columns by default
+        shrinkage (str|float|None): 'ledoit_wolf', a fixed intensity in [0,1], or None for the sample covariance
+        periods (int): periods in a year, mean and covariance are annualized with it
+        """
+        if scodes is None and hasattr(returns,'columns'):
+            scodes = list(returns.columns)
+        X = np.asarray(returns,dtype = np.float64)
+        assert X.ndim == 2 and len(X) > 1
+        if scodes is None:
+            scodes = list(range(X.shape[1]))
+        assert len(scodes) == X.shape[1]
+        X = X[np.isfinite(X).all(axis = 1)]
+        self.scodes = list(scodes)
+        self.periods = periods
+        self.mean = X.mean(axis = 0)*periods
+        self.shrink,cov = Optimizer.covariance(X,shrinkage)
+        self.cov = cov*periods
+
+    @classmethod
+    def from_prices(cls,prices,**kw):
+        """
+        optimizer on the simple returns of a price history (rows are periods, columns are assets)
+        """
+        P = np.asarray(prices,dtype = np.float64)
+        if hasattr(prices,'columns'):
+            kw.setdefault('scodes',list(prices.columns))
+        return cls(P[1:]/P[:-1] - 1,**kw)
+
+    @staticmethod
+    def covariance(X,shrinkage = 'ledoit_wolf'):
+        """
+        covariance of the columns of X
+
+        return (float,np.array): shrinkage intensity used and covariance matrix
+        """
+        T,N = X.shape
+        Xc = X - X.mean(axis = 0)
+        S = Xc.T@Xc/T
+        if shrinkage is None:
+            return 0.0,S
+        mu = np.trace(S)/N
+        if shrinkage == 'ledoit_wolf':
+            # Ledoit & Wolf (2004), shrinking towards mu*I
+            d2 = ((S - mu*np.eye(N))**2).sum()
+            b2 = ((Xc**2).sum(axis = 1)**2).sum()/T**2 - (S**2).sum()/T
+            shrink = float(min(max(b2,0),d2)/d2) if d2 > 0 else 1.0
+        else:
+            shrink = float(shrinkage)
+            assert 0 <= shrink <= 1
+        cov = (1 - shrink)*S
+        cov[np.diag_indices(N)] += shrink*mu
+        return shrink,cov
+
+    def solve(self,f,y0,lower = 0.0):
+        res = minimize(
+            f,y0,jac = True,method = 'L-BFGS-B',
+            bounds = [(lower,None)]*len(y0),
+            options = {'maxiter' : 10000,'ftol' : 1e-10,'gtol' : 1e-8}
+        )
+        y = np.maximum(res.x,0)
+        if not y.sum() > 0:
+            raise ValueError("no long only portfolio found ({})".format(res.message))
+        return y/y.sum()
+
+    def result(self,w,cutoff):
+        w = Optimizer.normalize(np.where(np.abs(w) < cutoff,0,w))
+        return {scode:float(x) for scode,x in zip(self.scodes,w)}
+
+    def min_variance(self,long_only = True,cutoff = 1e-6):
+        """
+        weights of the portfolio with the lowest variance
+
+        long only it is min y'Cy - 2*sum(y) over y >= 0, scaled to weights, otherwise C^-1 1 scaled
+
+        cutoff (float): weights smaller than cutoff are set to 0
+        return (dict): symbol -> weight, e.g. for Portfolio.rebalance_to
+        """
+        C = self.cov
+        ones = np.ones(len(C))
+        if not long_only:
+            return self.result(Optimizer.normalize(np.linalg.solve(C,ones)),cutoff)
+        def f(y):
+            Cy = C@y
+            return y@Cy - 2*y.sum(),2*Cy - 2
+        return self.result(self.solve(f,ones/np.trace(C)),cutoff)
+
+    def max_sharpe(self,rf = 0.0,long_only = True,cutoff = 1e-6):
+        """
+        weights of the portfolio with the highest sharpe ratio (tangency portfolio)
+
+        long only it is min y'Cy/2 - (mean - rf)'y over y >= 0, scaled to weights, otherwise C^-1 (mean - rf) scaled
+
+        rf (float): annual risk free rate
+        cutoff (float): weights smaller than cutoff are set to 0
+        return (dict): symbol -> weight
+        """
+        C = self.cov
+        excess = self.mean - rf
+        if not long_only:
+            return self.result(Optimizer.normalize(np.linalg.solve(C,excess)),cutoff)
+        if not (excess > 0).any():
+            raise ValueError("no asset returns more than the risk free rate")
+        def f(y):
+            Cy = C@y
+            return y@Cy/2 - excess@y,Cy - excess
+        return self.result(self.solve(f,np.maximum(excess,0)/np.trace(C)),cutoff)
+
+    def risk_parity(self,budget = None,cutoff = 0.0):
+        """
+        weights with which every asset contributes its budget to the risk of the portfolio
+
+        solved as min y'Cy/2 - budget'log(y) over y > 0 (Spinu 2013), scaled to weights
+
+        budget (np.array|None): risk budget of each asset, equal by default
+        return (dict): symbol -> weight
+        """
+        C = self.cov
+        n = len(C)
+        b = np.full(n,1.0/n) if budget is None else Optimizer.normalize(np.asarray(budget,dtype = np.float64))
+        def f(y):
+            Cy = C@y
+            return y@Cy/2 - b@np.log(y),Cy - b/y
+        return self.result(self.solve(f,1/np.sqrt(np.diag(C)*n),lower = 1e-12),cutoff)
+
+    def risk(self,weights):
+        """
+        annual volatility, expected return and sharpe ratio of weights (dict or array)
+
+        return (dict)
+        """
+        if isinstance(weights,dict):
+            weights = [weights.get(scode,0) for scode in self.scodes]
+        w = np.asarray(weights,dtype = np.float64)
+        vol = float(np.sqrt(w@self.cov@w))
+        ret = float(self.mean@w)
+        return {'volatility' : vol,'return' : ret,'sharpe' : ret/vol if vol > 0 else np.nan}
+
+    @staticmethod
+    def normalize(w):
+        return w/w.sum()
@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from threading import BoundedSemaphore
+from threading import Lock
+
+
+class OrderExecutor:
+    def __init__(
+        self,
+        workers = 8,
+        max_pending = 256
+    ):
+        """
+        bounded pool that submits orders to the broker, shared by every portfolio of a manager
+
+        workers (int): number of orders being placed at the same time
+        max_pending (int): submitted but unfinished jobs allowed before submit blocks the caller
+        """
+        workers = int(workers)
+        max_pending = int(max_pending)
+        assert workers > 0
+        assert max_pending >= workers
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pool = ThreadPoolExecutor(max_workers = workers,thread_name_prefix = 'order')
+        self.slots = BoundedSemaphore(max_pending)
+        self.pending = set()
+        self.pending_lock = Lock()
+
+    def submit(self,fn,*args,**kwargs):
+        """
+        run fn(*args,**kwargs) on the pool, blocks while max_pending jobs are unfinished
+
+        return (Future): resolves to the return value of fn
+        """
+        self.slots.acquire()
+        try:
+            future = self.pool.submit(fn,*args,**kwargs)
+        except:
+            self.slots.release()
+            raise
+        self.pending_lock.acquire()
+        self.pending.add(future)
+        self.pending_lock.release()
+        future.add_done_callback(self.done)
+        return future
+
+    def done(self,future):
+        self.pending_lock.acquire()
+        self.pending.discard(future)
+        self.pending_lock.release()
+        self.slots.release()
+
+    def queue_depth(self):
+        """
+        number of submitted jobs that havent finished yet
+        """
+        return len(self.pending)
+
+    def join(self,futures = None,timeout = None):
+        """
+        wait until futures (default: every pending job) are finished
+        """
+        if futures is None:
+            self.pending_lock.acquire()
+            futures = list(self.pending)
+            self.pending_lock.release()
+        return wait(futures,timeout = timeout)
+
+    def shutdown(self,wait = True):
+        self.pool.shutdown(wait = wait)
@@ -0,0 +1,205 @@
+import heapq
+from itertools import count
+from threading import Condition
+from time import time
+
+
+class PendingOrder:
+    """
+    an order waiting to be confirmed
+    """
+    __slots__ = ('scode','order','oid','cc','placed_at','next_check','market','seq','queued','booked','filled','recovered','cancelled')
+
+    def __init__(self,scode,order,oid,market,placed_at):
+        self.scode = scode
+        self.order = order
+        self.oid = oid
+        self.cc = 0
+        self.placed_at = placed_at
+        self.next_check = placed_at
+        self.market = market
+        self.seq = 0
+        self.queued = True
+        # executions already booked, and the quantity they add up to
+        self.booked = set()
+        self.filled = 0.0
+        # shares booked before a restart, their executions are skipped when seen again
+        self.recovered = 0.0
+        # a cancel was sent, the order stays until the broker reports it done
+        self.cancelled = False
+
+
+def order_id(order):
+    """
+    id of an order returned by the trader, falls back to the object identity
+    """
+    d = getattr(order,'order',None)
+    if isinstance(d,dict) and 'id' in d:
+        return d['id']
+    return id(order)
+
+
+class OrderQueue:
+    def __init__(
+        self,
+        market_delay = 1,
+        base_delay = 5,
+        max_delay = 300
+    ):
+        """
+        pending orders of a portfolio, ordered by the time they should be checked next
+
+        market orders are checked every market_delay seconds, other orders start at base_delay and
+        back off exponentially up to max_delay while they stay unfilled.
+        orders can be looked up by id and by symbol without scanning the queue.
+
+        market_delay (float): seconds between two checks of a market order
+        base_delay (float): seconds before the first re-check of a non market order
+        max_delay (float): longest pause between two checks
+        """
+        assert 0 < market_delay
+        assert 0 < base_delay <= max_delay
+        self.market_delay = market_delay
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.heap = []
+        self.by_id = {}
+        self.by_scode = {}
+        self.seq = count()
+        self.cv = Condition()
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def push(self,scode,order,market = False,placed_at = None):
+        """
+        add a freshly placed order, its first check is due after market_delay or base_delay
+
+        return (PendingOrder)
+        """
+        if placed_at is None:
+            placed_at = time()
+        entry = PendingOrder(scode,order,order_id(order),market,placed_at)
+        entry.next_check = placed_at + (self.market_delay if market else self.base_delay)
+        self.cv.acquire()
+        self.by_id[entry.oid] = entry
+        self.by_scode.setdefault(scode,{})[entry.oid] = entry
+        self.schedule(entry)
+        self.cv.notify_all()
+        self.cv.release()
+        return entry
+
+    def schedule(self,entry):
+        entry.seq = next(self.seq)
+        entry.queued = True
+        heapq.heappush(self.heap,(entry.next_check,0 if entry.market else 1,entry.seq,entry))
+
+    def pop_due(self,now = None):
+        """
+        take every order whose check is due, they stay findable by id/symbol until removed
+
+        return (list): PendingOrder, market orders first among equal times
+        """
+        if now is None:
+            now = time()
+        res = []
+        self.cv.acquire()
+        while len(self.heap) and self.heap[0][0] <= now:
+            _,_,seq,entry = heapq.heappop(self.heap)
+            if entry.seq != seq or entry.oid not in self.by_id:
+                continue
+            entry.queued = False
+            res.append(entry)
+        self.cv.release()
+        return res
+
+    def reschedule(self,entry,now = None):
+        """
+        put an unfilled order back, its next check is pushed back exponentially unless it is a market order
+        """
+        if now is None:
+            now = time()
+        self.cv.acquire()
+        if entry.oid in self.by_id:
+            entry.cc += 1
+            if entry.market:
+                delay = self.market_delay
+            else:
+                delay = min(self.base_delay*2**min(entry.cc-1,32),self.max_delay)
+            entry.next_check = now + delay
+            self.schedule(entry)
+        self.cv.release()
+
+    def make_all_due(self,now = None):
+        """
+        make every queued order due now, without counting a check against it
+        """
+        if now is None:
+            now = time()
+        self.cv.acquire()
+        for entry in self.by_id.values():
+            if entry.queued:
+                entry.next_check = now
+                self.schedule(entry)
+        self.cv.notify_all()
+        self.cv.release()
+
+    def remove(self,entry):
+        """
+        drop an order that is done, returns False if it was already gone
+        """
+        self.cv.acquire()
+        res = self.by_id.pop(entry.oid,None) is not None
+        if res:
+            orders = self.by_scode[entry.scode]
+            orders.pop(entry.oid)
+            if not len(orders):
+                del self.by_scode[entry.scode]
+        self.cv.release()
+        return res
+
+    def get(self,oid):
+        return self.by_id.get(oid)
+
+    def pending(self):
+        """
+        return (list): every order in the queue
+        """
+        self.cv.acquire()
+        res = list(self.by_id.values())
+        self.cv.release()
+        return res
+
+    def by_symbol(self,scode):
+        """
+        pending orders of a symbol
+        """
+        self.cv.acquire()
+        res = list(self.by_scode.get(scode,{}).values())
+        self.cv.release()
+        return res
+
+    def next_due(self):
+        """
+        return (float|None): time.time() the earliest check is due
+        """
+        self.cv.acquire()
+        res = self.heap[0][0] if len(self.heap) else None
+        self.cv.release()
+        return res
+
+    def wait_due(self,timeout):
+        """
+        sleep until the earliest check is due, a new order arrives or timeout seconds passed
+        """
+        self.cv.acquire()
+        if len(self.heap):
+            timeout = min(timeout,max(self.heap[0][0] - time(),0))
+        if timeout > 0:
+            self.cv.wait(timeout)
+        self.cv.release()
+
+    def wake(self):
+        self.cv.acquire()
+        self.cv.notify_all()
+        self.cv.release()
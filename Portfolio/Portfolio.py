@@ -1,17 +1,37 @@
-import quandl
 import datetime
-import json
+import traceback
 import numpy as np
 import pandas as pd
 import os
-from time import sleep
-from scipy.optimize import minimize
-from Robinhood import Order
-from Robinhood import WatchList
-from Robinhood import Robinhood
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from time import time
 from threading import Thread
 from threading import Lock
+from .Broker import as_broker
+from .EventLog import EventLog
+from .Journal import Journal
+from .MarketCalendar import MarketCalendar
+from .Metrics import InstrumentedBroker
+from .Metrics import TimedLock
+from .OrderExecutor import OrderExecutor
+from .OrderQueue import OrderQueue
+from .PositionBook import LockStripes
+from .PositionBook import PositionBook
+from .QuoteCache import QuoteCache
+from .Snapshot import Snapshot
 from .SIconverter import SIconverter
+from .TradeLedger import TradeLedger
+
+
+def now_us():
+    """
+    now, in microseconds since epoch, as stored in journal records
+    """
+    return int(np.datetime64(datetime.datetime.now(),'us').astype(np.int64))
+
+def from_us(when):
+    return np.datetime64(int(when),'us')
 
 
 class Portfolio:
@@ -22,97 +42,427 @@ class Portfolio:
         iniFund = None,
         load_from = None,
         cancel_count = np.inf,
-        converter = None
+        converter = None,
+        executor = None,
+        quotes = None,
+        calendar = None,
+        metrics = None,
+        journal_dir = None,
+        snapshot_every = 10000,
+        log_capacity = 10000
     ):
         """
         create portfolio or load from save
-        trader (Robinhood): robinhood account trader
+        trader (Broker): broker of the account, a Robinhood trader is wrapped into a RobinhoodBroker
         name (str): name of this portfolio
         iniFund (float|None): initial buying power for this portfolio
         load_from (str|None): address to save information
+        converter (SIconverter|None): symbol/instrument converter, usually shared by the manager
+        executor (OrderExecutor|None): pool placing the orders, usually shared by the manager
+        quotes (QuoteCache|None): last trade price cache, usually shared by the manager
+        calendar (MarketCalendar|None): market hours, usually shared by the manager
+        metrics (Metrics|None): records broker call latencies, lock waits and queue depth when given
+        journal_dir (str|None): directory to journal every fill, transfer, buying power change and
+            order into as it happens, the state found there (snapshot and journal) is recovered first
+        snapshot_every (int): journal records after which a compacted snapshot is written
+        log_capacity (int): log events kept in memory, see EventLog
         """
         assert trader is not None
         assert name is not None
+        self.name = name
+        self.trader = as_broker(trader)
+        self.metrics = metrics
+        if metrics is not None and not isinstance(self.trader,InstrumentedBroker):
+            self.trader = InstrumentedBroker(self.trader,metrics)
         if converter is None:
             self.converter = SIconverter(trader = self.trader)
         else:
             self.converter = converter
-        self.name = name
-        self.trader = trader
+        if executor is None:
+            self.executor = OrderExecutor()
+        else:
+            self.executor = executor
+        if quotes is None:
+            self.quotes = QuoteCache(trader = self.trader)
+        else:
+            self.quotes = quotes
+        if calendar is None:
+            self.calendar = MarketCalendar(trader = self.trader)
+        else:
+            self.calendar = calendar
+        self.orders_in_flight = set()
+        self.orders_in_flight_lock = self.new_lock('orders_in_flight')
         self.bp = iniFund
         self.confirm_signal = True
-        self.threads = []
-        if iniFund == None or iniFund >= float(trader.get_account()['margin_balances']['unallocated_margin_cash'])*0.7:
-            self.bp = float(trader.get_account()['margin_balances']['unallocated_margin_cash'])*0.7
+        # the running confirm loop, a portfolio has at most one, a restarted loop reuses it if it is still alive
+        self.confirm_loop = None
+        self.confirm_lock = self.new_lock('confirm')
+        if iniFund == None or iniFund >= float(self.trader.get_account()['margin_balances']['unallocated_margin_cash'])*0.7:
+            self.bp = float(self.trader.get_account()['margin_balances']['unallocated_margin_cash'])*0.7
             
             
-        self.trading_record = pd.DataFrame(columns = ["SIDE","SCODE","PRICE","AMOUNT","ORDER_TYPE"])
-        self.trading_record_lock = Lock()
+        self.trading_record = TradeLedger()
         
-        self.portfolio_record = pd.DataFrame(columns = ['AVG_COST','SHARES'])
-        self.portfolio_record_lock = Lock()
+        self.portfolio_record = PositionBook()
+        self.symbol_locks = LockStripes(factory = lambda:self.new_lock('symbol'))
+        # guards bp and the journaled changes of trading_record and portfolio_record. it is held only
+        # to apply one record and buffer it, so the journal replays in the order the changes were made
+        # and a checkpoint captures one instant; symbol_locks keep guarding the check-then-act
+        # sequences (which span broker calls) per symbol
+        self.state_lock = self.new_lock('state')
         
-        self.queue = []
-        self.queue_lock = Lock()
+        self.queue = OrderQueue()
+        if metrics is not None:
+            metrics.gauge('queue_depth',self.queue.__len__,portfolio = name)
+        self.fill_latency = deque(maxlen = 1000)
         
         self.time_zone = str(datetime.datetime.now(datetime.timezone.utc).astimezone().tzinfo)
         
-        self.log = []
-        self.log_lock = Lock()
+        self.log = EventLog(capacity = log_capacity,lock = self.new_lock('log'))
 
-        self.threads = []
-        
         self.cancel_count = cancel_count
+        self.journal = None
+        self.journal_dir = None
+        self.snapshot_seq = 0
+        self.snapshot_every = int(snapshot_every)
+        self.snapshot_lock = Lock()
+        self.recovered_orders = {}
         if load_from is not None:
             self.load(savdir = load_from)
+        if journal_dir is not None:
+            self.open_journal(journal_dir)
+        if len(self.recovered_orders):
+            self.reattach_orders()
+
 
+    def new_lock(self,name):
+        """
+        a Lock, timed as lock_wait{lock=name} when metrics are recorded
+        """
+        if self.metrics is None:
+            return Lock()
+        return TimedLock(self.metrics,'{}.{}'.format(self.name,name))
+
+    def stats(self):
+        """
+        broker call latencies and errors, lock waits, queue depths and confirm loop timings,
+        empty unless the portfolio was created with metrics
+        """
+        if self.metrics is None:
+            return {}
+        return self.metrics.stats()
 
     def add_trading_record(self,*record):
         """
         add a trading record
         """
         assert len(record) == 5
-        self.trading_record_lock.acquire()
-        self.trading_record.loc[Portfolio.get_time()] = record
-        self.trading_record_lock.release()
+        side,scode,price,amount,order_type = record
+        try:
+            price = float(price)
+        except (TypeError,ValueError):
+            price = np.nan
+        self.commit('ledger',str(side),str(scode),price,float(amount),str(order_type),now_us())
+
+    def add_shares(self,scode,amount,price = None):
+        """
+        add (amount > 0) or take away (amount < 0) shares without trading,
+        price (the cost of added shares) is averaged into the cost of the position
+        """
+        self.commit('book',scode,float(amount),np.nan if price is None else float(price))
+
+    def commit(self,kind,*fields):
+        """
+        apply a change of state and journal it, under state_lock for as long as it takes to apply the
+        record and put it into the journal buffer (no i/o, no broker call)
+
+        kind (str): one of Journal.KINDS
+        fields: fields of the record
+        """
+        self.state_lock.acquire()
+        try:
+            self.record(kind,*fields)
+        finally:
+            self.state_lock.release()
+
+    def record(self,kind,*fields):
+        """
+        commit without locking, caller holds self.state_lock
+        """
+        self.apply(kind,fields)
+        if self.journal is not None:
+            self.journal.write(kind,*fields)
+
+    def apply(self,kind,fields):
+        """
+        change the state as described by a journal record
+        """
+        if kind == 'fill':
+            oid,side,scode,price,amount,order_type,when = fields
+            self.trading_record.append(side,scode,price,abs(amount),order_type,when = from_us(when))
+            self.bp -= price*amount
+            self.portfolio_record.add(scode,amount,price)
+        elif kind == 'ledger':
+            side,scode,price,amount,order_type,when = fields
+            self.trading_record.append(side,scode,price,amount,order_type,when = from_us(when))
+        elif kind == 'bp':
+            self.bp += fields[0]
+        elif kind == 'bp_set':
+            self.bp = fields[0]
+        elif kind == 'book':
+            scode,amount,price = fields
+            self.portfolio_record.add(scode,amount,None if np.isnan(price) else price)
+        else:
+            raise ValueError(kind)
+
+    def enqueue(self,scode,order,market = False):
+        """
+        put a freshly placed order into the queue, and into the journal
+        """
+        self.state_lock.acquire()
+        entry = self.queue.push(scode,order,market = market)
+        if self.journal is not None:
+            self.journal.write('order',str(entry.oid),scode,int(market))
+        self.state_lock.release()
+        return entry
+
+    def close_orders(self,entries):
+        """
+        journal that orders left the queue, filled or cancelled
+        """
+        if self.journal is None:
+            return
+        self.state_lock.acquire()
+        for entry in entries:
+            self.journal.write('done',str(entry.oid))
+        self.state_lock.release()
+
+    def open_journal(self,fdir):
+        """
+        recover the state saved in fdir, then journal every change of state into it
+
+        fdir (str): directory of the journal and of its snapshots
+        """
+        if not os.path.exists(fdir):
+            os.makedirs(fdir)
+        if os.path.exists(os.path.join(fdir,'CURRENT')):
+            self.recover(fdir)
+        self.journal = Journal(os.path.join(fdir,'journal.bin'),base_seq = self.snapshot_seq)
+        self.journal_dir = fdir
+        self.log.open(os.path.join(fdir,'portfolio.log'))
+        if not os.path.exists(os.path.join(fdir,'CURRENT')):
+            self.snapshot()
+
+    def recover(self,fdir):
+        """
+        load the current snapshot of fdir and replay the journal records written after it
+        """
+        with open(os.path.join(fdir,'CURRENT')) as f:
+            snap = self.read_snapshot(os.path.join(fdir,f.read().strip()))
+        self.snapshot_seq = snap.meta['seq']
+        replayed = 0
+        for seq,kind,fields in Journal.read(os.path.join(fdir,'journal.bin'),after = self.snapshot_seq):
+            if kind == 'order':
+                # [symbol, market, shares booked so far]
+                self.recovered_orders.setdefault(fields[0],[fields[1],fields[2],0.0])
+            elif kind == 'done':
+                self.recovered_orders.pop(fields[0],None)
+            else:
+                if kind == 'fill' and fields[0] in self.recovered_orders:
+                    self.recovered_orders[fields[0]][2] += abs(fields[4])
+                self.apply(kind,fields)
+            replayed += 1
+        self.log.info(
+            "recovered from snapshot {} and {} journal records, {} orders were still open",
+            self.snapshot_seq,replayed,len(self.recovered_orders)
+        )
+
+    def read_snapshot(self,path):
+        """
+        replace the state by the one stored in a snapshot file
+
+        return (Snapshot)
+        """
+        snap = Snapshot.read(path)
+        self.trading_record = snap.ledger
+        self.portfolio_record = snap.book
+        self.bp = float(snap.meta['bp'])
+        self.recovered_orders = {
+            # saves of older versions only kept the symbol
+            oid:[order,1,0.0] if isinstance(order,str) else list(order)
+            for oid,order in snap.meta.get('orders',{}).items()
+        }
+        return snap
+
+    def reattach_orders(self):
+        """
+        put the orders that were still open when the state was saved back into the queue, found by id
+        through the broker, the shares they had filled then are not booked again.
+        an order the broker does not know is dropped, one that can not be asked for now stays recovered
+        and is tried again by the next restart
+        """
+        recovered,self.recovered_orders = self.recovered_orders,{}
+        reattached = 0
+        for oid,(scode,market,filled) in recovered.items():
+            if oid in self.queue.by_id:
+                continue
+            try:
+                order = self.trader.get_order(oid)
+            except Exception as e:
+                self.log.error("fail to look order {} up: {!r}",oid,e,scode = scode)
+                self.recovered_orders[oid] = [scode,market,filled]
+                continue
+            if order is None:
+                self.log.error("order {} is not known by the broker, dropped",oid,scode = scode)
+                if self.journal is not None:
+                    self.state_lock.acquire()
+                    self.journal.write('done',oid)
+                    self.state_lock.release()
+                continue
+            entry = self.enqueue(scode,order,market = bool(market))
+            entry.filled = entry.recovered = float(filled)
+            reattached += 1
+        if reattached:
+            self.log.info("{} open orders reattached",reattached)
+
+    def capture(self):
+        """
+        frozen copy of the state, caller holds self.state_lock
+
+        return (TradeLedger,PositionBook,dict): trading record, positions and the rest of the state
+        """
+        trading = TradeLedger.from_columns(self.trading_record.columns())
+        snap = self.portfolio_record.snapshot()
+        portfolio = PositionBook.from_arrays(snap.scodes,snap.avg_cost,snap.shares)
+        orders = {oid:list(order) for oid,order in self.recovered_orders.items()}
+        orders.update((str(entry.oid),[entry.scode,int(entry.market),entry.filled]) for entry in self.queue.pending())
+        meta = {
+            'name' : self.name,
+            'bp' : self.bp,
+            'seq' : self.journal.seq if self.journal is not None else 0,
+            'orders' : orders
+        }
+        return trading,portfolio,meta
+
+    def snapshot(self):
+        """
+        write a compacted snapshot of the state into the journal directory and drop the
+        journal records it covers
+        """
+        assert self.journal is not None
+        self.snapshot_lock.acquire()
+        try:
+            self.state_lock.acquire()
+            trading,portfolio,meta = self.capture()
+            self.state_lock.release()
+            seq = meta['seq']
+            name = 'snapshot-{:012d}.snap'.format(seq)
+            Snapshot.write(os.path.join(self.journal_dir,name),trading,portfolio,**meta)
+            current = os.path.join(self.journal_dir,'CURRENT')
+            with open(current+'.tmp','w') as f:
+                f.write(name)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(current+'.tmp',current)
+            self.journal.truncate(seq)
+            self.snapshot_seq = seq
+            for f in os.listdir(self.journal_dir):
+                if f.startswith('snapshot-') and f != name:
+                    os.remove(os.path.join(self.journal_dir,f))
+        finally:
+            self.snapshot_lock.release()
+
+    def maybe_snapshot(self):
+        """
+        compact the journal once snapshot_every records were written since the last snapshot
+        """
+        if self.snapshot_due():
+            self.snapshot()
+
+    def snapshot_due(self):
+        return self.journal is not None and self.journal.seq - self.snapshot_seq >= self.snapshot_every
+
+    def submit(self,worker):
+        """
+        place an order through the order executor, blocks if the executor is full
+
+        worker (function): places the order and puts it into the queue
+        return (Future): resolves to the placed order, or None if it wasnt placed
+        """
+        future = self.executor.submit(worker)
+        self.orders_in_flight_lock.acquire()
+        self.orders_in_flight.add(future)
+        self.orders_in_flight_lock.release()
+        future.add_done_callback(self.order_placed)
+        return future
+
+    def order_placed(self,future):
+        self.orders_in_flight_lock.acquire()
+        self.orders_in_flight.discard(future)
+        self.orders_in_flight_lock.release()
+
+    def wait_orders_placed(self,timeout = None):
+        """
+        wait until every order submitted by this portfolio has been placed
+        """
+        self.orders_in_flight_lock.acquire()
+        futures = list(self.orders_in_flight)
+        self.orders_in_flight_lock.release()
+        return self.executor.join(futures,timeout = timeout)
 
     def get_last_price(self):
         """
-        get last trading price for any asset in this portfolio
+        get last trading price for any asset in this portfolio, in the order of portfolio_record.symbols()
         """
-        self.portfolio_record_lock.acquire()
-        if not len(self.portfolio_record.index):
-            self.portfolio_record_lock.release()
+        held = self.portfolio_record.snapshot().scodes
+        if not len(held):
             return np.array([])
-        res = np.array(
-            self.trader.last_trade_price(','.join(self.portfolio_record.index))
-        )[:,0].astype(np.float32)
-        self.portfolio_record_lock.release()
-        return res
+        return self.quote_last_price(*held)
 
     def quote_last_price(self,*scodes):
-        return np.array(self.trader.last_trade_price(','.join(scodes)))[:,0].astype(np.float32)
+        """
+        get last trading price of given stocks, served from the quote cache when fresh enough
+        """
+        return self.quotes.last_trade_price(*scodes)
+
+    def quote(self,scode):
+        """
+        last trading price of scode to place an order with
+
+        return (float|None): the price, None (logged as an error) if the broker has no usable quote
+        """
+        return self.checked_quote(scode,self.quotes.get(scode))
+
+    def checked_quote(self,scode,price):
+        if not (np.isfinite(price) and price > 0):
+            self.log.error("no quote for {}, order not placed",scode,scode = scode)
+            return None
+        return float(price)
+
+    def priced(self,snap,prices):
+        """
+        prices of the positions in snap, a position without a quote is valued at its average cost
+        """
+        missing = ~np.isfinite(prices)
+        if missing.any():
+            self.log.error("no quote for {}, valued at cost",','.join(scode for scode,m in zip(snap.scodes,missing) if m))
+            prices = np.where(missing,snap.avg_cost,prices)
+        return prices
     
     def get_time():
         """
         get current time
         """
-        return pd.datetime.now()
+        return datetime.datetime.now()
     
     def get_market_value(self):
         """
         get market value of current portfolio
         """
-        self.portfolio_record_lock.acquire()
-        srs = self.portfolio_record["SHARES"].values
-        self.portfolio_record_lock.release()
-        res = np.dot(
-            self.get_last_price(),
-            srs
-        )
-        if res is None:
+        snap = self.portfolio_record.snapshot()
+        if not len(snap):
             return self.bp
-        return res+self.bp
+        return float(np.dot(self.priced(snap,self.quote_last_price(*snap.scodes)),snap.shares))+self.bp
     
     def market_buy(self,scode,n,force_buy = False,time_in_force = 'gfd'):
         """
@@ -122,14 +472,14 @@ class Portfolio:
         n (int): shares to buy
         force_buy (bool): allow using back up buying power(exception when there isnt any) to buy
         time_in_force (str): gfd ,gtc ,ioc ,fok or opg
+        return (Future): resolves to the placed order, None if it wasnt placed
         """
         def market_buy_worker():
-            if self.bp < float(self.trader.last_trade_price(scode)[0][0])*n*1.005 and not force_buy:
-                self.log_lock.acquire()
-                self.log.append(
-                    "{}: no enough buying power for this portfolio to buy {} shares of {}".format(Portfolio.get_time(),n,scode)
-                )
-                self.log_lock.release()
+            last = self.quote(scode)
+            if last is None:
+                return
+            if self.bp < last*n*1.005 and not force_buy:
+                self.log.warning("no enough buying power for this portfolio to buy {} shares of {}",n,scode,scode = scode)
                 return 
             instrument = self.converter(scode)
             #instrument = self.trader.instruments(scode)[0]
@@ -140,18 +490,11 @@ class Portfolio:
                 time_in_force=time_in_force
             )
             if order is None:
-                self.log_lock.acquire()
-                self.log.append(
-                    "{}: fail to place market buy order {} shares of {}".format(Portfolio.get_time(),n,scode)
-                )
-                self.log_lock.release()
+                self.log.error("fail to place market buy order {} shares of {}",n,scode,scode = scode)
                 return
-            self.queue_lock.acquire()
-            self.queue.append([scode,order,0])
-            self.queue_lock.release()
-        t = Thread(target = market_buy_worker)
-        self.threads.append(t)
-        t.start()
+            self.enqueue(scode,order,market = True)
+            return order
+        return self.submit(market_buy_worker)
         
     def market_sell(self,scode,n,time_in_force = 'gfd'):
         """
@@ -160,19 +503,13 @@ class Portfolio:
         scode (str): symbol of stock
         n (int): shares to sell
         time_in_force (str): gfd ,gtc ,ioc ,fok or opg
+        return (Future): resolves to the placed order, None if it wasnt placed
         """
         def market_sell_worker():
-            assert scode in self.portfolio_record.index
-            self.portfolio_record_lock.acquire()
-            if self.portfolio_record.loc[scode]["SHARES"] < n:
-                self.portfolio_record_lock.release()
-                self.log_lock.acquire()
-                self.log.append(
-                    "{}: no enough shares for this portfolio to sell {} shares of {}".format(Portfolio.get_time(),n,scode)
-                )
-                self.log_lock.release()
+            assert scode in self.portfolio_record
+            if self.portfolio_record.shares_of(scode) < n:
+                self.log.warning("no enough shares for this portfolio to sell {} shares of {}",n,scode,scode = scode)
                 return
-            self.portfolio_record_lock.release()
             instrument = self.converter(scode)
             #instrument = self.trader.instruments(scode)[0]
             order = self.trader.place_market_sell_order(
@@ -182,18 +519,11 @@ class Portfolio:
                 time_in_force = time_in_force
             )
             if order.order is None:
-                self.log_lock.acquire()
-                self.log.append(
-                    "{}: fail to place market sell order {} shares of {}".format(Portfolio.get_time(),n,scode)
-                )
-                self.log_lock.release()
+                self.log.error("fail to place market sell order {} shares of {}",n,scode,scode = scode)
                 return
-            self.queue_lock.acquire()
-            self.queue.append([scode,order,0])
-            self.queue_lock.release()
-        t = Thread(target = market_sell_worker)
-        self.threads.append(t)
-        t.start()
+            self.enqueue(scode,order,market = True)
+            return order
+        return self.submit(market_sell_worker)
     
     def stop_loss_buy(self,scode,stop_price,n,force_buy = False,time_in_force = 'gtc'):
         """
@@ -203,14 +533,14 @@ class Portfolio:
         stop_price (float): stop_price
         force_buy (bool): allow buying with buck up buying power
         time_in_force (str): gfd ,gtc ,ioc ,fok or opg
+        return (Future): resolves to the placed order, None if it wasnt placed
         """
         def stop_buy_worker():
-            if self.bp < float(self.trader.last_trade_price(scode)[0][0])*n*1.005 and not force_buy:
-                self.log_lock.acquire()
-                self.log.append(
-                    "{}: no enough buying power for this portfolio to buy {} shares of {}".format(Portfolio.get_time(),n,scode)
-                )
-                self.log_lock.release()
+            last = self.quote(scode)
+            if last is None:
+                return
+            if self.bp < last*n*1.005 and not force_buy:
+                self.log.warning("no enough buying power for this portfolio to buy {} shares of {}",n,scode,scode = scode)
                 return
             instrument = self.converter(scode)
             #instrument = self.trader.instruments(scode)[0]
@@ -222,18 +552,11 @@ class Portfolio:
                 time_in_force = time_in_force
             )
             if order is None:
-                self.log_lock.acquire()
-                self.log.append(
-                    "{}: fail to place stop loss buy order {} shares of {}".format(Portfolio.get_time(),n,scode)
-                )
-                self.log_lock.release()
+                self.log.error("fail to place stop loss buy order {} shares of {}",n,scode,scode = scode)
                 return
-            self.queue_lock.acquire()
-            self.queue.append([scode,order,0])
-            self.queue_lock.release()
-        t = Thread(target = stop_buy_worker)
-        self.threads.append(t)
-        t.start()
+            self.enqueue(scode,order,market = False)
+            return order
+        return self.submit(stop_buy_worker)
     def stop_loss_sell(self,scode,stop_price,n,time_in_force = 'gtc'):
         """
         sell stock with stop order
@@ -241,19 +564,13 @@ class Portfolio:
         scode (str): symbol of stock
         n (int): shares to sell
         time_in_force (str): gfd ,gtc ,ioc ,fok or opg
+        return (Future): resolves to the placed order, None if it wasnt placed
         """
         def stop_sell_worker():
-            assert scode in self.portfolio_record.index
-            self.portfolio_record_lock.acquire()
-            if self.portfolio_record.loc[scode]["SHARES"] < n:
-                self.portfolio_record_lock.release()
-                self.log_lock.acquire()
-                self.log.append(
-                    "{}: no enough shares for this portfolio to sell {} shares of {}".format(Portfolio.get_time(),n,scode)
-                )
-                self.log_lock.release()
+            assert scode in self.portfolio_record
+            if self.portfolio_record.shares_of(scode) < n:
+                self.log.warning("no enough shares for this portfolio to sell {} shares of {}",n,scode,scode = scode)
                 return
-            self.portfolio_record_lock.release()
             instrument = self.converter(scode)
             #instrument = self.trader.instruments(scode)[0]
             order = self.trader.place_stop_loss_sell_order(
@@ -264,26 +581,23 @@ class Portfolio:
                 time_in_force = time_in_force
             )
             if order.order is None:
-                self.log_lock.acquire()
-                self.log.append(
-                    "{}: fail to place stop loss sell order {} shares of {}".format(sPortfolio.get_time(),n,scode)
-                )
-                self.log_lock.release()
+                self.log.error("fail to place stop loss sell order {} shares of {}",n,scode,scode = scode)
                 return
-            self.queue_lock.acquire()
-            self.queue.append([scode,order,0])
-            self.queue_lock.release()
-        t = Thread(target = stop_sell_worker)
-        self.threads.append(t)
-        t.start()
+            self.enqueue(scode,order,market = False)
+            return order
+        return self.submit(stop_sell_worker)
 
-	def l_market_buy(self,scode,n,force_buy = False,time_in_force = 'gfd',tol = 0.003):
-		p = float(self.trader.last_trade_price(scode)[0][0])
-		self.limit_buy(scode,p*(1+tol),n,force_buy,time_in_force)
+    def l_market_buy(self,scode,n,force_buy = False,time_in_force = 'gfd',tol = 0.003):
+        p = self.quote(scode)
+        if p is None:
+            return self.submit(lambda: None)
+        return self.limit_buy(scode,p*(1+tol),n,force_buy,time_in_force)
 
-	def l_market_sell(self,scode,n,time_in_force='gtc',tol = 0.003):
-		p = float(self.trader.last_trade_price(scode)[0][0])
-		self.limit_sell(scode,p*(1-tol),n,time_in_force)
+    def l_market_sell(self,scode,n,time_in_force='gtc',tol = 0.003):
+        p = self.quote(scode)
+        if p is None:
+            return self.submit(lambda: None)
+        return self.limit_sell(scode,p*(1-tol),n,time_in_force)
 
 
     def limit_buy(self,scode,price,n,force_buy = False,time_in_force = 'gtc'):
@@ -293,14 +607,14 @@ class Portfolio:
         scode (str): symbol of stock
         n (int): shares to sell
         time_in_force (str): gfd ,gtc ,ioc ,fok or opg
+        return (Future): resolves to the placed order, None if it wasnt placed
         """
         def limit_buy_worker():
-            if self.bp < float(self.trader.last_trade_price(scode)[0][0])*n*1.005 and not force_buy:
-                self.log_lock.acquire()
-                self.log.append(
-                    "{}: no enough buying power for this portfolio to buy {} shares of {}".format(Portfolio.get_time(),n,scode)
-                )
-                self.log_lock.release()
+            last = self.quote(scode)
+            if last is None:
+                return
+            if self.bp < last*n*1.005 and not force_buy:
+                self.log.warning("no enough buying power for this portfolio to buy {} shares of {}",n,scode,scode = scode)
                 return
             instrument = self.converter(scode)
             order = self.trader.place_limit_buy_order(
@@ -311,18 +625,11 @@ class Portfolio:
                 time_in_force = time_in_force
             )
             if order is None:
-                self.log_lock.acquire()
-                self.log.append(
-                    "{}: fail to place limit buy order {} shares of {}".format(Portfolio.get_time(),n,scode)
-                )
-                self.log_lock.release()
+                self.log.error("fail to place limit buy order {} shares of {}",n,scode,scode = scode)
                 return
-            self.queue_lock.acquire()
-            self.queue.append([scode,order,0])
-            self.queue_lock.release()
-        t = Thread(target = limit_buy_worker)
-        self.threads.append(t)
-        t.start()
+            self.enqueue(scode,order,market = False)
+            return order
+        return self.submit(limit_buy_worker)
         
     def limit_sell(self,scode,price,n,time_in_force = 'gtc'):
         """
@@ -331,19 +638,13 @@ class Portfolio:
         scode (str): symbol of stock
         n (int): shares to sell
         time_in_force (str): gfd ,gtc ,ioc ,fok or opg
+        return (Future): resolves to the placed order, None if it wasnt placed
         """
         def limit_sell_worker():
-            assert scode in self.portfolio_record.index
-            self.portfolio_record_lock.acquire()
-            if self.portfolio_record.loc[scode]["SHARES"] < n:
-                self.portfolio_record_lock.release()
-                self.log_lock.acquire()
-                self.log.append(
-                    "{}: no enough shares for this portfolio to sell {} shares of {}".format(Portfolio.get_time(),n,scode)
-                )
-                self.log_lock.release()
+            assert scode in self.portfolio_record
+            if self.portfolio_record.shares_of(scode) < n:
+                self.log.warning("no enough shares for this portfolio to sell {} shares of {}",n,scode,scode = scode)
                 return
-            self.portfolio_record_lock.release()
             instrument = self.converter(scode)
             order = self.trader.place_limit_sell_order(
                 instrument,
@@ -353,18 +654,11 @@ class Portfolio:
                 time_in_force = time_in_force
             )
             if order.order is None:
-                self.log_lock.acquire()
-                self.log.append(
-                    "{}: fail to place limit sell order {} shares of {}".format(Portfolio.get_time(),n,scode)
-                )
-                self.log_lock.release()
+                self.log.error("fail to place limit sell order {} shares of {}",n,scode,scode = scode)
                 return
-            self.queue_lock.acquire()
-            self.queue.append([scode,order,0])
-            self.queue_lock.release()
-        t = Thread(target = limit_sell_worker)
-        self.threads.append(t)
-        t.start()        
+            self.enqueue(scode,order,market = False)
+            return order
+        return self.submit(limit_sell_worker)        
         
         
     def stop_limit_buy(self,scode,stop_price,n,force_buy = False,time_in_force = 'gtc'):
@@ -375,14 +669,14 @@ class Portfolio:
         stop_price (float): stop_price
         force_buy (bool): allow buying with buck up buying power
         time_in_force (str): gfd ,gtc ,ioc ,fok or opg
+        return (Future): resolves to the placed order, None if it wasnt placed
         """
         def stop_limit_buy_worker():
-            if self.bp < float(self.trader.last_trade_price(scode)[0][0])*n*1.005 and not force_buy:
-                self.log_lock.acquire()
-                self.log.append(
-                    "{}: no enough buying power for this portfolio to buy {} shares of {}".format(Portfolio.get_time(),n,scode)
-                )
-                self.log_lock.release()
+            last = self.quote(scode)
+            if last is None:
+                return
+            if self.bp < last*n*1.005 and not force_buy:
+                self.log.warning("no enough buying power for this portfolio to buy {} shares of {}",n,scode,scode = scode)
                 return
             instrument = self.converter(scode)
             order = self.trader.place_stop_limit_buy_order(
@@ -393,18 +687,11 @@ class Portfolio:
                 time_in_force = time_in_force
             )
             if order is None:
-                self.log_lock.acquire()
-                self.log.append(
-                    "{}: fail to place stop loss buy order {} shares of {}".format(Portfolio.get_time(),n,scode)
-                )
-                self.log_lock.release()
+                self.log.error("fail to place stop loss buy order {} shares of {}",n,scode,scode = scode)
                 return
-            self.queue_lock.acquire()
-            self.queue.append([scode,order,0])
-            self.queue_lock.release()
-        t = Thread(target = stop_limit_buy_worker)
-        self.threads.append(t)
-        t.start()
+            self.enqueue(scode,order,market = False)
+            return order
+        return self.submit(stop_limit_buy_worker)
     def stop_limit_sell(self,scode,stop_price,n,time_in_force = 'gtc'):
         """
         sell stock with stop limit order
@@ -412,19 +699,13 @@ class Portfolio:
         scode (str): symbol of stock
         n (int): shares to sell
         time_in_force (str): gfd ,gtc ,ioc ,fok or opg
+        return (Future): resolves to the placed order, None if it wasnt placed
         """
         def stop_limit_sell_worker():
-            assert scode in self.portfolio_record.index
-            self.portfolio_record_lock.acquire()
-            if self.portfolio_record.loc[scode]["SHARES"] < n:
-                self.portfolio_record_lock.release()
-                self.log_lock.acquire()
-                self.log.append(
-                    "{}: no enough shares for this portfolio to sell {} shares of {}".format(Portfolio.get_time(),n,scode)
-                )
-                self.log_lock.release()
+            assert scode in self.portfolio_record
+            if self.portfolio_record.shares_of(scode) < n:
+                self.log.warning("no enough shares for this portfolio to sell {} shares of {}",n,scode,scode = scode)
                 return
-            self.portfolio_record_lock.release()
             instrument = self.converter(scode)
             order = self.trader.place_stop_limit_sell_order(
                 instrument,
@@ -434,127 +715,254 @@ class Portfolio:
                 time_in_force = time_in_force
             )
             if order.order is None:
-                self.log_lock.acquire()
-                self.log.append(
-                    "{}: fail to place stop limit sell order {} shares of {}".format(Portfolio.get_time(),n,scode)
-                )
-                self.log_lock.release()
+                self.log.error("fail to place stop limit sell order {} shares of {}",n,scode,scode = scode)
                 return
-            self.queue_lock.acquire()
-            self.queue.append([scode,order,0])
-            self.queue_lock.release()
-        t = Thread(target = stop_limit_sell_worker)
-        self.threads.append(t)
-        t.start()
+            self.enqueue(scode,order,market = False)
+            return order
+        return self.submit(stop_limit_sell_worker)
         
         
 
-    def confirm_order(self,loop = False,gap_time = 5):
+    def confirm_order(self,loop = False,gap_time = 5,workers = 8):
         """
-        check whether submitted orders had been executed
+        check whether submitted orders had been executed,
+        every order due for a check is checked in one pass, concurrently or with one batched request
+        when the trader supports it (trader.check_orders)
         
-        loop (bool): confirm once or keep on comfirming until signal received
-        gap_time (float|int): pause between two confirms, in sec
+        loop (bool): confirm once or keep on comfirming until signal received, a portfolio runs one
+            loop at most, starting it again while it runs only updates gap_time and workers
+        gap_time (float|int): longest pause between two confirms, in sec, a pass runs earlier
+            as soon as an order is due
+        workers (int): number of orders checked at the same time
         """
         gap_time = float(gap_time)
-        if not self.confirm_signal:
-            self.confirm_signal = True
         assert gap_time > 0
+        self.confirm_lock.acquire()
+        self.confirm_signal = True
+        if loop:
+            self.confirm_args = (gap_time,workers)
+            if self.confirm_loop is not None:
+                # the loop was stopped but has not left yet, it keeps on going
+                self.confirm_lock.release()
+                return
         def confirm_worker():
             if loop:
-                self.log_lock.acquire()
-                self.log.append("{}: confirm, start".format(Portfolio.get_time()))
-                self.log_lock.release()
-            while self.confirm_signal:
-                sleep(gap_time)
-                self.queue_lock.acquire()
-                if not len(self.queue):
-                    self.queue_lock.release()
-                    continue
-                scode,order,cc = self.queue.pop(0)
-                self.queue_lock.release()
-                d = order.check()
-                if d['state'] in ['rejected','cancelled']:
-                    self.log_lock.acquire()
-                    self.log.append(
-                        "{}: order ({},{} {} {} {}) {} for unknown reason".format(
-                            Portfolio.get_time(),
-                            scode,
-                            d['quantity'],
-                            d['trigger'],
-                            d['type'],
-                            d['side'],
-                            d['state']
-                        )
-                    )
-                    self.log_lock.release()
-                    continue
+                self.log.info("confirm, start")
+            while True:
+                self.confirm_lock.acquire()
+                if not self.confirm_signal:
+                    if loop:
+                        self.confirm_loop = None
+                    self.confirm_lock.release()
+                    break
+                if loop:
+                    gap,n = self.confirm_args
+                else:
+                    gap,n = gap_time,workers
+                self.confirm_lock.release()
+                t0 = time()
+                self.queue.wait_due(gap)
+                t1 = time()
+                try:
+                    self.confirm_pass(n)
+                except Exception as e:
+                    self.log.error("confirm pass failed: {!r}",e,traceback = traceback.format_exc())
+                if self.metrics is not None:
+                    self.metrics.observe('confirm_wait',t1 - t0,portfolio = self.name)
+                    self.metrics.observe('confirm_pass',time() - t1,portfolio = self.name)
+                if not loop:
+                    break
+            if loop:
+                self.log.info("confirm, end")
+        t = Thread(target = confirm_worker)
+        if loop:
+            t.name = 'confirm {}'.format(self.name)
+            self.confirm_loop = t
+        t.start()
+        self.confirm_lock.release()
 
-                if not len(d['executions']):
-                    self.queue_lock.acquire()
-                    if cc >= self.cancel_count:
-                        order.cancel()
-                        self.log_lock.acquire()
-                        self.log.append(
-                            "{}: order ({},{} {} {} {}) cancelled due to cancel count exceeded".format(
-                                Portfolio.get_time(),
-                                scode,
-                                d['quantity'],
-                                d['trigger'],
-                                d['type'],
-                                d['side'],
-                            )
-                        )
-                        self.log_lock.release()
-                    else:
-                        self.queue.append([scode,order,cc+1])
-                    self.queue_lock.release()
-                    continue
+    def confirm_pass(self,workers = 8):
+        """
+        check every order that is due and book the executed ones
+
+        workers (int): number of orders checked at the same time
+        """
+        entries = self.queue.pop_due()
+        if not len(entries):
+            return
+        states = self.check_orders([entry.order for entry in entries],workers)
+        for entry,d in zip(entries,states):
+            self.settle(entry,d)
+        self.maybe_snapshot()
+
+    def settle(self,entry,d):
+        """
+        book a checked order, it leaves the queue when done and is put back otherwise,
+        also when booking it failed
+        """
+        try:
+            done = d is not None and self.process_order_state(entry,d)
+        except Exception as e:
+            self.log.error(
+                "fail to book order {} of {}: {!r}",entry.oid,entry.scode,e,
+                scode = entry.scode,traceback = traceback.format_exc()
+            )
+            self.recheck(entry,True)
+            return
+        if done:
+            self.queue.remove(entry)
+            self.close_orders([entry])
+        else:
+            self.recheck(entry,d is None)
+
+    def recheck(self,entry,failed = False):
+        """
+        put an order back into the queue for a later check
+
+        failed (bool): the check itself failed and is retried, rather than the order still pending
+        """
+        if self.metrics is not None:
+            if failed:
+                self.metrics.count('broker_retries',endpoint = 'check')
+            else:
+                self.metrics.count('order_rechecks',portfolio = self.name)
+        self.queue.reschedule(entry)
+
+    def check_orders(self,orders,workers = 8):
+        """
+        get the state of many orders, None for orders that could not be checked
 
-                ex_amount = float(d['executions'][0]['quantity'])
-                ex_price = float(d['executions'][0]['price'])
-                ex_side = d['side']
+        orders (list): orders returned by the trader
+        workers (int): number of orders checked at the same time
+        """
+        if hasattr(self.trader,'check_orders'):
+            try:
+                return self.trader.check_orders(orders)
+            except Exception as e:
+                self.log.error("fail to check {} orders: {!r}",len(orders),e)
+                return [None]*len(orders)
+        def check(order):
+            try:
+                return order.check()
+            except:
+                return None
+        if len(orders) == 1:
+            return [check(orders[0])]
+        with ThreadPoolExecutor(max_workers = max(1,min(int(workers),len(orders)))) as pool:
+            return list(pool.map(check,orders))
+
+    def process_order_state(self,entry,d):
+        """
+        book an order according to its state
+
+        an order can be filled in several executions, seen over several checks: every check books
+        the executions not booked yet (each at its own price), and the order stays in the queue
+        until it is filled, cancelled or rejected. an order cancelled for its cancel_count stays
+        too, until the broker reports it cancelled, so executions up to the cancel are booked.
 
+        entry (PendingOrder): order taken from the queue
+        d (dict): state of the order returned by order.check()
+        return (bool): True if the order is done and should leave the queue
+        """
+        scode = entry.scode
+        self.book_executions(entry,d)
+        if d['state'] in ['rejected','cancelled','failed']:
+            if not entry.cancelled:
+                self.log.warning(
+                    "order ({},{} {} {} {}) {} for unknown reason, {} shares were filled",
+                    scode,d['quantity'],d['trigger'],d['type'],d['side'],d['state'],entry.filled,
+                    scode = scode,oid = entry.oid
+                )
+            return True
+        if d['state'] == 'filled':
+            self.fill_latency.append(time() - entry.placed_at)
+            return True
+
+        if not entry.filled and not entry.cancelled and entry.cc >= self.cancel_count:
+            entry.cancelled = True
+            self.cancel_stale_order(entry)
+            self.log.info(
+                "order ({},{} {} {} {}) cancelled due to cancel count exceeded",
+                scode,d['quantity'],d['trigger'],d['type'],d['side'],
+                scode = scode,oid = entry.oid
+            )
+        return False
+
+    def book_executions(self,entry,d):
+        """
+        book the executions of an order not booked yet into the trading record, the positions
+        and the buying power
+        """
+        scode = entry.scode
+        ex_side = d['side']
+        with self.symbol_locks(scode):
+            for i,ex in enumerate(d['executions']):
+                key = ex.get('id',i)
+                if key in entry.booked:
+                    continue
+                ex_amount = float(ex['quantity'])
+                ex_price = float(ex['price'])
+                entry.booked.add(key)
+                if entry.recovered > 0:
+                    # booked before a restart, the journal only kept how many shares
+                    entry.recovered -= ex_amount
+                    continue
+                entry.filled += ex_amount
                 if ex_side == 'sell':
                     ex_amount = - ex_amount
+                self.commit('fill',str(entry.oid),ex_side,scode,ex_price,ex_amount,str(d['type']),now_us())
 
-                self.trading_record_lock.acquire()
-                self.trading_record.loc[Portfolio.get_time()] = [ex_side,scode,ex_price,abs(ex_amount),d['type']]
-                self.trading_record_lock.release()
+    def settle_cancelled(self,entries,states):
+        """
+        book what cancelled orders executed before the cancel, the ones the broker reports as
+        done leave the queue, the others stay for the confirm loop to see them end
 
-                self.portfolio_record_lock.acquire()
-                if scode not in self.portfolio_record.index:
-                    hold_amount = 0
-                    avg_cost = 0
-                else:
-                    hold_amount = self.portfolio_record.loc[scode]['SHARES']
-                    avg_cost = self.portfolio_record.loc[scode]['AVG_COST']
-
-                total_cost = hold_amount*avg_cost + ex_price*ex_amount
-                neo_shares = hold_amount + ex_amount
-                self.bp = self.bp - total_cost
-                if neo_shares == 0:
-                    self.portfolio_record.drop(scode)
-                    self.portfolio_record_lock.release()
-                    continue
+        states (list): state of each order checked after the cancel, None if the check failed
+        """
+        done = []
+        for entry,d in zip(entries,states):
+            entry.cancelled = True
+            if d is None:
+                continue
+            self.book_executions(entry,d)
+            if d['state'] in ['filled','rejected','cancelled','failed'] and self.queue.remove(entry):
+                done.append(entry)
+        self.close_orders(done)
+        return done
 
-                neo_avg_cost = total_cost/neo_shares
-                self.portfolio_record.loc[scode] = [neo_avg_cost,neo_shares]
-                self.portfolio_record_lock.release()
-                if not loop:
-                    break
-            if loop:
-                self.log_lock.acquire()
-                self.log.append("{}: confirm, end".format(Portfolio.get_time()))
-                self.log_lock.release()
-        t = Thread(target = confirm_worker)
-        t.start()
+    def cancel_entries(self,entries):
+        for entry in entries:
+            entry.order.cancel()
+        if len(entries):
+            self.settle_cancelled(entries,self.check_orders([entry.order for entry in entries]))
+
+    def cancel_stale_order(self,entry):
+        """
+        cancel an order that stayed unfilled for cancel_count checks
+        """
+        entry.order.cancel()
+
+    def fill_latency_stats(self):
+        """
+        seconds between placing an order and seeing it filled, over the last 1000 fills
+        """
+        lat = np.array(self.fill_latency)
+        if not len(lat):
+            return {"count" : 0}
+        return {
+            "count" : len(lat),
+            "mean" : float(lat.mean()),
+            "p50" : float(np.percentile(lat,50)),
+            "p95" : float(np.percentile(lat,95)),
+            "max" : float(lat.max())
+        }
 
     def stop_confirm(self):
         """
         stop confirming
         """
         self.confirm_signal = False
+        self.queue.wake()
 
     def transfer_shares(self,oth = None,scode = None,amount = None,direction = 'to'):
         """
@@ -571,36 +979,72 @@ class Portfolio:
         assert direction in ['from','to']
         amount = int(amount)
         if direction == 'from':
-            oth.portfolio_record_lock.acquire()
-            if (oth.portfolio_record.loc[scode]["SHARES"] < amount):
-                oth.portfolio_record_lock.release()
-                self.log_lock.acquire()
-                self.log.append(
-                    "{}: target portfolio doesnt have enough shares to transfer ({},{})".format(Portfolio.get_time(),scode,amount)
-                )
-                self.log_lock.release()
+            lock = oth.symbol_locks(scode)
+            lock.acquire()
+            if (oth.portfolio_record.shares_of(scode) < amount):
+                lock.release()
+                self.log.warning("target portfolio doesnt have enough shares to transfer ({},{})",scode,amount,scode = scode)
                 return
-            oth.portfolio_record.loc[scode]["SHARES"] -= amount
-            transfer_price = oth.portfolio_record.loc[scode]["AVG_COST"]
-            if oth.portfolio_record.loc[scode]["SHARES"] == 0:
-                oth.portfolio_record = oth.portfolio_record.drop(scode)
-            oth.portfolio_record_lock.release()
-            
-            self.portfolio_record_lock.acquire()
-            if scode not in self.portfolio_record.index:
-                original_avg_cost = 0
-                original_hold = 0
-            else:
-                original_avg_cost = self.portfolio_record.loc[scode]["AVG_COST"]
-                original_hold = self.portfolio_record.loc[scode]["SHARES"]
-            neo_avg_cost = (original_avg_cost*original_hold + amount*transfer_price)/(original_hold+amount)
-            self.portfolio_record.loc[scode] = [neo_avg_cost,original_hold+amount]
-            self.portfolio_record_lock.release()
-            self.add_trading_record("None",scode,transfer_price,amount,"transfer in")
-            oth.add_trading_record("None",scode,transfer_price,amount,"transfer out")
+            transfer_price = oth.portfolio_record.cost_of(scode)
+            when = now_us()
+            locks = Portfolio.state_locks(self,oth)
+            for l in locks:
+                l.acquire()
+            oth.record('book',scode,-float(amount),np.nan)
+            self.record('book',scode,float(amount),transfer_price)
+            self.record('ledger',"None",scode,transfer_price,float(amount),"transfer in",when)
+            oth.record('ledger',"None",scode,transfer_price,float(amount),"transfer out",when)
+            for l in reversed(locks):
+                l.release()
+            lock.release()
         if direction == 'to':
             oth.transfer_shares(self,scode,amount,direction = 'from')
             
+    @staticmethod
+    def state_locks(*portfolios):
+        """
+        state locks of several portfolios, in the order they must be acquired (by name) so that
+        two-sided changes never deadlock and a manager checkpoint never sees half of one
+        """
+        named = {p.name:p for p in portfolios}
+        return [named[name].state_lock for name in sorted(named)]
+
+    def cross_shares(self,oth,scode,n,price,oid = None):
+        """
+        buy shares from another portfolio at price, without going through the broker
+
+        booked as a sell by oth and a buy by this portfolio, both at price, only if oth holds the
+        shares and this portfolio has the buying power
+
+        oth (Portfolio): portfolio selling the shares, shares the same trader as this one
+        scode (str): symbol of stock
+        n (int): shares
+        price (float): price of one share, finite and positive
+        oid (str|None): id of the cross in the trading records
+        return (bool): True if crossed
+        """
+        assert oth.trader == self.trader
+        assert oth is not self
+        assert n > 0
+        n,price = float(n),float(price)
+        assert np.isfinite(price) and price > 0
+        named = {p.name:p for p in (self,oth)}
+        symbol_locks = [named[name].symbol_locks(scode) for name in sorted(named)]
+        locks = Portfolio.state_locks(self,oth)
+        for l in symbol_locks + locks:
+            l.acquire()
+        try:
+            if oth.portfolio_record.shares_of(scode) < n or self.bp < n*price:
+                return False
+            when = now_us()
+            oid = 'cross' if oid is None else str(oid)
+            oth.record('fill',oid,'sell',scode,price,-n,'internal cross',when)
+            self.record('fill',oid,'buy',scode,price,n,'internal cross',when)
+        finally:
+            for l in reversed(symbol_locks + locks):
+                l.release()
+        return True
+
     def transfer_buying_power(self,oth = None,amount = None,direction = 'to'):
         """
         transfer buying power from one portfolio to another
@@ -612,15 +1056,18 @@ class Portfolio:
         assert amount > 0
         assert direction in ['from','to']
         if direction == 'from':
+            locks = Portfolio.state_locks(self,oth)
+            for l in locks:
+                l.acquire()
             if oth.bp < amount:
-                self.log_lock.acquire()
-                self.log.append(
-                    "{}: target portfolio doesnt have enough buying power to transfer ({})".format(Portfolio.get_time(),amount)
-                )
-                self.log_lock.release()
+                for l in reversed(locks):
+                    l.release()
+                self.log.warning("target portfolio doesnt have enough buying power to transfer ({})",amount)
                 return 
-            oth.bp -= amount
-            self.bp += amount
+            oth.record('bp',-float(amount))
+            self.record('bp',float(amount))
+            for l in reversed(locks):
+                l.release()
         if direction == 'to':
             oth.transfer_buying_power(self,amount,'from')
             
@@ -629,15 +1076,26 @@ class Portfolio:
         """
         cancel all orders in the queue that havent been executed yet
         """
-        self.queue_lock.acquire()
-        while len(self.queue):
-            scode,order,ct = self.queue.pop()
-            order.cancel()
-        self.queue_lock.release()
-        self.log_lock.acquire()
-        self.log.append("{}: all orders in queue been cancelled".format(Portfolio.get_time()))
-        self.log_lock.release()
+        entries = self.queue.pending()
+        self.cancel_entries(entries)
+        self.log.info("all orders in queue been cancelled")
+
+    def cancel_orders(self,scode):
+        """
+        cancel the orders of a stock that havent been executed yet
+
+        scode (str): symbol of stock
+        """
+        entries = self.queue.by_symbol(scode)
+        self.cancel_entries(entries)
+        self.log.info("{} orders of {} in queue been cancelled",len(entries),scode,scode = scode)
         
+    def change_bp(self,amount):
+        """
+        add amount (negative to take away) to the buying power
+        """
+        self.commit('bp',float(amount))
+
     def add_shares_from_pool(self,scode = None,n = None):
         """
         add share from account equity to portfolio
@@ -656,32 +1114,14 @@ class Portfolio:
                 d = ins
                 break
         if d is None:
-            self.log_lock.acquire()
-            self.log.append(
-                "{}: dont have {} in your pool".format(Portfolio.get_time(),scode)
-            )
-            self.log_lock.release()
+            self.log.warning("dont have {} in your pool",scode,scode = scode)
             return
         owned_shares = float(d['quantity'])
         if n > owned_shares:
-            self.log_lock.acquire()
-            self.log.append(
-                "{}: dont have enough shares of {} in you pool".format(Portfolio.get_time(),scode)
-            )
-            self.log_lock.release()
+            self.log.warning("dont have enough shares of {} in you pool",scode,scode = scode)
             return
         n_avg_cost = float(d['average_buy_price'])
-        self.portfolio_record_lock.acquire()
-        if scode not in self.portfolio_record.index:
-            avg_cost = 0
-            shares = 0
-        else:
-            avg_cost = self.portfolio_record.loc[scode]['AVG_COST']
-            shares = self.portfolio_record.loc[scode]['SHARES']
-        neo_shares = shares + n
-        neo_cost = (avg_cost*shares + n_avg_cost*n)/neo_shares
-        self.portfolio_record.loc[scode] = [neo_cost,neo_shares]
-        self.portfolio_record_lock.release()
+        self.add_shares(scode,n,n_avg_cost)
         
     def set_bp_HARD(self,bp):
         """
@@ -693,38 +1133,16 @@ class Portfolio:
         bp (float): buying power
         """
         total_bp = float(self.trader.get_account()['margin_balances']['unallocated_margin_cash'])
-        self.bp = min(bp,total_bp)
+        self.commit('bp_set',float(min(bp,total_bp)))
         
     def is_market_open(self):
         """
         check if a market is open,
-        
-        have no clue what timezone did robinhood use for market hour,
-        official api says it is US/Eastern, but the market hour returned from api is obviously not US/Eastern
-        
-        so to check the current time with the timezone robinhood used,
-        a buy order will be placed to see the created time returned by api
-        
-        the placed order will normally be rejected or this method will cancel it immediately.
-        
-        shoud not call this method too frequently
+
+        market hours are cached by the MarketCalendar and compared with the local clock corrected
+        by the offset to the server clock, so this is cheap to call
         """
-        u = self.trader.place_stop_limit_buy_order(
-            instrument = self.trader.instruments('BAC'),
-            quantity=1,
-            stop_price=0.01
-        )
-        now = datetime.datetime.strptime(u.check()['created_at'],"%Y-%m-%dT%H:%M:%S.%fZ")
-        u.cancel()
-        y = now.year
-        m = now.month
-        d = now.day
-        info = self.trader.session.get('https://api.robinhood.com/markets/XNAS/hours/{}-{}-{}/'.format(y,m,d)).json()
-        if not info['is_open']:
-            return False
-        opens_at = datetime.datetime.strptime(info['opens_at'],"%Y-%m-%dT%H:%M:%SZ")
-        closes_at = datetime.datetime.strptime(info['closes_at'],"%Y-%m-%dT%H:%M:%SZ")
-        return now<=closes_at and now >=opens_at
+        return self.calendar.is_open()
         
     def shares_owned(self,scode):
         """
@@ -732,88 +1150,153 @@ class Portfolio:
         
         scode (str): symbol of stock
         """
-        self.portfolio_record_lock.acquire()
-        if scode not in self.portfolio_record.index:
-            self.portfolio_record_lock.release()
-            return 0
-        res = self.portfolio_record.loc[scode]["SHARES"]
-        self.portfolio_record_lock.release()
-        return res
+        return self.portfolio_record.snapshot().shares_of(scode)
 
     def get_weights(self,*scodes):
         """
         get weight of given assets in your portfolio 
         """
-        res = {}
-        mv = self.get_market_value()
-        lp = pd.Series(self.get_last_price(),index = self.portfolio_record.index)
-        self.portfolio_record_lock.acquire()
-        for scode in scodes:
-            if scode not in self.portfolio_record.index:
-                res[scode] = 0
-            else:
-                res[scode] = (lp.loc[scode]*self.portfolio_record.loc[scode]["SHARES"])/mv
-        self.portfolio_record_lock.release()
-        return res
+        snap = self.portfolio_record.snapshot()
+        if not len(snap):
+            return {scode:0 for scode in scodes}
+        values = self.priced(snap,self.quote_last_price(*snap.scodes))*snap.shares
+        mv = values.sum() + self.bp
+        return {
+            scode:(float(values[snap.slots[scode]]/mv) if scode in snap else 0) for scode in scodes
+        }
+
+    def rebalance_to(self,weights,lot = 1,min_trade = 1.0,reserve = 0.005):
+        """
+        trade towards target weights with market orders
+
+        the quotes of every symbol involved are fetched with one call, the orders come from one
+        vectorized computation: target value of each symbol = weight * (market value + bp), the
+        difference in shares is rounded towards zero to whole lots and dropped under min_trade USD.
+        symbols held but not in weights (or weighted 0) are sold whole, odd lots and small positions
+        included. buys are scaled down to what bp plus the
+        proceeds of the sells can pay, and placed after the sells. as the sells fill after the
+        buys are placed, bp can be negative for a moment.
+
+        weights (dict): symbol -> fraction of the market value, adding up to at most 1, the rest stays as bp
+        lot (int): shares are traded in multiples of lot
+        min_trade (float): smallest trade in USD
+        reserve (float): fraction of the price kept aside for buys, for the price to move before they fill
+        return (list): (symbol, shares, Future) of the orders placed, sells first, shares < 0 for sells
+        """
+        assert all(w >= 0 for w in weights.values())
+        assert sum(weights.values()) <= 1 + 1e-9
+        assert int(lot) >= 1
+        lot = int(lot)
+        snap = self.portfolio_record.snapshot()
+        scodes = list(dict.fromkeys(list(snap.scodes) + list(weights)))
+        if not len(scodes):
+            return []
+        prices = np.asarray(self.quote_last_price(*scodes),dtype = np.float64)
+        held = np.array([snap.shares_of(scode) for scode in scodes])
+        target = np.array([float(weights.get(scode,0)) for scode in scodes])
+        known = np.isfinite(prices) & (prices > 0)
+        value = float(np.dot(held[known],prices[known])) + self.bp
+        with np.errstate(divide = 'ignore',invalid = 'ignore'):
+            delta = np.where(known,target*value/prices - held,0)
+        delta = np.fix(delta/lot)*lot
+        delta = np.maximum(delta,-held)
+        delta[np.abs(delta)*np.where(known,prices,0) < min_trade] = 0
+        exits = known & (target == 0) & (held > 0)
+        delta[exits] = -held[exits]
+
+        sells = delta < 0
+        buys = delta > 0
+        budget = self.bp - float(np.dot(delta[sells],prices[sells]))
+        cost = float(np.dot(delta[buys],prices[buys]))*(1 + reserve)
+        if cost > budget:
+            delta[buys] = np.floor(delta[buys]*max(budget,0)/cost/lot)*lot
+            delta[buys & (delta*np.where(known,prices,0) < min_trade)] = 0
+            buys = delta > 0
+
+        placed = []
+        for i in np.flatnonzero(sells):
+            n = int(-delta[i])
+            placed.append((scodes[i],-n,self.market_sell(scodes[i],n)))
+        for i in np.flatnonzero(buys):
+            n = int(delta[i])
+            placed.append((scodes[i],n,self.market_buy(scodes[i],n,force_buy = True)))
+        return placed
 
     def unlock_all(self):
         """
         unlock all locked locks, in case of uncaught exceptions
         """
         try:
-            self.portfolio_record_lock.release()
-        except:
-            pass
-        try:
-            self.log_lock.release()
-        except:
-            pass
-        try:
-            self.trading_record_lock.release()
+            self.log.lock.release()
         except:
             pass
 
     def save(self,savdir = None,root_name = ''):
         """
         save portfolio to files
-        """
-        self.confirm_signal = False
 
-        for t in self.threads:
-            self.unlock_all()
-            t.join()
+        when the portfolio journals into this directory everything is already there, saving only
+        waits for the journal to reach the disk (and compacts it if due), otherwise the state is
+        written to one binary snapshot file, portfolio.snap
+        """
         if savdir is None:
             savdir = self.name
         
         fdir = root_name+savdir+'/'
-        if not os.path.exists(fdir):
-            os.mkdir(fdir)
-        self.trading_record.to_csv(fdir+"trading.csv")
-        self.portfolio_record.to_csv(fdir+"portfolio.csv")
-        pd.DataFrame([[self.bp]]).to_csv(fdir+"bp")
-        with open(fdir+"log{}.log".format(Portfolio.get_time()).replace(' ','').replace(':','.'),'w') as f:
-            for log in self.log:
-                f.write(log+"\n")
+        if self.journal is not None and os.path.abspath(fdir) == os.path.abspath(self.journal_dir):
+            self.journal.sync()
+            self.maybe_snapshot()
+        else:
+            self.confirm_signal = False
+            self.wait_orders_placed()
+            if not os.path.exists(fdir):
+                os.mkdir(fdir)
+            self.state_lock.acquire()
+            trading,portfolio,meta = self.capture()
+            self.state_lock.release()
+            Snapshot.write(fdir+"portfolio.snap",trading,portfolio,**meta)
+        self.log.open(fdir+"portfolio.log")
+        self.log.flush()
                 
     def load(self,savdir = None,root_name = ''):
         """
         load portfolio info from files
+
+        a journaled directory is recovered from its latest snapshot and the journal records
+        written after it, otherwise portfolio.snap is loaded, or the csv files of older versions
         """
         if savdir is None:
             savdir = self.name
         fdir = root_name + savdir + '/'
         assert os.path.exists(fdir)
-        self.trading_record = pd.DataFrame.from_csv(fdir+"trading.csv")
-        self.portfolio_record = pd.DataFrame.from_csv(fdir+"portfolio.csv")
-        self.bp = pd.DataFrame.from_csv(fdir+"bp").values[0][0]
+        if os.path.exists(fdir+'CURRENT'):
+            self.recover(fdir)
+        elif os.path.exists(fdir+'portfolio.snap'):
+            self.read_snapshot(fdir+'portfolio.snap')
+        else:
+            self.trading_record = TradeLedger.from_frame(pd.read_csv(fdir+"trading.csv",index_col = 0))
+            self.portfolio_record = PositionBook.from_frame(pd.read_csv(fdir+"portfolio.csv",index_col = 0))
+            self.bp = float(pd.read_csv(fdir+"bp",index_col = 0).values[0][0])
+
+    def export_csv(self,fdir):
+        """
+        write the trading record, the positions and the buying power as csv files into fdir,
+        for reading with other tools, load only reads them from saves of older versions
+        """
+        if not os.path.exists(fdir):
+            os.makedirs(fdir)
+        self.trading_record.to_frame().to_csv(os.path.join(fdir,"trading.csv"))
+        self.portfolio_record.to_frame().to_csv(os.path.join(fdir,"portfolio.csv"))
+        pd.DataFrame([[self.bp]]).to_csv(os.path.join(fdir,"bp"))
         
     def quit(self):
         """
         get ready to quit
         """
-        self.confirm_signal = False
-        for t in self.threads:
-            self.unlock_all()
-            t.join()
+        self.stop_confirm()
+        self.wait_orders_placed()
+        if self.journal is not None:
+            self.journal.sync()
+        self.log.close()
 
                 
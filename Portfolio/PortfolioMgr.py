@@ -1,17 +1,46 @@
-from Robinhood import Robinhood
+from .Broker import RobinhoodBroker
+from .Broker import as_broker
+from .EventLog import EventLog
+from .MarketCalendar import MarketCalendar
+from .Metrics import InstrumentedBroker
+from .Metrics import Metrics
+from .OrderExecutor import OrderExecutor
 from .Portfolio import Portfolio
+from .Portfolio import now_us
+from .QuoteCache import QuoteCache
+from .Scheduler import Scheduler
 from .SIconverter import SIconverter
-from time import sleep
+from .Snapshot import Snapshot
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from threading import Lock
+import json
 import numpy as np
-from threading import Thread
-from threading import Condition
+import os
+import shutil
+import traceback
 class PortfolioMgr:
+    portfolio_class = Portfolio
+
     def __init__(
         self,
         robin_un = None,
         robin_pd = None,
         name = None,
-        load_from = None
+        load_from = None,
+        instrument_index = None,
+        order_workers = 8,
+        max_pending_orders = 256,
+        quote_max_age = 1.0,
+        strategy_workers = 4,
+        trader = None,
+        metrics = False,
+        metrics_file = None,
+        metrics_period = 15,
+        journal = False,
+        log_capacity = 10000,
+        netting_period = None
     ):
         """
         Manager for multiple portfolios in the same account
@@ -19,29 +48,72 @@ class PortfolioMgr:
         robin_un (str): username of robinhood account
         robin_pd (str): password of robinhood account
         name (str): name of the manager
-        load_from (str): path to the saving file
+        load_from (str): path to the saving file, a checkpoint found there is restored without asking
+            the broker for the positions of the account
+        instrument_index (str|None): path to the on disk symbol/instrument index shared by SIconverter
+        order_workers (int): orders placed concurrently by all portfolios together
+        max_pending_orders (int): unfinished order submissions allowed before order methods block
+        quote_max_age (float): seconds a last trade price is shared between portfolios before requested again
+        strategy_workers (int): scheduled algorithms running at the same time
+        trader (Broker|None): broker of the account (e.g. a SimBroker, or an already logged in Robinhood trader),
+            robin_un and robin_pd are not needed then
+        metrics (bool): record broker call latencies and errors, lock waits and queue depths, see stats()
+        metrics_file (str|None): dump the metrics in prometheus text format to this file every
+            metrics_period sec, implies metrics
+        metrics_period (float): seconds between two dumps
+        journal (bool): portfolios journal every change of state into name/<portfolio name>/ as it
+            happens, so save only has to flush and a crash loses nothing that was written
+        log_capacity (int): log events kept in memory by the manager and by each portfolio, see EventLog
+        netting_period (float|None): seconds between two nettings of the orders collected by market_order,
+            None to net them once the scheduled algorithms ticking together have all returned
         """
-        assert robin_un is not None
-        assert robin_pd is not None
         assert name is not None
-        self.trader = Robinhood()
-        self.trader.login(robin_un,robin_pd)
+        if trader is None:
+            assert robin_un is not None
+            assert robin_pd is not None
+            trader = RobinhoodBroker.login(robin_un,robin_pd)
+        self.trader = as_broker(trader)
+        self.metrics = None
+        if metrics or metrics_file is not None:
+            self.metrics = Metrics()
+            self.trader = InstrumentedBroker(self.trader,self.metrics)
         self.name = name
-        self.converter = SIconverter(trader = self.trader)
-        self.unassigned_bp = float(self.trader.get_account()['margin_balances']['unallocated_margin_cash'])
-        self.unassigned_shares = {
-            self.converter(d['instrument']):int(float(d['quantity'])) for d in self.trader.securities_owned()['results']
-        }
+        self.journal = journal
+        self.log_capacity = log_capacity
+        self.converter = SIconverter(trader = self.trader,load = instrument_index)
+        self.executor = OrderExecutor(workers = order_workers,max_pending = max_pending_orders)
+        self.quotes = QuoteCache(trader = self.trader,max_age = quote_max_age)
+        self.calendar = MarketCalendar(trader = self.trader)
+        if load_from is not None and PortfolioMgr.checkpoint_dir(load_from) is not None:
+            self.unassigned_bp = 0.0
+            self.unassigned_shares = {}
+        else:
+            self.unassigned_bp = float(self.trader.get_account()['margin_balances']['unallocated_margin_cash'])
+            self.unassigned_shares = self.get_securities_owned()
         self.portfolios = {}
         self.regisiter = {}
+        # guards unassigned_bp, unassigned_shares and the set of portfolios
+        self.lock = Lock()
+        self.to_net = []
+        self.net_lock = Lock()
+        self.crosses = count(1)
         self.working_now = True
-        self.working_cv = Condition()
-        
-        self.check_work_v = True
-        self.check_work_cv = Condition()
+        self.scheduler = Scheduler(workers = strategy_workers,after_cycle = self.net if netting_period is None else None)
+        if self.metrics is not None:
+            self.metrics.gauge('executor_queue_depth',self.executor.queue_depth)
+        self.metrics_file = metrics_file
+        if metrics_file is not None:
+            self.scheduler.add('metrics_dump',lambda:self.metrics.dump(metrics_file),metrics_period)
 
-        self.threads = []
-        self.log = []
+        if netting_period is not None:
+            self.scheduler.add('netting',self.net,netting_period)
+        self.log = EventLog(capacity = log_capacity)
+        if journal:
+            if not os.path.exists(name):
+                os.makedirs(name)
+            self.log.open(os.path.join(name,'manager.log'))
+        if load_from is not None:
+            self.load(load_from)
         
     def add_portfolio(
         self,
@@ -60,16 +132,29 @@ class PortfolioMgr:
             order will be canceled if it can not be executed for cancel_count times
         """
         assert name is not None
-        assert ini_bp < self.unassigned_bp
-        self.portfolios[name] = Portfolio(
+        self.lock.acquire()
+        try:
+            assert ini_bp < self.unassigned_bp
+            self.portfolios[name] = self.new_portfolio(name,ini_bp,cancel_count,load)
+            self.unassigned_bp -= ini_bp
+        finally:
+            self.lock.release()
+
+    def new_portfolio(self,name,ini_bp = 0,cancel_count = np.inf,load = None):
+        return self.portfolio_class(
             trader = self.trader,
             name = name,
             iniFund = ini_bp,
+            load_from = load,
             cancel_count = cancel_count,
-            converter = self.converter
+            converter = self.converter,
+            executor = self.executor,
+            quotes = self.quotes,
+            calendar = self.calendar,
+            metrics = self.metrics,
+            journal_dir = os.path.join(self.name,name) if self.journal else None,
+            log_capacity = self.log_capacity
         )
-        self.unassigned_bp -= ini_bp
-        
         
     def update_allocatable_buying_power(self):
         """
@@ -86,21 +171,20 @@ class PortfolioMgr:
         """
         owned_shares = self.get_securities_owned()
         for k,p in self.portfolios.items():
-            p.portfolio_record_lock.acquire()
-            for scode in p.portfolio_record.index:
-                try:
-                    owned_shares[scode] -= p.portfolio_record.loc[scode]["SHARES"]
-                except:
-                    pass
-            p.portfolio_record_lock.release()
+            snap = p.portfolio_record.snapshot()
+            for scode,shares in zip(snap.scodes,snap.shares):
+                if scode in owned_shares:
+                    owned_shares[scode] -= shares
         self.unassigned_shares = owned_shares
     
     def get_securities_owned(self):
         """
         get shares owned by the user
         """
+        owned = self.trader.securities_owned()['results']
+        scodes = self.converter.prefetch([d['instrument'] for d in owned])
         return {
-            self.converter(d['instrument']):int(float(d['quantity'])) for d in self.trader.securities_owned()['results']
+            scodes[d['instrument']]:int(float(d['quantity'])) for d in owned
         }
     
     def get_bp_owned(self):
@@ -117,11 +201,16 @@ class PortfolioMgr:
         amount (float): money in USD to be added
         """
         assert name in self.portfolios
-        self.update_allocatable_buying_power()
-        assert self.unassigned_bp > amount
-        self.portfolios[name].bp += amount
-        self.unassigned_bp -= amount
-        self.portfolios[name].add_trading_record("None","None",amount,1,"add bp")
+        owned = self.get_bp_owned()
+        self.lock.acquire()
+        try:
+            self.unassigned_bp = owned - sum(p.bp for p in self.portfolios.values())
+            assert self.unassigned_bp > amount
+            self.portfolios[name].change_bp(amount)
+            self.unassigned_bp -= amount
+            self.portfolios[name].add_trading_record("None","None",amount,1,"add bp")
+        finally:
+            self.lock.release()
     
     def add_shares_to(self,name,scode,amount):
         """
@@ -134,10 +223,14 @@ class PortfolioMgr:
         assert name in self.portfolios
         self.update_allocatable_shares()
         amount = int(amount)
-        assert self.unassigned_shares[scode] >= amount
-        self.portfolios[name].add_shares_from_pool(scode = scode,n = amount)
-        self.unassigned_shares[scode] -= amount
-        self.portfolios[name].add_trading_record("None",scode,"None",amount,"add share")
+        self.lock.acquire()
+        try:
+            assert self.unassigned_shares[scode] >= amount
+            self.portfolios[name].add_shares_from_pool(scode = scode,n = amount)
+            self.unassigned_shares[scode] -= amount
+            self.portfolios[name].add_trading_record("None",scode,"None",amount,"add share")
+        finally:
+            self.lock.release()
         
     def add_multi_shares_to(self,name,**sa):
         for s,a in sa.items():
@@ -151,10 +244,14 @@ class PortfolioMgr:
         amount (float): money in USD to be draw
         """
         assert name in self.portfolios
-        assert self.portfolios[name].bp >= amount
-        self.portfolios[name].bp -= amount
-        self.unassigned_bp += amount
-        self.portfolios[name].add_trading_record("None","None",amount,1,"draw bp")
+        self.lock.acquire()
+        try:
+            assert self.portfolios[name].bp >= amount
+            self.portfolios[name].change_bp(-amount)
+            self.unassigned_bp += amount
+            self.portfolios[name].add_trading_record("None","None",amount,1,"draw bp")
+        finally:
+            self.lock.release()
     
     def draw_shares_from(self,name,scode,amount):
         """
@@ -166,14 +263,16 @@ class PortfolioMgr:
         """
         assert name in self.portfolios
         amount = int(amount)
-        assert self.portfolios[name].shares_owned(scode) >= amount
-        self.portfolios[name].portfolio_record_lock.acquire()
-        self.portfolios[name].portfolio_record.loc[scode]["SHARES"] -= amount
-        if self.portfolios[name].portfolio_record.loc[scode]["SHARES"] == 0:
-            self.portfolios[name].portfolio_record = self.portfolios[name].portfolio_record.drop(scode)
-        self.portfolios[name].portfolio_record_lock.release()
-        self.unassigned_shares[scode] += amount
-        self.portfolios[name].add_trading_record("None",scode,"None",amount,"draw share")
+        p = self.portfolios[name]
+        self.lock.acquire()
+        try:
+            with p.symbol_locks(scode):
+                assert p.shares_owned(scode) >= amount
+                p.add_shares(scode,-amount)
+            self.unassigned_shares[scode] = self.unassigned_shares.get(scode,0) + amount
+            p.add_trading_record("None",scode,"None",amount,"draw share")
+        finally:
+            self.lock.release()
         
     
     def transfer_bp(self,from_name,to_name,amount):
@@ -200,6 +299,104 @@ class PortfolioMgr:
         assert to_name in self.portfolios
         self.portfolios[from_name].transfer_shares(self.portfolios[to_name],scode,amount)
 
+    def market_order(self,name,scode,n):
+        """
+        buy (n > 0) or sell (n < 0) shares at market for a portfolio, held back until the next net()
+
+        name (str): name of the portfolio
+        scode (str): symbol of the stock
+        n (int): shares, negative to sell
+        return (Future): resolves to (shares crossed with other portfolios, order placed for the rest or None)
+        """
+        assert name in self.portfolios
+        assert int(n) != 0
+        f = Future()
+        self.net_lock.acquire()
+        self.to_net.append((name,scode,int(n),f))
+        self.net_lock.release()
+        return f
+
+    def net(self):
+        """
+        net the orders collected by market_order
+
+        buys and sells of the same symbol by different portfolios are crossed at the last trade
+        price, booked by both portfolios as fills of type 'internal cross' (see Portfolio.cross_shares),
+        a buy and a sell of the same portfolio cancel out. only what is left is sent to the broker,
+        orders of a symbol without a quote are all sent as they are.
+
+        return (int): shares crossed
+        """
+        self.net_lock.acquire()
+        orders,self.to_net = self.to_net,[]
+        self.net_lock.release()
+        if not len(orders):
+            return 0
+        try:
+            return self.net_orders(orders)
+        except Exception as e:
+            # whatever was not settled yet fails, rather than waiting forever
+            for name,scode,n,f in orders:
+                if not f.done():
+                    f.set_exception(e)
+            self.log.error("netting of {} orders failed: {!r}",len(orders),e)
+            raise
+
+    def net_orders(self,orders):
+        by_scode = {}
+        for name,scode,n,f in orders:
+            by_scode.setdefault(scode,[]).append([name,n,f,0])
+        prices = dict(zip(by_scode,self.quotes.last_trade_price(*by_scode)))
+        total = 0
+        for scode,group in by_scode.items():
+            if not (np.isfinite(prices[scode]) and prices[scode] > 0):
+                self.log.warning("no quote for {}, its orders are sent without netting",scode,scode = scode)
+                continue
+            buys = [o for o in group if o[1] > 0]
+            sells = [o for o in group if o[1] < 0]
+            i = j = 0
+            while i < len(buys) and j < len(sells):
+                b,s = buys[i],sells[j]
+                q = min(b[1],-s[1])
+                if b[0] != s[0]:
+                    buyer,seller = self.portfolios[b[0]],self.portfolios[s[0]]
+                    if not buyer.cross_shares(seller,scode,q,prices[scode],oid = 'cross-{}'.format(next(self.crosses))):
+                        if seller.shares_owned(scode) < q:
+                            j += 1
+                        else:
+                            i += 1
+                        continue
+                    self.log.info("crossed {} shares of {} from {} to {} at {}",q,scode,s[0],b[0],prices[scode],scode = scode)
+                b[1] -= q
+                s[1] += q
+                b[3] += q
+                s[3] += q
+                total += q
+                if not b[1]:
+                    i += 1
+                if not s[1]:
+                    j += 1
+        if self.metrics is not None and total:
+            self.metrics.count('crossed_shares',total)
+        for scode,group in by_scode.items():
+            for name,n,f,crossed in group:
+                if not n:
+                    f.set_result((crossed,None))
+                    continue
+                p = self.portfolios[name]
+                placed = p.market_buy(scode,n) if n > 0 else p.market_sell(scode,-n)
+                placed.add_done_callback(lambda placed,f = f,crossed = crossed:PortfolioMgr.settle(f,crossed,placed))
+        return total
+
+    @staticmethod
+    def settle(f,crossed,placed):
+        if f.done():
+            return
+        if placed.exception() is None:
+            f.set_result((crossed,placed.result()))
+        else:
+            f.set_exception(placed.exception())
+
     def schedule(
         self,
         algo = None,
@@ -209,136 +406,255 @@ class PortfolioMgr:
         misc = None
         ):
         """
-        schedule an algorithm with this portfolio
+        schedule an algorithm with this portfolio, algo.method is called every freq minutes
+        while the market is open, at the same moments as the other algorithms of the same freq so
+        their market_order calls are netted together
         """
-        assert portfolio_name not in self.regisiter
+        assert portfolio_name not in self.regisiter or self.regisiter[portfolio_name][0] == 'RESTORED'
         assert algo is not None
         assert method is not None
         assert freq is not None
         p = self.portfolios[portfolio_name]
-        if "cancel_count" in misc:
+        if misc is not None and "cancel_count" in misc:
             p.cancel_count = misc["cancel_count"]
-        def worker():
-            p.confirm_order(loop = True)
-            while self.working_now:
-                try:
-                    algo.__getattribute__(method)(
-                        self,
-                        pname = portfolio_name,
-                        args = {
-                            "call_from_mgr" : True
-                        },
-                        misc = misc
-                        )
-                except AssertionError:
-                    p.unlock_all()
-                    p.log_lock.acquire()
-                    p.log.append("{}: Error Operation During Trading".format(Portfolio.get_time()))
-                    p.log_lock.release()
-                self.working_cv.acquire()
-                self.working_cv.wait(freq*60)
-                self.working_cv.release()
-            p.log_lock.acquire()
-            p.log.append("{}: {} worker stopped".format(Portfolio.get_time(),method))
-            p.log_lock.release()
-            p.unlock_all()
-            p.stop_confirm()
-            p.cancel_all_orders_in_queue()
-            self.regisiter[portfolio_name][0] = 'STOPED'
-        
-        self.regisiter[portfolio_name] = ["PENDING",worker]
+        def tick():
+            try:
+                algo.__getattribute__(method)(
+                    self,
+                    pname = portfolio_name,
+                    args = {
+                        "call_from_mgr" : True
+                    },
+                    misc = misc
+                    )
+            except AssertionError:
+                p.unlock_all()
+                p.log.error("Error Operation During Trading")
+            except Exception as e:
+                p.unlock_all()
+                p.log.error("{} failed: {!r}",method,e,traceback = traceback.format_exc())
+                raise
+        self.scheduler.add(portfolio_name,tick,freq*60,paused = True,align = True)
+        self.regisiter[portfolio_name] = ["PENDING",method]
         if self.working_now:
-            self.regisiter[portfolio_name] = ["STARTED",worker]
-            t = Thread(target = worker)
-            self.threads.append(t)
-            t.start()
-            p.log_lock.acquire()
-            p.log.append("{}: {} worker started".format(Portfolio.get_time(),method))
-            p.log_lock.release()
+            self.start_algo(portfolio_name)
+
+    def start_algo(self,*portfolio_names):
+        """
+        start (or resume) the scheduled algorithms of portfolios, algorithms started together tick together
+        """
+        for portfolio_name in portfolio_names:
+            self.portfolios[portfolio_name].confirm_order(loop = True)
+        self.scheduler.resume(*portfolio_names)
+        for portfolio_name in portfolio_names:
+            self.regisiter[portfolio_name][0] = 'STARTED'
+            self.portfolios[portfolio_name].log.info("{} worker started",self.regisiter[portfolio_name][1])
+
+    def stop_algo(self,portfolio_name):
+        """
+        pause the scheduled algorithm of a portfolio and cancel its pending orders
+        """
+        p = self.portfolios[portfolio_name]
+        self.scheduler.pause(portfolio_name)
+        p.log.info("{} worker stopped",self.regisiter[portfolio_name][1])
+        p.unlock_all()
+        p.stop_confirm()
+        p.cancel_all_orders_in_queue()
+        self.regisiter[portfolio_name][0] = 'STOPED'
+
+    def schedule_stats(self):
+        """
+        ticks, overruns and latency of every scheduled algorithm
+        """
+        return self.scheduler.stats()
+
+    def stats(self):
+        """
+        broker call latency histograms, error and retry counts, lock waits and queue depths of the
+        manager and every portfolio, empty unless created with metrics
+        """
+        if self.metrics is None:
+            return {}
+        return self.metrics.stats()
+
+    def dump_stats(self,path):
+        """
+        write the metrics to path in prometheus text format
+        """
+        assert self.metrics is not None
+        self.metrics.dump(path)
 
     def cnow(self):
         """
         begin to check the market hour, once every 900 secs 
         """
-        def worker():
-            while self.check_work_v:
-                check_work()
-                self.check_work_cv.acquire()
-                self.log.append("{}: check work cv waiting now".format(Portfolio.get_time()))
-                self.check_work_cv.wait(900)
-                self.log.append("{}: check work cv escaped")
-                self.check_work_cv.release()
+        self.scheduler.add("check_work",self.check_work,900)
+        self.log.info("check work scheduled")
                 
     def dnow(self):
         """
         stop checking the market hour
         """
-        self.check_work_v = False
-        self.log.append("{}: try down".format(Portfolio.get_time()))
-        self.check_work_cv.acquire()
-        self.check_work_cv.notify()
-        self.check_work_cv.release()
-        self.log.append("{}: down scuu".format(Portfolio.get_time()))
+        self.scheduler.remove("check_work")
+        self.log.info("check work stopped")
 
 
     def check_work(self):
         """
-        check the market hour, is market is open, all panding or stoped algorithm will start
-        """
-        if not len(self.portfolios):
-            self.working_now = False
-            self.working_cv.acquire()
-            self.working_cv.notifyAll()
-            self.working_cv.release()
-        if list(self.portfolios.values())[0].is_market_open():
-            self.working_now = True
-            for key in self.regisiter:
-                s,w = self.regisiter[key]
-                if s != 'STARTED':
-                    t = Thread(target = w)
-                    self.threads.append(t)
-                    t.start()
-                    self.regisiter[key][0] = 'STARTED'
-        else:
-            self.working_now = False
-            self.working_cv.acquire()
-            self.working_cv.notifyAll()
-            self.working_cv.release()
+        check the market hour, is market is open, all panding or stoped algorithm will start,
+        otherwise all started algorithm will be paused
+        """
+        self.working_now = self.calendar.is_open()
+        start = []
+        for key in self.regisiter:
+            if self.regisiter[key][0] == 'RESTORED':
+                continue
+            if self.working_now and self.regisiter[key][0] != 'STARTED':
+                start.append(key)
+            if not self.working_now and self.regisiter[key][0] == 'STARTED':
+                self.stop_algo(key)
+        if len(start):
+            self.start_algo(*start)
 
     def quit(self):
         """
         quit this s**t
         """
         self.working_now = False
-        self.check_work_v = False
-        self.check_work_cv.acquire()
-        self.check_work_cv.notify()
-        self.check_work_cv.release()
-        self.working_cv.acquire()
-        self.working_cv.notify()
-        self.working_cv.release()
-        while len(self.threads):
-            self.threads.pop().join()
+        self.scheduler.shutdown()
         for p in list(self.portfolios.values()):
             p.quit()
+        self.executor.shutdown()
+        if self.metrics_file is not None:
+            self.metrics.dump(self.metrics_file)
+        self.log.close()
 
-    def save(self,sav = None):
+    @staticmethod
+    def checkpoint_dir(sav):
         """
-        save
+        return (str|None): directory of the latest checkpoint in sav
+        """
+        pointer = os.path.join(sav,'CHECKPOINT')
+        if not os.path.exists(pointer):
+            return None
+        with open(pointer) as f:
+            return os.path.join(sav,f.read().strip())
+
+    def checkpoint(self,sav = None,workers = 8):
+        """
+        write every portfolio and the state of the manager as of one instant
+
+        the manager and all portfolios are locked just long enough to copy their state (no transfer
+        or fill is half way in), the copies are then written in parallel, one snapshot file per
+        portfolio, next to manager.json. the CHECKPOINT file is switched to the new checkpoint only
+        once everything is on disk, so a crash leaves the previous checkpoint in place.
+
+        sav (str|None): directory of the checkpoints, name of the manager by default
+        workers (int): portfolios written at the same time
+        return (str): directory of the checkpoint
         """
         if sav is None:
             sav = self.name
-        sav = sav + '/'
+        if not os.path.exists(sav):
+            os.makedirs(sav)
+        self.lock.acquire()
+        portfolios = dict(self.portfolios)
+        locks = Portfolio.state_locks(*portfolios.values())
+        for l in locks:
+            l.acquire()
+        try:
+            states = {name:p.capture() for name,p in portfolios.items()}
+            manager = {
+                'name' : self.name,
+                'unassigned_bp' : float(self.unassigned_bp),
+                'unassigned_shares' : {scode:float(n) for scode,n in self.unassigned_shares.items()},
+                'regisiter' : {name:[state,method] for name,(state,method) in self.regisiter.items()},
+                'portfolios' : {name:{'cancel_count' : float(p.cancel_count)} for name,p in portfolios.items()}
+            }
+        finally:
+            for l in reversed(locks):
+                l.release()
+            self.lock.release()
+
+        name = 'checkpoint-{:016d}'.format(now_us())
+        fdir = os.path.join(sav,name)
+        os.makedirs(fdir)
+        def write(pname):
+            os.mkdir(os.path.join(fdir,pname))
+            trading,portfolio,meta = states[pname]
+            Snapshot.write(os.path.join(fdir,pname,'portfolio.snap'),trading,portfolio,**meta)
+        with ThreadPoolExecutor(max_workers = max(1,int(workers))) as pool:
+            list(pool.map(write,states))
+        with open(os.path.join(fdir,'manager.json'),'w') as f:
+            json.dump(manager,f)
+            f.flush()
+            os.fsync(f.fileno())
+        pointer = os.path.join(sav,'CHECKPOINT')
+        with open(pointer+'.tmp','w') as f:
+            f.write(name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer+'.tmp',pointer)
+        for old in os.listdir(sav):
+            if old.startswith('checkpoint-') and old != name:
+                shutil.rmtree(os.path.join(sav,old),ignore_errors = True)
+        return fdir
+
+    def restore(self,fdir):
+        """
+        set the manager and its portfolios to a checkpoint, a journaling portfolio takes a fresh
+        journal snapshot right after, so recovering from its journal gives the restored state
+        """
+        with open(os.path.join(fdir,'manager.json')) as f:
+            manager = json.load(f)
+        self.lock.acquire()
+        try:
+            self.unassigned_bp = manager['unassigned_bp']
+            self.unassigned_shares = manager['unassigned_shares']
+            for name,state in manager['portfolios'].items():
+                pdir = os.path.join(fdir,name)
+                p = self.portfolios.get(name)
+                if p is None:
+                    # a journaling portfolio recovers its journal when created, the checkpoint is loaded over it below
+                    p = self.new_portfolio(name,0,state['cancel_count'],None if self.journal else pdir)
+                    self.portfolios[name] = p
+                    if p.journal is None:
+                        continue
+                p.state_lock.acquire()
+                try:
+                    p.load(savdir = pdir)
+                finally:
+                    p.state_lock.release()
+                p.reattach_orders()
+                if p.journal is not None:
+                    p.snapshot()
+            for name,(state,method) in manager['regisiter'].items():
+                if name not in self.regisiter:
+                    self.regisiter[name] = ['RESTORED',method]
+        finally:
+            self.lock.release()
+
+    def save(self,sav = None):
+        """
+        save, see checkpoint
+        """
+        self.checkpoint(sav)
+        self.log.open(os.path.join(self.name if sav is None else sav,'manager.log'))
+        self.log.flush()
         for k,p in self.portfolios.items():
-            p.save(root_name = sav)
+            if p.journal is not None:
+                p.journal.sync()
 
     def load(self,sav = None):
         """
-        load
+        load the latest checkpoint, or the portfolios one by one from saves of older versions
         """
         if sav is None:
             sav = self.name
+        fdir = PortfolioMgr.checkpoint_dir(sav)
+        if fdir is not None:
+            self.restore(fdir)
+            return
         sav = sav + '/'
         for k,p in self.portfolios.items():
             p.load(root_name = sav)
-        
\ No newline at end of file
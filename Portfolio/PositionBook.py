@@ -0,0 +1,243 @@
+import numpy as np
+import pandas as pd
+from threading import Lock
+
+
+class Position:
+    """
+    holding of one stock, a copy taken from the PositionBook
+    """
+    __slots__ = ('scode','shares','avg_cost')
+
+    def __init__(self,scode,shares,avg_cost):
+        self.scode = scode
+        self.shares = shares
+        self.avg_cost = avg_cost
+
+    def __repr__(self):
+        return "Position({},{},{})".format(self.scode,self.shares,self.avg_cost)
+
+
+class PositionSnapshot:
+    """
+    read only copy of a PositionBook at one point in time
+    """
+    __slots__ = ('scodes','shares','avg_cost','slots')
+
+    def __init__(self,scodes,shares,avg_cost):
+        self.scodes = scodes
+        self.shares = shares
+        self.avg_cost = avg_cost
+        self.slots = {scode:i for i,scode in enumerate(scodes)}
+        self.shares.flags.writeable = False
+        self.avg_cost.flags.writeable = False
+
+    def __len__(self):
+        return len(self.scodes)
+
+    def __contains__(self,scode):
+        return scode in self.slots
+
+    def shares_of(self,scode):
+        i = self.slots.get(scode)
+        if i is None:
+            return 0
+        return float(self.shares[i])
+
+    def cost_of(self,scode):
+        i = self.slots.get(scode)
+        if i is None:
+            return 0
+        return float(self.avg_cost[i])
+
+
+class LockStripes:
+    def __init__(self,n = 64,factory = Lock):
+        """
+        fixed set of locks shared out among symbols, two symbols only contend if they hash to the same stripe
+
+        n (int): number of locks
+        factory (function): creates one lock
+        """
+        self.locks = [factory() for _ in range(int(n))]
+
+    def __call__(self,scode):
+        return self.locks[hash(scode) % len(self.locks)]
+
+
+class PositionBook:
+    COLUMNS = ['AVG_COST','SHARES']
+
+    def __init__(self,capacity = 64):
+        """
+        holdings of a portfolio, one slot per symbol in contiguous numpy arrays
+
+        lookups and updates are O(1), a closed position is swapped with the last slot so the
+        arrays stay dense and can be valued with one dot product.
+        every method is atomic. readers should use snapshot(), which is copied once after each
+        change and then handed out without locking.
+
+        capacity (int): number of slots to preallocate
+        """
+        capacity = max(int(capacity),1)
+        self.slots = {}
+        self.scodes = []
+        self.shares = np.zeros(capacity,dtype = np.float64)
+        self.avg_cost = np.zeros(capacity,dtype = np.float64)
+        self.lock = Lock()
+        self.snap = None
+
+    def snapshot(self):
+        """
+        return (PositionSnapshot): holdings as of the last change
+        """
+        snap = self.snap
+        if snap is not None:
+            return snap
+        self.lock.acquire()
+        if self.snap is None:
+            n = len(self.scodes)
+            self.snap = PositionSnapshot(tuple(self.scodes),self.shares[:n].copy(),self.avg_cost[:n].copy())
+        snap = self.snap
+        self.lock.release()
+        return snap
+
+    def __len__(self):
+        return len(self.snapshot())
+
+    def __contains__(self,scode):
+        return scode in self.snapshot()
+
+    def __iter__(self):
+        return iter(self.snapshot().scodes)
+
+    def symbols(self):
+        """
+        symbols held, in slot order (the order of share_array and cost_array)
+        """
+        return list(self.snapshot().scodes)
+
+    def share_array(self):
+        return self.snapshot().shares
+
+    def cost_array(self):
+        return self.snapshot().avg_cost
+
+    def get(self,scode):
+        """
+        return (Position|None): holding of scode
+        """
+        snap = self.snapshot()
+        i = snap.slots.get(scode)
+        if i is None:
+            return None
+        return Position(scode,float(snap.shares[i]),float(snap.avg_cost[i]))
+
+    def shares_of(self,scode):
+        return self.snapshot().shares_of(scode)
+
+    def cost_of(self,scode):
+        return self.snapshot().cost_of(scode)
+
+    def set(self,scode,avg_cost,shares):
+        """
+        overwrite the holding of scode, a holding of 0 shares is removed
+        """
+        self.lock.acquire()
+        self.put(scode,avg_cost,shares)
+        self.lock.release()
+
+    def put(self,scode,avg_cost,shares):
+        self.snap = None
+        if shares == 0:
+            self.pop(scode)
+            return
+        i = self.slots.get(scode)
+        if i is None:
+            i = len(self.scodes)
+            if i == len(self.shares):
+                self.shares = np.concatenate([self.shares,np.zeros(i)])
+                self.avg_cost = np.concatenate([self.avg_cost,np.zeros(i)])
+            self.slots[scode] = i
+            self.scodes.append(scode)
+        self.shares[i] = shares
+        self.avg_cost[i] = avg_cost
+
+    def add(self,scode,amount,price = None):
+        """
+        add (amount > 0) or take away (amount < 0) shares of scode
+
+        added shares are averaged into the cost at price, taking shares away keeps the average cost
+        return (float): shares held afterwards
+        """
+        self.lock.acquire()
+        i = self.slots.get(scode)
+        if i is None:
+            hold,avg_cost = 0,0
+        else:
+            hold,avg_cost = self.shares[i],self.avg_cost[i]
+        neo_shares = hold + amount
+        if amount > 0 and price is not None:
+            avg_cost = (hold*avg_cost + amount*price)/neo_shares
+        self.put(scode,avg_cost,neo_shares)
+        self.lock.release()
+        return float(neo_shares)
+
+    def remove(self,scode):
+        self.lock.acquire()
+        self.pop(scode)
+        self.lock.release()
+
+    def pop(self,scode):
+        self.snap = None
+        i = self.slots.pop(scode,None)
+        if i is None:
+            return
+        last = len(self.scodes) - 1
+        if i != last:
+            moved = self.scodes[last]
+            self.scodes[i] = moved
+            self.slots[moved] = i
+            self.shares[i] = self.shares[last]
+            self.avg_cost[i] = self.avg_cost[last]
+        self.scodes.pop()
+        self.shares[last] = 0
+        self.avg_cost[last] = 0
+
+    def market_value(self,prices):
+        """
+        value of every holding
+
+        prices (np.array): prices in slot order
+        """
+        return float(np.dot(np.asarray(prices,dtype = np.float64),self.share_array()))
+
+    def to_frame(self):
+        snap = self.snapshot()
+        return pd.DataFrame(
+            {'AVG_COST' : snap.avg_cost.copy(),'SHARES' : snap.shares.copy()},
+            index = list(snap.scodes)
+        )
+
+    @classmethod
+    def from_arrays(cls,scodes,avg_cost,shares):
+        """
+        build a book from symbols and their average costs and shares, the arrays are copied
+        """
+        n = len(scodes)
+        book = cls(capacity = max(n,1))
+        book.scodes = list(scodes)
+        book.slots = {scode:i for i,scode in enumerate(book.scodes)}
+        book.shares[:n] = shares
+        book.avg_cost[:n] = avg_cost
+        return book
+
+    @classmethod
+    def from_frame(cls,df):
+        """
+        build a book from a DataFrame with AVG_COST and SHARES columns indexed by symbol
+        """
+        book = cls(capacity = len(df))
+        for scode,avg_cost,shares in zip(df.index,df['AVG_COST'],df['SHARES']):
+            book.set(scode,float(avg_cost),float(shares))
+        return book
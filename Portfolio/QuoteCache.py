@@ -0,0 +1,184 @@
+import numpy as np
+from threading import Event
+from threading import Lock
+from time import time
+from .Broker import as_broker
+
+
+class QuoteFlight:
+    """
+    one request for last trade prices that other threads can wait on,
+    prices holds what the request returned so waiters do not depend on the cache
+    """
+    __slots__ = ('done','error','prices')
+
+    def __init__(self):
+        self.done = Event()
+        self.error = None
+        self.prices = {}
+
+
+class QuoteCache:
+    def __init__(
+        self,
+        trader = None,
+        max_age = 1.0
+    ):
+        """
+        last trade prices shared by every portfolio of a manager
+
+        a price younger than max_age seconds is served from memory, the missing symbols of a call
+        are requested together in one trader.last_trade_price call, and a thread asking for a symbol
+        another thread is already requesting waits for that request instead of sending its own.
+
+        trader (Broker): broker to send requests, a Robinhood trader is wrapped into a RobinhoodBroker
+        max_age (float): seconds a price may be served from the cache
+        """
+        assert trader is not None
+        assert max_age >= 0
+        self.trader = as_broker(trader)
+        self.max_age = max_age
+        self.prices = {}
+        self.inflight = {}
+        self.async_flights = {}
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.requests = 0
+
+    def last_trade_price(self,*scodes):
+        """
+        return (np.array): last trade prices of scodes, in the same order,
+            nan for symbols the broker returned no price for
+        """
+        now = time()
+        res = {}
+        need = []
+        waits = set()
+        self.lock.acquire()
+        for scode in dict.fromkeys(scodes):
+            quote = self.prices.get(scode)
+            if quote is not None and now - quote[1] <= self.max_age:
+                self.hits += 1
+                res[scode] = quote[0]
+            elif scode in self.inflight:
+                self.coalesced += 1
+                waits.add(self.inflight[scode])
+            else:
+                self.misses += 1
+                need.append(scode)
+        flight = None
+        if len(need):
+            flight = QuoteFlight()
+            for scode in need:
+                self.inflight[scode] = flight
+            self.requests += 1
+        self.lock.release()
+
+        if flight is not None:
+            self.fetch(need,flight)
+            waits.add(flight)
+        for f in waits:
+            f.done.wait()
+            if f.error is not None:
+                raise f.error
+            for scode,price in f.prices.items():
+                res.setdefault(scode,price)
+        return np.array([res.get(scode,np.nan) for scode in scodes],dtype = np.float64)
+
+    def fetch(self,scodes,flight):
+        try:
+            flight.prices = self.store(scodes,self.trader.last_trade_price(','.join(scodes)))
+        except Exception as e:
+            flight.error = e
+        self.lock.acquire()
+        for scode in scodes:
+            if self.inflight.get(scode) is flight:
+                del self.inflight[scode]
+        self.lock.release()
+        flight.done.set()
+        if flight.error is not None:
+            raise flight.error
+
+    def store(self,scodes,rows):
+        """
+        put prices returned by trader.last_trade_price(','.join(scodes)) into the cache
+
+        rows come in the order of scodes, a shorter answer is matched on the symbol in each row
+
+        return (dict): scode -> price, symbols without a row are left out
+        """
+        stamp = time()
+        if len(rows) == len(scodes):
+            prices = {scode:float(row[0]) for scode,row in zip(scodes,rows)}
+        else:
+            wanted = set(scodes)
+            prices = {row[1]:float(row[0]) for row in rows if len(row) > 1 and row[1] in wanted}
+        self.lock.acquire()
+        for scode,price in prices.items():
+            self.prices[scode] = (price,stamp)
+        self.lock.release()
+        return prices
+
+    def cached(self,*scodes):
+        """
+        split scodes into fresh cached prices and symbols that have to be requested,
+        for callers that request prices on their own (e.g. from an event loop)
+
+        return (dict,list): scode -> price, missing scodes
+        """
+        now = time()
+        res = {}
+        missing = []
+        self.lock.acquire()
+        for scode in dict.fromkeys(scodes):
+            quote = self.prices.get(scode)
+            if quote is not None and now - quote[1] <= self.max_age:
+                self.hits += 1
+                res[scode] = quote[0]
+            else:
+                self.misses += 1
+                missing.append(scode)
+        self.lock.release()
+        return res,missing
+
+    def peek(self,*scodes):
+        """
+        return (dict): scode -> cached price no matter how old (nan if not cached), for symbols just stored
+        """
+        self.lock.acquire()
+        res = {scode:self.prices.get(scode,(np.nan,))[0] for scode in scodes}
+        self.lock.release()
+        return res
+
+    def get(self,scode):
+        """
+        return (float): last trade price of scode
+        """
+        return float(self.last_trade_price(scode)[0])
+
+    def invalidate(self,*scodes):
+        """
+        forget cached prices of scodes, or every price if none given
+        """
+        self.lock.acquire()
+        if len(scodes):
+            for scode in scodes:
+                self.prices.pop(scode,None)
+        else:
+            self.prices = {}
+        self.lock.release()
+
+    def stats(self):
+        """
+        hit/miss counters, coalesced counts symbols that waited on another thread's request
+        """
+        total = self.hits + self.misses + self.coalesced
+        return {
+            "hits" : self.hits,
+            "misses" : self.misses,
+            "coalesced" : self.coalesced,
+            "requests" : self.requests,
+            "hit_rate" : (self.hits + self.coalesced)/total if total else 0.0
+        }
@@ -1,18 +1,45 @@
+import logging
+import sqlite3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from threading import Lock
 from six.moves.urllib.parse import unquote
+from .Broker import as_broker
+
+logger = logging.getLogger(__name__)
+
+class Flight:
+    """
+    an in-flight request shared by every thread missing on the same query
+    """
+    __slots__ = ('done','result')
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
 
 class SIconverter:
     def __init__(
         self,
         buffer_size = 500,
         trader = None,
-        load = None
+        load = None,
+        readonly = False
         ):
         """
         Convert between stock symbol and instrument
 
+        cached symbols are evicted least frequently used first (least recently used among equals),
+        use counts are halved every buffer_size*8 queries so old favourites can age out.
+        every query costs O(1) (amortized) no matter how full the cache is.
+        safe to share between threads, concurrent misses on the same query send only one request.
+
         buffer_size (int): size of cache to be used to store information loaded from http request
-        trader (Robinhood): trader to send requests
-        load (None): None
+        trader (Broker): broker to send requests, a Robinhood trader is wrapped into a RobinhoodBroker
+        load (str|None): path to a sqlite index of (symbol,instrument) pairs, created if missing,
+            misses are written through to it and the cache is warmed from it on construction
+        readonly (bool): open the index read only, so several managers can share one file
         """
         assert trader is not None
         buffer_size = int(buffer_size)
@@ -21,59 +48,284 @@ class SIconverter:
         self.SI =  {}
         self.IS = {}
         self.count = {}
-        self.life = {}
-        self.freq = {}
-        self.trader = trader
+        self.buckets = {}
+        self.min_count = 0
+        self.age_period = buffer_size*8
+        self.queries = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_hits = 0
+        self.index_errors = 0
+        self.trader = as_broker(trader)
+        self.lock = Lock()
+        self.inflight = {}
 
-    def query_S2I(self,scode):
+        self.db = None
+        self.db_lock = Lock()
+        self.readonly = readonly
+        if load is not None:
+            self.open_index(load,readonly)
+
+    def open_index(self,path,readonly = False):
+        """
+        open the on disk index and warm the cache with up to buffer_size pairs from it
 
-        if scode not in self.SI:
-            try:
-                self.SI[scode] = unquote(self.trader.instruments(scode)['url'])
-            except:
-                return None
-            self.IS[self.SI[scode]] = scode
-            self.count[scode] = 0
-            self.life[scode] = 0
-        self.count[scode] += 1
-        self.update_all()
-        return self.SI[scode]
+        path (str): path to the sqlite file
+        readonly (bool): open without write access
+        """
+        if readonly:
+            self.db = sqlite3.connect("file:{}?mode=ro".format(path),uri = True,check_same_thread = False)
+        else:
+            self.db = sqlite3.connect(path,check_same_thread = False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS instruments (scode TEXT PRIMARY KEY, instrument TEXT NOT NULL UNIQUE)"
+            )
+            self.db.commit()
+        self.readonly = readonly
+        rows = self.db.execute("SELECT scode,instrument FROM instruments LIMIT ?",(self.buffer_size,)).fetchall()
+        self.lock.acquire()
+        for scode,instrument in rows:
+            self.insert(scode,instrument)
+        self.lock.release()
+
+    def index_get(self,column,value):
+        """
+        look a symbol or an instrument up in the on disk index
+
+        column (str): 'scode' or 'instrument'
+        value (str): the symbol or instrument to look for
+
+        an index that can not be read counts as a miss
+        """
+        if self.db is None:
+            return None
+        try:
+            with self.db_lock:
+                row = self.db.execute(
+                    "SELECT scode,instrument FROM instruments WHERE {} = ?".format(column),(value,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            self.index_errors += 1
+            logger.warning("instrument index lookup of %s failed: %r",value,e)
+            return None
+        if row is not None:
+            self.disk_hits += 1
+        return row
+
+    def index_put(self,scode,instrument):
+        """
+        write a pair resolved from http request through to the on disk index,
+        a failed write (locked or read only file, full disk) is logged and the pair is only cached
+        """
+        if self.db is None or self.readonly:
+            return
+        try:
+            with self.db_lock:
+                self.db.execute("INSERT OR REPLACE INTO instruments VALUES (?,?)",(scode,instrument))
+                self.db.commit()
+        except sqlite3.Error as e:
+            self.index_errors += 1
+            logger.warning("instrument index write of %s failed: %r",scode,e)
+
+    def close(self):
+        """
+        close the on disk index
+        """
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def fetch_S2I(self,scode):
+        """
+        resolve a symbol from the on disk index or by http request, without touching the cache
+
+        return (scode,instrument) or None
+        """
+        row = self.index_get('scode',scode)
+        if row is not None:
+            return row
+        try:
+            instrument = unquote(self.trader.instruments(scode)['url'])
+        except:
+            return None
+        self.index_put(scode,instrument)
+        return scode,instrument
+
+    def fetch_I2S(self,instrument):
+        """
+        resolve an instrument from the on disk index or by http request, without touching the cache
+
+        return (scode,instrument) or None
+        """
+        row = self.index_get('instrument',instrument)
+        if row is not None:
+            return row
+        try:
+            scode = self.trader.instrument_symbol(instrument)
+        except:
+            return None
+        self.index_put(scode,instrument)
+        return scode,instrument
+
+    def query(self,key,cached,fetch,pick):
+        """
+        look key up in the cache, on a miss resolve it with fetch, only one fetch per key runs at a time
+
+        key (str): symbol or instrument
+        cached (dict): self.SI or self.IS
+        fetch (function): self.fetch_S2I or self.fetch_I2S
+        pick (int): which element of the (scode,instrument) pair to return
+        """
+        self.lock.acquire()
+        if key in cached:
+            self.hits += 1
+            res = cached[key]
+            self.touch(key if pick else res)
+            self.lock.release()
+            return res
+        flight = self.inflight.get(key)
+        leader = flight is None
+        if leader:
+            flight = Flight()
+            self.inflight[key] = flight
+            self.misses += 1
+        self.lock.release()
+        if not leader:
+            flight.done.wait()
+            return flight.result
+        pair = None
+        try:
+            pair = fetch(key)
+        finally:
+            self.lock.acquire()
+            if pair is not None:
+                self.insert(*pair)
+                flight.result = pair[pick]
+            self.inflight.pop(key)
+            self.lock.release()
+            flight.done.set()
+        return flight.result
+
+    def query_S2I(self,scode):
+        return self.query(scode,self.SI,self.fetch_S2I,1)
 
     def query_I2S(self,instrument):
         if isinstance(instrument,dict):
             instrument = instrument['url']
-        if instrument not in self.IS:
-            try:
-                scode = self.trader.session.get(instrument).json()['symbol']
-            except:
-                return None
+        return self.query(instrument,self.IS,self.fetch_I2S,0)
+
+    def prefetch(self,queries,workers = 8):
+        """
+        resolve many symbols and/or instruments at once, misses are requested concurrently
+
+        queries (iterable): symbols, instrument urls or instrument dicts, duplicates are requested once
+        workers (int): maximum number of concurrent requests
+        return (dict): query -> converted value (None if it can not be resolved)
+        """
+        queries = list(dict.fromkeys(q['url'] if isinstance(q,dict) else q for q in queries))
+        self.lock.acquire()
+        misses = [q for q in queries if q not in self.SI and q not in self.IS]
+        self.lock.release()
+        res = {}
+        if len(misses):
+            with ThreadPoolExecutor(max_workers = max(1,min(int(workers),len(misses)))) as pool:
+                res.update(zip(misses,pool.map(self,misses)))
+        for q in queries:
+            if q not in res:
+                res[q] = self(q)
+        return res
+
+    def insert(self,scode,instrument):
+        """
+        put a new (symbol,instrument) pair into the cache, evict one entry if the cache is full
+        caller must hold self.lock
+
+        scode (str): symbol of stock
+        instrument (str): url of the instrument
+        """
+        if scode in self.SI:
+            self.IS.pop(self.SI[scode],None)
             self.SI[scode] = instrument
             self.IS[instrument] = scode
-            self.count[scode] = 0
-            self.life[scode] = 0
-        scode = self.IS[instrument]
-        self.count[scode] += 1
-        self.update_all()
-        return scode
-
-    def update_all(self):
-        for key in self.life:
-            self.life[key] += 1
-            self.freq[key] = self.count[key]/self.life[key]
-        if len(self.freq) > self.buffer_size:
-            argmin = min(self.freq,key = self.freq.get)
-            self.IS.pop(self.SI[argmin])
-            self.SI.pop(argmin)
-            self.count.pop(argmin)
-            self.life.pop(argmin)
-            self.freq.pop(argmin)
+            self.touch(scode)
+            return
+        if len(self.SI) >= self.buffer_size:
+            self.evict()
+        self.SI[scode] = instrument
+        self.IS[instrument] = scode
+        self.count[scode] = 1
+        self.buckets.setdefault(1,OrderedDict())[scode] = None
+        self.min_count = 1
+        self.tick()
 
-    def __call__(self,query):
-        if query.find("https:") == 0:
-            return self.query_I2S(query)
-        return self.query_S2I(query)
+    def touch(self,scode):
+        """
+        move a cached symbol from its use count bucket to the next one
+        """
+        c = self.count[scode]
+        bucket = self.buckets[c]
+        del bucket[scode]
+        if not len(bucket):
+            del self.buckets[c]
+            if self.min_count == c:
+                self.min_count = c+1
+        self.count[scode] = c+1
+        self.buckets.setdefault(c+1,OrderedDict())[scode] = None
+        self.tick()
 
+    def evict(self):
+        """
+        drop the least frequently used symbol, oldest first among ties
+        """
+        bucket = self.buckets[self.min_count]
+        scode,_ = bucket.popitem(last = False)
+        if not len(bucket):
+            del self.buckets[self.min_count]
+            self.min_count = min(self.buckets) if len(self.buckets) else 0
+        self.IS.pop(self.SI.pop(scode),None)
+        self.count.pop(scode)
+        self.evictions += 1
 
+    def tick(self):
+        self.queries += 1
+        if self.queries % self.age_period == 0:
+            self.age()
 
+    def age(self):
+        """
+        halve every use count, runs once every age_period queries so the cost is O(1) amortized
+        """
+        buckets = {}
+        for c in sorted(self.buckets):
+            neo_c = max(c//2,1)
+            neo_bucket = buckets.setdefault(neo_c,OrderedDict())
+            for scode in self.buckets[c]:
+                neo_bucket[scode] = None
+                self.count[scode] = neo_c
+        self.buckets = buckets
+        self.min_count = min(self.buckets) if len(self.buckets) else 0
 
+    def stats(self):
+        """
+        hit/miss/eviction counters of the cache
+        """
+        self.lock.acquire()
+        size = len(self.SI)
+        self.lock.release()
+        total = self.hits + self.misses
+        return {
+            "size" : size,
+            "hits" : self.hits,
+            "misses" : self.misses,
+            "evictions" : self.evictions,
+            "disk_hits" : self.disk_hits,
+            "index_errors" : self.index_errors,
+            "hit_rate" : self.hits/total if total else 0.0
+        }
 
+    def __call__(self,query):
+        if query.find("https:") == 0:
+            return self.query_I2S(query)
+        return self.query_S2I(query)
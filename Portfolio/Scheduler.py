@@ -0,0 +1,211 @@
+import heapq
+import logging
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from threading import Condition
+from threading import Thread
+from time import monotonic
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """
+    a function run by the Scheduler every period seconds
+    """
+    __slots__ = (
+        'name','fn','period','align','next_run','seq','paused','removed','running',
+        'ticks','overruns','errors','latency','lateness'
+    )
+
+    def __init__(self,name,fn,period,align = False):
+        self.name = name
+        self.fn = fn
+        self.period = period
+        self.align = align
+        self.next_run = 0
+        self.seq = 0
+        self.paused = False
+        self.removed = False
+        self.running = False
+        self.ticks = 0
+        self.overruns = 0
+        self.errors = 0
+        self.latency = deque(maxlen = 100)
+        self.lateness = deque(maxlen = 100)
+
+
+class Scheduler:
+    def __init__(self,workers = 4,after_cycle = None):
+        """
+        runs jobs at fixed cadences from one timer thread on a bounded pool of workers
+
+        ticks are scheduled from the previous scheduled time, not from when the previous tick ended,
+        so cadences dont drift. a tick that is due while the previous tick of the same job is still
+        running is skipped and counted as an overrun. paused jobs keep their registration and
+        resume without creating threads. the ticks started together form a cycle, after_cycle is
+        called once all ticks of a cycle (and of cycles started while it ran) have returned.
+
+        workers (int): number of ticks running at the same time
+        after_cycle (function|None): called without arguments, on the worker of the last tick
+        """
+        self.workers = int(workers)
+        assert self.workers > 0
+        self.after_cycle = after_cycle
+        self.outstanding = 0
+        self.jobs = {}
+        self.heap = []
+        self.seq = count()
+        self.cv = Condition()
+        self.pool = ThreadPoolExecutor(max_workers = self.workers,thread_name_prefix = 'tick')
+        self.running = True
+        self.thread = Thread(target = self.loop,daemon = True)
+        self.thread.start()
+
+    def add(self,name,fn,period,delay = 0,paused = False,align = False):
+        """
+        register fn to be called every period seconds
+
+        name (str): name of the job, must be unique
+        fn (function): called without arguments
+        period (float): seconds between two ticks
+        delay (float): seconds before the first tick
+        paused (bool): register without running it until resume
+        align (bool): tick at multiples of period after the first tick, so aligned jobs of the same
+            period tick together
+        return (Job)
+        """
+        assert period > 0
+        job = Job(name,fn,float(period),align)
+        job.paused = paused
+        self.cv.acquire()
+        assert name not in self.jobs
+        self.jobs[name] = job
+        if not paused:
+            job.next_run = monotonic() + delay
+            self.push(job)
+        self.cv.release()
+        return job
+
+    def push(self,job):
+        job.seq = next(self.seq)
+        heapq.heappush(self.heap,(job.next_run,job.seq,job))
+        self.cv.notify()
+
+    def remove(self,name):
+        self.cv.acquire()
+        job = self.jobs.pop(name,None)
+        if job is not None:
+            job.removed = True
+        self.cv.release()
+
+    def pause(self,name):
+        """
+        stop ticking a job, a running tick is allowed to finish
+        """
+        self.cv.acquire()
+        job = self.jobs.get(name)
+        if job is not None:
+            job.paused = True
+        self.cv.release()
+
+    def resume(self,*names,delay = 0):
+        """
+        restart paused jobs, their next tick runs after delay seconds, jobs resumed together tick together
+        """
+        self.cv.acquire()
+        when = monotonic() + delay
+        for name in names:
+            job = self.jobs.get(name)
+            if job is not None and job.paused:
+                job.paused = False
+                job.next_run = when
+                self.push(job)
+        self.cv.release()
+
+    def is_paused(self,name):
+        return self.jobs[name].paused
+
+    def loop(self):
+        self.cv.acquire()
+        while self.running:
+            if not len(self.heap):
+                self.cv.wait()
+                continue
+            next_run,seq,job = self.heap[0]
+            now = monotonic()
+            if next_run > now:
+                self.cv.wait(next_run - now)
+                continue
+            heapq.heappop(self.heap)
+            if job.removed or job.paused or job.seq != seq:
+                continue
+            if job.running:
+                job.overruns += 1
+            else:
+                job.running = True
+                self.outstanding += 1
+                self.pool.submit(self.run,job,next_run)
+            if job.align:
+                job.next_run = (next_run//job.period + 1)*job.period
+            else:
+                job.next_run = next_run + job.period
+            if job.next_run <= now:
+                missed = int((now - job.next_run)//job.period) + 1
+                job.overruns += missed
+                job.next_run += missed*job.period
+            self.push(job)
+        self.cv.release()
+
+    def run(self,job,scheduled):
+        start = monotonic()
+        try:
+            job.fn()
+        except Exception:
+            job.errors += 1
+            logger.exception("tick of %s failed",job.name)
+        finally:
+            end = monotonic()
+            job.ticks += 1
+            job.latency.append(end - start)
+            job.lateness.append(start - scheduled)
+            job.running = False
+        self.cv.acquire()
+        self.outstanding -= 1
+        last = self.outstanding == 0
+        self.cv.release()
+        if last and self.after_cycle is not None:
+            try:
+                self.after_cycle()
+            except Exception:
+                logger.exception("after_cycle failed")
+
+    def stats(self):
+        """
+        per job tick count, overruns, errors, run time and start delay over the last 100 ticks, in sec
+        """
+        res = {}
+        for name,job in list(self.jobs.items()):
+            latency = np.array(job.latency)
+            lateness = np.array(job.lateness)
+            res[name] = {
+                "paused" : job.paused,
+                "ticks" : job.ticks,
+                "overruns" : job.overruns,
+                "errors" : job.errors,
+                "latency_mean" : float(latency.mean()) if len(latency) else 0.0,
+                "latency_max" : float(latency.max()) if len(latency) else 0.0,
+                "lateness_mean" : float(lateness.mean()) if len(lateness) else 0.0,
+                "lateness_max" : float(lateness.max()) if len(lateness) else 0.0
+            }
+        return res
+
+    def shutdown(self,wait = True):
+        self.cv.acquire()
+        self.running = False
+        self.cv.notify()
+        self.cv.release()
+        self.thread.join()
+        self.pool.shutdown(wait = wait)
@@ -0,0 +1,331 @@
+import itertools
+import random
+from collections import Counter
+from threading import Lock
+from time import sleep
+from time import time
+from .Broker import Broker
+
+
+class ManualClock:
+    """
+    clock that only moves when told to, makes a SimBroker fully deterministic
+    """
+
+    def __init__(self,start = 0.0):
+        self.t = float(start)
+
+    def __call__(self):
+        return self.t
+
+    def advance(self,dt):
+        self.t += dt
+
+
+class SimOrder:
+    """
+    order living in a SimBroker, offers what Portfolio uses of a Robinhood order
+    """
+
+    def __init__(self,broker,order,plan,next_fill):
+        """
+        broker (SimBroker): the exchange holding the order
+        order (dict): state of the order, as returned by check()
+        plan (list): sizes of the executions still to come
+        next_fill (float): broker clock time the next execution is due
+        """
+        self.broker = broker
+        self.order = order
+        self.plan = plan
+        self.next_fill = next_fill
+        self.triggered = order['trigger'] == 'immediate'
+
+    def check(self):
+        return self.broker.check(self)
+
+    def cancel(self):
+        return self.broker.cancel(self)
+
+
+class SimBroker(Broker):
+    INSTRUMENT_URL = 'https://api.robinhood.com/instruments/{}/'
+    TERMINAL = ('filled','cancelled','rejected')
+
+    def __init__(
+        self,
+        cash = 100000.0,
+        prices = None,
+        positions = None,
+        fill_latency = 0.0,
+        partial_fills = 1,
+        reject_rate = 0.0,
+        latency = 0.0,
+        seed = 0,
+        clock = None,
+        default_price = 100.0
+    ):
+        """
+        in process exchange simulating a broker account, for tests and benchmarks
+
+        an order starts executing fill_latency seconds (of clock) after it is placed, once it is
+        marketable (limit price reached, stop triggered), and is executed in up to partial_fills
+        executions, fill_latency apart. orders are only moved forward when checked, so with a
+        ManualClock the whole run is deterministic.
+
+        cash (float): buying power of the account
+        prices (dict|None): symbol -> last trade price
+        positions (dict|None): symbol -> (shares,average cost) already owned
+        fill_latency (float): seconds between placing an order and each of its executions
+        partial_fills (int): number of executions an order is split into
+        reject_rate (float): probability an order is rejected when placed (drawn from seed),
+            buy orders the cash can not cover are always rejected
+        latency (float|function): seconds slept on every call, or function(endpoint) -> seconds
+        seed (int): seed of the random rejections
+        clock (function|None): returns the current time in seconds, time.time by default
+        default_price (float): last trade price of symbols missing from prices
+        """
+        assert partial_fills >= 1
+        assert 0 <= reject_rate <= 1
+        self.cash = float(cash)
+        self.prices = dict(prices or {})
+        self.positions = {scode:[float(n),float(c)] for scode,(n,c) in (positions or {}).items()}
+        self.fill_latency = float(fill_latency)
+        self.partial_fills = int(partial_fills)
+        self.reject_rate = reject_rate
+        self.latency = latency
+        self.rng = random.Random(seed)
+        self.clock = time if clock is None else clock
+        self.default_price = float(default_price)
+        self.orders = {}
+        self.ids = itertools.count()
+        self.calls = Counter()
+        self.lock = Lock()
+
+    def call(self,endpoint):
+        """
+        count a call and inject its latency
+        """
+        self.calls[endpoint] += 1
+        latency = self.latency(endpoint) if callable(self.latency) else self.latency
+        if latency > 0:
+            sleep(latency)
+
+    def set_price(self,scode,price):
+        """
+        move the last trade price of a symbol
+        """
+        self.lock.acquire()
+        self.prices[scode] = float(price)
+        self.lock.release()
+
+    def price_of(self,scode):
+        return self.prices.get(scode,self.default_price)
+
+    def get_account(self):
+        self.call('get_account')
+        return {'margin_balances' : {'unallocated_margin_cash' : str(self.cash)}}
+
+    def securities_owned(self):
+        self.call('securities_owned')
+        self.lock.acquire()
+        res = [
+            {
+                'instrument' : self.INSTRUMENT_URL.format(scode),
+                'quantity' : str(n),
+                'average_buy_price' : str(c)
+            } for scode,(n,c) in self.positions.items() if n > 0
+        ]
+        self.lock.release()
+        return {'results' : res}
+
+    def instruments(self,scode):
+        self.call('instruments')
+        return {'url' : self.INSTRUMENT_URL.format(scode),'symbol' : scode}
+
+    def instrument_symbol(self,instrument):
+        self.call('instrument_symbol')
+        return instrument.rstrip('/').split('/')[-1]
+
+    def last_trade_price(self,scodes):
+        self.call('last_trade_price')
+        self.lock.acquire()
+        res = [[self.price_of(scode),scode] for scode in scodes.split(',')]
+        self.lock.release()
+        return res
+
+    def market_hours(self,market,day):
+        """
+        open 13:30 to 20:00 UTC on weekdays, the simulator has no clock skew to report
+        """
+        self.call('market_hours')
+        if day.weekday() >= 5:
+            return {'is_open' : False,'opens_at' : None,'closes_at' : None},None
+        return {
+            'is_open' : True,
+            'opens_at' : '{}T13:30:00Z'.format(day.isoformat()),
+            'closes_at' : '{}T20:00:00Z'.format(day.isoformat())
+        },None
+
+    def place(self,side,kind,scode,n,price = None,stop_price = None,time_in_force = 'gtc'):
+        """
+        put an order into the book
+
+        side (str): buy or sell
+        kind (str): market, limit, stop_loss or stop_limit
+        return (SimOrder): the order, possibly already rejected
+        """
+        self.call('place_{}_{}_order'.format(kind,side))
+        n = int(n)
+        assert n > 0
+        self.lock.acquire()
+        now = self.clock()
+        if price is None and kind == 'stop_limit':
+            price = stop_price
+        order = {
+            'id' : str(next(self.ids)),
+            'instrument' : self.INSTRUMENT_URL.format(scode),
+            'symbol' : scode,
+            'side' : side,
+            'type' : 'limit' if kind in ('limit','stop_limit') else 'market',
+            'trigger' : 'stop' if kind.startswith('stop') else 'immediate',
+            'price' : None if price is None else str(price),
+            'stop_price' : None if stop_price is None else str(stop_price),
+            'quantity' : str(n),
+            'cumulative_quantity' : '0',
+            'time_in_force' : time_in_force,
+            'state' : 'confirmed',
+            'executions' : [],
+            'created_at' : now
+        }
+        k = min(self.partial_fills,n)
+        plan = [n//k + (1 if i < n % k else 0) for i in range(k)]
+        if self.rng.random() < self.reject_rate:
+            order['state'] = 'rejected'
+        elif side == 'buy' and self.cash < n*float(order['price'] or self.price_of(scode)):
+            order['state'] = 'rejected'
+        sim = SimOrder(self,order,plan,now + self.fill_latency)
+        self.orders[order['id']] = sim
+        self.lock.release()
+        return sim
+
+    def fill_price(self,sim):
+        """
+        price the order executes at now, None if it is not marketable
+        caller must hold self.lock
+        """
+        d = sim.order
+        last = self.price_of(d['symbol'])
+        buy = d['side'] == 'buy'
+        if not sim.triggered:
+            stop = float(d['stop_price'])
+            if (buy and last < stop) or (not buy and last > stop):
+                return None
+            sim.triggered = True
+        if d['type'] == 'limit':
+            limit = float(d['price'])
+            if (buy and last > limit) or (not buy and last < limit):
+                return None
+        return last
+
+    def execute(self,sim,n,price):
+        """
+        apply one execution to the order and to the account
+        caller must hold self.lock
+        """
+        d = sim.order
+        scode = d['symbol']
+        d['executions'].append({
+            'id' : '{}-{}'.format(d['id'],len(d['executions'])),
+            'price' : str(price),
+            'quantity' : str(n),
+            'timestamp' : self.clock()
+        })
+        cum = float(d['cumulative_quantity']) + n
+        d['cumulative_quantity'] = str(cum)
+        d['state'] = 'filled' if not len(sim.plan) else 'partially_filled'
+        shares,cost = self.positions.get(scode,(0.0,0.0))
+        if d['side'] == 'buy':
+            self.cash -= n*price
+            self.positions[scode] = [shares + n,(shares*cost + n*price)/(shares + n)]
+        else:
+            self.cash += n*price
+            self.positions[scode] = [shares - n,cost]
+
+    def advance(self,sim):
+        """
+        execute whatever became due for an order since it was last looked at
+        caller must hold self.lock
+        """
+        if sim.order['state'] in self.TERMINAL:
+            return
+        now = self.clock()
+        while len(sim.plan) and now >= sim.next_fill:
+            price = self.fill_price(sim)
+            if price is None:
+                return
+            n = sim.plan.pop(0)
+            self.execute(sim,n,price)
+            sim.next_fill += self.fill_latency
+
+    def snapshot(self,sim):
+        d = dict(sim.order)
+        d['executions'] = [dict(e) for e in d['executions']]
+        return d
+
+    def check(self,sim):
+        self.call('check')
+        self.lock.acquire()
+        self.advance(sim)
+        d = self.snapshot(sim)
+        self.lock.release()
+        return d
+
+    def check_orders(self,orders):
+        """
+        state of many orders with one call
+        """
+        self.call('check_orders')
+        self.lock.acquire()
+        res = []
+        for sim in orders:
+            self.advance(sim)
+            res.append(self.snapshot(sim))
+        self.lock.release()
+        return res
+
+    def cancel(self,sim):
+        self.call('cancel')
+        self.lock.acquire()
+        self.advance(sim)
+        if sim.order['state'] not in self.TERMINAL:
+            sim.order['state'] = 'cancelled'
+            sim.plan = []
+        self.lock.release()
+
+    def get_order(self,oid):
+        self.call('get_order')
+        return self.orders.get(str(oid))
+
+    def place_market_buy_order(self,instrument,scode,n,time_in_force = 'gfd'):
+        return self.place('buy','market',scode,n,time_in_force = time_in_force)
+
+    def place_market_sell_order(self,instrument,scode,n,time_in_force = 'gfd'):
+        return self.place('sell','market',scode,n,time_in_force = time_in_force)
+
+    def place_limit_buy_order(self,instrument,scode,n,price = None,time_in_force = 'gtc'):
+        return self.place('buy','limit',scode,n,price = price,time_in_force = time_in_force)
+
+    def place_limit_sell_order(self,instrument,scode,n,price = None,time_in_force = 'gtc'):
+        return self.place('sell','limit',scode,n,price = price,time_in_force = time_in_force)
+
+    def place_stop_loss_buy_order(self,instrument,scode,n,stop_price = None,time_in_force = 'gtc'):
+        return self.place('buy','stop_loss',scode,n,stop_price = stop_price,time_in_force = time_in_force)
+
+    def place_stop_loss_sell_order(self,instrument,scode,n,stop_price = None,time_in_force = 'gtc'):
+        return self.place('sell','stop_loss',scode,n,stop_price = stop_price,time_in_force = time_in_force)
+
+    def place_stop_limit_buy_order(self,instrument,scode,n,stop_price = None,time_in_force = 'gtc'):
+        return self.place('buy','stop_limit',scode,n,stop_price = stop_price,time_in_force = time_in_force)
+
+    def place_stop_limit_sell_order(self,instrument,scode,n,stop_price = None,time_in_force = 'gtc'):
+        return self.place('sell','stop_limit',scode,n,stop_price = stop_price,time_in_force = time_in_force)
@@ -0,0 +1,119 @@
+import json
+import os
+import struct
+import numpy as np
+from .PositionBook import PositionBook
+from .TradeLedger import TradeLedger
+
+
+class Snapshot:
+    MAGIC = b'RHPS'
+    VERSION = 1
+    # magic, version, length of the json header
+    HEADER = struct.Struct('<4sHI')
+    ALIGN = 64
+    LEDGER = [
+        ('side','int8'),
+        ('scode','int32'),
+        ('price','float64'),
+        ('amount','float64'),
+        ('order_type','int16'),
+        ('time','int64')
+    ]
+    BOOK = [
+        ('avg_cost','float64'),
+        ('shares','float64')
+    ]
+
+    def __init__(self,ledger,book,meta):
+        """
+        state of a portfolio as stored in a snapshot file
+
+        ledger (TradeLedger): trading record
+        book (PositionBook): positions
+        meta (dict): everything else (bp, journal sequence number, open orders, ...), json serializable
+        """
+        self.ledger = ledger
+        self.book = book
+        self.meta = meta
+
+    @staticmethod
+    def pad(n):
+        return -n % Snapshot.ALIGN
+
+    @classmethod
+    def write(cls,path,ledger,book,**meta):
+        """
+        write ledger, book and meta to one binary file, atomically (written aside, fsynced, then renamed)
+
+        the file is a fixed header, a json header (string tables, metadata, where each column is)
+        and the raw numpy columns, each aligned to 64 bytes so they can be memory mapped as they are
+        """
+        cols = ledger.columns()
+        snap = book.snapshot()
+        arrays = [('ledger.'+name,np.ascontiguousarray(cols[name]).view(dtype)) for name,dtype in cls.LEDGER]
+        arrays += [('book.avg_cost',snap.avg_cost),('book.shares',snap.shares)]
+        layout = []
+        offset = 0
+        for name,arr in arrays:
+            layout.append({'name' : name,'dtype' : arr.dtype.str,'count' : len(arr),'offset' : offset})
+            offset += arr.nbytes + cls.pad(arr.nbytes)
+        head = json.dumps({
+            'columns' : layout,
+            'sides' : cols['sides'],
+            'scodes' : cols['scodes'],
+            'order_types' : cols['order_types'],
+            'positions' : list(snap.scodes),
+            'meta' : meta
+        }).encode('utf-8')
+        head += b' '*cls.pad(cls.HEADER.size + len(head))
+        tmp = '{}.tmp'.format(path)
+        with open(tmp,'wb') as f:
+            f.write(cls.HEADER.pack(cls.MAGIC,cls.VERSION,len(head)))
+            f.write(head)
+            for name,arr in arrays:
+                f.write(arr.tobytes())
+                f.write(b'\0'*cls.pad(arr.nbytes))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp,path)
+
+    @classmethod
+    def read(cls,path,mmap = True):
+        """
+        load a snapshot file
+
+        mmap (bool): map the ledger columns from the file instead of reading them, they are
+            copied only when the ledger is appended to
+        return (Snapshot)
+        """
+        with open(path,'rb') as f:
+            magic,version,n = cls.HEADER.unpack(f.read(cls.HEADER.size))
+            if magic != cls.MAGIC:
+                raise ValueError("{} is not a portfolio snapshot".format(path))
+            if version > cls.VERSION:
+                raise ValueError("snapshot version {} of {} is newer than supported ({})".format(version,path,cls.VERSION))
+            head = json.loads(f.read(n).decode('utf-8'))
+        base = cls.HEADER.size + n
+        if mmap and os.path.getsize(path) > base:
+            data = np.memmap(path,dtype = np.uint8,mode = 'r')
+        else:
+            data = np.fromfile(path,dtype = np.uint8)
+        arrays = {}
+        for col in head['columns']:
+            dtype = np.dtype(col['dtype'])
+            start = base + col['offset']
+            arrays[col['name']] = data[start:start + dtype.itemsize*col['count']].view(dtype)
+        ledger = TradeLedger.from_columns({
+            'side' : arrays['ledger.side'],
+            'scode' : arrays['ledger.scode'],
+            'price' : arrays['ledger.price'],
+            'amount' : arrays['ledger.amount'],
+            'order_type' : arrays['ledger.order_type'],
+            'time' : arrays['ledger.time'].view('datetime64[us]'),
+            'sides' : head['sides'],
+            'scodes' : head['scodes'],
+            'order_types' : head['order_types']
+        })
+        book = PositionBook.from_arrays(head['positions'],arrays['book.avg_cost'],arrays['book.shares'])
+        return cls(ledger,book,head['meta'])
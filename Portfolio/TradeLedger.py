@@ -0,0 +1,163 @@
+import datetime
+import numpy as np
+import pandas as pd
+from threading import Lock
+
+
+class TradeLedger:
+    COLUMNS = ["SIDE","SCODE","PRICE","AMOUNT","ORDER_TYPE"]
+
+    def __init__(self,capacity = 1024):
+        """
+        append only trading record stored column by column
+
+        strings (side, symbol, order type) are stored as small integer codes, prices, amounts
+        and timestamps in typed numpy arrays that double in size when full,
+        so an append costs O(1) amortized. safe to append from several threads.
+
+        capacity (int): number of records to preallocate
+        """
+        capacity = max(int(capacity),1)
+        self.size = 0
+        self.side = np.empty(capacity,dtype = np.int8)
+        self.scode = np.empty(capacity,dtype = np.int32)
+        self.price = np.empty(capacity,dtype = np.float64)
+        self.amount = np.empty(capacity,dtype = np.float64)
+        self.order_type = np.empty(capacity,dtype = np.int16)
+        self.time = np.empty(capacity,dtype = 'datetime64[us]')
+        self.sides = []
+        self.scodes = []
+        self.order_types = []
+        self.codes = ({},{},{})
+        self.lock = Lock()
+
+    def __len__(self):
+        return self.size
+
+    def code(self,which,values,value):
+        value = str(value)
+        codes = self.codes[which]
+        c = codes.get(value)
+        if c is None:
+            c = len(values)
+            codes[value] = c
+            values.append(value)
+        return c
+
+    def grow(self):
+        capacity = len(self.side)*2
+        for col in ['side','scode','price','amount','order_type','time']:
+            old = getattr(self,col)
+            neo = np.empty(capacity,dtype = old.dtype)
+            neo[:self.size] = old[:self.size]
+            setattr(self,col,neo)
+
+    def append(self,side,scode,price,amount,order_type,when = None):
+        """
+        add a record
+
+        side (str): buy, sell or None for bookkeeping records
+        scode (str): symbol of stock
+        price (float|str): price, anything not convertible to float is stored as nan
+        amount (float): shares (or money for buying power records)
+        order_type (str): type of the order or the bookkeeping operation
+        when (datetime|None): time of the record, now by default
+        """
+        if when is None:
+            when = datetime.datetime.now()
+        try:
+            price = float(price)
+        except (TypeError,ValueError):
+            price = np.nan
+        self.lock.acquire()
+        if self.size == len(self.side):
+            self.grow()
+        i = self.size
+        self.side[i] = self.code(0,self.sides,side)
+        self.scode[i] = self.code(1,self.scodes,scode)
+        self.price[i] = price
+        self.amount[i] = amount
+        self.order_type[i] = self.code(2,self.order_types,order_type)
+        self.time[i] = when
+        self.size += 1
+        self.lock.release()
+
+    def to_frame(self):
+        """
+        the records as a DataFrame indexed by time, numeric columns are views of the ledger
+        """
+        self.lock.acquire()
+        n = self.size
+        sides = list(self.sides)
+        scodes = list(self.scodes)
+        order_types = list(self.order_types)
+        cols = (self.side[:n],self.scode[:n],self.price[:n],self.amount[:n],self.order_type[:n],self.time[:n])
+        self.lock.release()
+        side,scode,price,amount,order_type,when = cols
+        return pd.DataFrame(
+            {
+                "SIDE" : pd.Categorical.from_codes(side,categories = sides),
+                "SCODE" : pd.Categorical.from_codes(scode,categories = scodes),
+                "PRICE" : price,
+                "AMOUNT" : amount,
+                "ORDER_TYPE" : pd.Categorical.from_codes(order_type,categories = order_types)
+            },
+            index = pd.DatetimeIndex(when),
+            copy = False
+        )
+
+    def columns(self):
+        """
+        the records as they are stored
+
+        return (dict): side, scode, price, amount, order_type, time arrays (views of the ledger)
+            and the sides, scodes, order_types lists their codes refer to
+        """
+        self.lock.acquire()
+        n = self.size
+        res = {
+            "side" : self.side[:n],
+            "scode" : self.scode[:n],
+            "price" : self.price[:n],
+            "amount" : self.amount[:n],
+            "order_type" : self.order_type[:n],
+            "time" : self.time[:n],
+            "sides" : list(self.sides),
+            "scodes" : list(self.scodes),
+            "order_types" : list(self.order_types)
+        }
+        self.lock.release()
+        return res
+
+    @classmethod
+    def from_columns(cls,cols):
+        """
+        build a ledger from the output of columns() without copying the arrays, they are only
+        copied by the first append (so read only, e.g. memory mapped, arrays can be used)
+        """
+        ledger = cls(capacity = 1)
+        n = len(cols["side"])
+        if n:
+            ledger.side = cols["side"]
+            ledger.scode = cols["scode"]
+            ledger.price = cols["price"]
+            ledger.amount = cols["amount"]
+            ledger.order_type = cols["order_type"]
+            ledger.time = cols["time"]
+        ledger.size = n
+        for which,key in enumerate(["sides","scodes","order_types"]):
+            values = [ledger.sides,ledger.scodes,ledger.order_types][which]
+            for value in cols[key]:
+                ledger.code(which,values,value)
+        return ledger
+
+    @classmethod
+    def from_frame(cls,df):
+        """
+        build a ledger from a DataFrame with the columns of TradeLedger.COLUMNS indexed by time
+        """
+        ledger = cls(capacity = len(df))
+        when = pd.to_datetime(df.index)
+        for t,row in zip(when,df[cls.COLUMNS].itertuples(index = False)):
+            ledger.append(*row,when = t.to_pydatetime())
+        return ledger
@@ -1,3 +1,11 @@
 from Portfolio.Portfolio import Portfolio
 from Portfolio.PortfolioMgr import PortfolioMgr
 from Portfolio.SIconverter import SIconverter
+from Portfolio.AsyncPortfolio import AsyncPortfolio
+from Portfolio.AsyncPortfolio import AsyncPortfolioMgr
+from Portfolio.Broker import Broker
+from Portfolio.Broker import RobinhoodBroker
+from Portfolio.SimBroker import SimBroker
+from Portfolio.Metrics import Metrics
+from Portfolio.EventLog import EventLog
+from Portfolio.Optimizer import Optimizer
@@ -0,0 +1,33 @@
+"""
+covariance estimation and weight solvers on a synthetic factor model
+
+    python benchmarks/bench_optimizer.py
+"""
+import time
+import numpy as np
+from harness import best_of
+from harness import result
+from harness import show
+from Portfolio.Optimizer import Optimizer
+
+
+def history(T,N,seed = 0):
+    rng = np.random.default_rng(seed)
+    factors = rng.normal(0,0.01,(T,5))@rng.normal(0,1,(5,N))
+    return factors + rng.normal(0.0005,0.02,(T,N))
+
+def run(quick = False):
+    res = []
+    for N in ([200,1000] if quick else [100,500,1000,2000]):
+        R = history(500,N)
+        t0 = time.perf_counter()
+        opt = Optimizer(R)
+        res.append(result('optimizer.ledoit_wolf',(time.perf_counter() - t0)*1e3,'ms',n = N))
+        for method in ['min_variance','max_sharpe','risk_parity']:
+            dt = best_of(lambda:getattr(opt,method)(),3)
+            res.append(result('optimizer.'+method,dt*1e3,'ms',n = N))
+    return res
+
+
+if __name__ == '__main__':
+    show(run())
@@ -0,0 +1,62 @@
+"""
+order life cycle: submission through the Portfolio order methods and fill-to-book through confirm_order
+
+runs against a SimBroker, latency is the delay injected in every broker call
+    python benchmarks/bench_orders.py
+"""
+import time
+from harness import result
+from harness import show
+from Portfolio.Portfolio import Portfolio
+from Portfolio.SimBroker import SimBroker
+
+
+def portfolio(latency = 0.0):
+    broker = SimBroker(cash = 1e12,latency = latency,default_price = 10.0)
+    p = Portfolio(trader = broker,name = 'bench',iniFund = 1e9)
+    # check orders as soon as they are placed, so only the booking path is measured
+    p.queue.market_delay = 0
+    return p
+
+def bench_submit(n,latency):
+    p = portfolio(latency)
+    scodes = ['S{}'.format(i % 100) for i in range(n)]
+    for scode in set(scodes):
+        p.converter(scode)
+    p.quote_last_price(*set(scodes))
+    t0 = time.perf_counter()
+    futures = [p.market_buy(scode,1) for scode in scodes]
+    p.executor.join(futures)
+    dt = time.perf_counter() - t0
+    p.executor.shutdown()
+    return dt
+
+def bench_fill_to_book(n):
+    p = portfolio()
+    futures = [p.market_buy('S{}'.format(i % 100),1) for i in range(n)]
+    p.executor.join(futures)
+    t0 = time.perf_counter()
+    p.confirm_order(loop = True,gap_time = 0.01)
+    while len(p.queue):
+        time.sleep(0.001)
+    dt = time.perf_counter() - t0
+    p.stop_confirm()
+    p.executor.shutdown()
+    return dt,p.fill_latency_stats()
+
+def run(quick = False):
+    res = []
+    for latency in ([0.0] if quick else [0.0,0.001,0.01]):
+        n = 500 if latency >= 0.01 or quick else 5000
+        dt = bench_submit(n,latency)
+        res.append(result('orders.submit',n/dt,'orders/s','higher',n = n,latency = latency))
+    for n in ([1000] if quick else [1000,10000]):
+        dt,lat = bench_fill_to_book(n)
+        res.append(result('orders.fill_to_book',n/dt,'orders/s','higher',n = n))
+        res.append(result('orders.fill_to_book.p50',lat['p50']*1e3,'ms',n = n))
+        res.append(result('orders.fill_to_book.p95',lat['p95']*1e3,'ms',n = n))
+    return res
+
+
+if __name__ == '__main__':
+    show(run())
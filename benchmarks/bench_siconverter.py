@@ -0,0 +1,31 @@
+"""
+micro benchmark for SIconverter lookups
+
+the cost of a cached lookup as the cache fills up should stay flat
+    python benchmarks/bench_siconverter.py
+"""
+import timeit
+from harness import result
+from harness import show
+from Portfolio.SimBroker import SimBroker
+from Portfolio.SIconverter import SIconverter
+
+
+def bench(size,number = 20000):
+    converter = SIconverter(buffer_size = size,trader = SimBroker())
+    scodes = ['S{}'.format(i) for i in range(size)]
+    for scode in scodes:
+        converter(scode)
+    i = [0]
+    def lookup():
+        converter(scodes[i[0] % size])
+        i[0] += 1
+    return min(timeit.repeat(lookup,number = number,repeat = 3))/number
+
+def run(quick = False):
+    sizes = [10,100,1000] if quick else [10,100,500,1000,5000,20000]
+    return [result('siconverter.lookup',bench(size)*1e6,'us/op',size = size) for size in sizes]
+
+
+if __name__ == '__main__':
+    show(run())
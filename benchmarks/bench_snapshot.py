@@ -0,0 +1,53 @@
+"""
+save/load of the trading history: binary snapshot against the csv files of older versions
+
+    python benchmarks/bench_snapshot.py
+"""
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from harness import best_of
+from harness import result
+from harness import show
+from Portfolio.PositionBook import PositionBook
+from Portfolio.Snapshot import Snapshot
+from Portfolio.TradeLedger import TradeLedger
+
+
+def history(n):
+    cols = {
+        'side' : (np.arange(n) % 2).astype(np.int8),
+        'scode' : (np.arange(n) % 500).astype(np.int32),
+        'price' : np.random.RandomState(0).uniform(1,500,n),
+        'amount' : np.ones(n),
+        'order_type' : np.zeros(n,dtype = np.int16),
+        'time' : np.datetime64('2015-01-01','us') + np.arange(n).astype('timedelta64[s]'),
+        'sides' : ['buy','sell'],
+        'scodes' : ['S{}'.format(i) for i in range(500)],
+        'order_types' : ['market']
+    }
+    book = PositionBook()
+    for i in range(500):
+        book.add('S{}'.format(i),10,100.0)
+    return TradeLedger.from_columns(cols),book
+
+def run(quick = False):
+    res = []
+    with tempfile.TemporaryDirectory() as d:
+        for n in ([10**5] if quick else [10**5,10**6,10**7]):
+            ledger,book = history(n)
+            path = os.path.join(d,'p.snap')
+            res.append(result('snapshot.save',best_of(lambda:Snapshot.write(path,ledger,book,bp = 1.0))*1e3,'ms',records = n))
+            res.append(result('snapshot.load',best_of(lambda:Snapshot.read(path))*1e3,'ms',records = n))
+        n = 10**5
+        ledger,book = history(n)
+        path = os.path.join(d,'trading.csv')
+        ledger.to_frame().to_csv(path)
+        load = lambda:TradeLedger.from_frame(pd.read_csv(path,index_col = 0))
+        res.append(result('csv.load',best_of(load,repeat = 1)*1e3,'ms',records = n))
+    return res
+
+
+if __name__ == '__main__':
+    show(run())
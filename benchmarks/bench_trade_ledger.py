@@ -0,0 +1,54 @@
+"""
+append throughput of the trading record, through Portfolio.add_trading_record with and without a journal
+
+    python benchmarks/bench_trade_ledger.py
+"""
+import datetime
+import tempfile
+import time
+import pandas as pd
+from harness import result
+from harness import show
+from Portfolio.Portfolio import Portfolio
+from Portfolio.SimBroker import SimBroker
+from Portfolio.TradeLedger import TradeLedger
+
+
+def bench_ledger(n,journal_dir = None):
+    p = Portfolio(trader = SimBroker(),name = 'bench',iniFund = 1e6,journal_dir = journal_dir)
+    t0 = time.perf_counter()
+    for i in range(n):
+        p.add_trading_record('buy','S{}'.format(i % 500),10.0,1,'market')
+    if p.journal is not None:
+        p.journal.sync()
+    dt = time.perf_counter() - t0
+    t1 = time.perf_counter()
+    p.trading_record.to_frame()
+    frame = time.perf_counter() - t1
+    p.quit()
+    return dt,frame
+
+def bench_dataframe(n):
+    df = pd.DataFrame(columns = TradeLedger.COLUMNS)
+    t0 = time.perf_counter()
+    for i in range(n):
+        df.loc[datetime.datetime.now()+datetime.timedelta(microseconds = i)] = ['buy','S{}'.format(i % 500),10.0,1,'market']
+    return time.perf_counter() - t0
+
+def run(quick = False):
+    res = []
+    for n in ([10**4] if quick else [10**3,10**4,10**5,10**6]):
+        dt,frame = bench_ledger(n)
+        res.append(result('add_trading_record',n/dt,'appends/s','higher',n = n,journal = False))
+        res.append(result('trade_ledger.to_frame',frame*1e3,'ms',n = n))
+        with tempfile.TemporaryDirectory() as d:
+            dt,_ = bench_ledger(n,journal_dir = d)
+        res.append(result('add_trading_record',n/dt,'appends/s','higher',n = n,journal = True))
+    if not quick:
+        n = 2000
+        res.append(result('dataframe_loc.append',n/bench_dataframe(n),'appends/s','higher',n = n))
+    return res
+
+
+if __name__ == '__main__':
+    show(run())
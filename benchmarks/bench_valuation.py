@@ -0,0 +1,63 @@
+"""
+get_market_value/get_weights over growing portfolios, and
+PortfolioMgr.update_allocatable_shares over many portfolios
+
+cold: every call requests the prices, warm: prices served by the quote cache
+    python benchmarks/bench_valuation.py
+"""
+from harness import best_of
+from harness import result
+from harness import show
+from Portfolio.Portfolio import Portfolio
+from Portfolio.PortfolioMgr import PortfolioMgr
+from Portfolio.SimBroker import SimBroker
+
+
+def bench_portfolio(size):
+    broker = SimBroker(cash = 1e12,prices = {'S{}'.format(i) : 10.0 + i % 7 for i in range(size)})
+    p = Portfolio(trader = broker,name = 'bench',iniFund = 1e6)
+    p.quotes.max_age = 3600
+    for i in range(size):
+        p.portfolio_record.add('S{}'.format(i),1 + i % 10,10.0)
+    scodes = ['S{}'.format(i) for i in range(0,size,max(1,size//10))]
+    res = []
+    def cold():
+        for _ in range(20):
+            p.quotes.invalidate()
+            p.get_market_value()
+    def warm():
+        for _ in range(20):
+            p.get_market_value()
+    def weights():
+        for _ in range(20):
+            p.get_weights(*scodes)
+    res.append(result('valuation.market_value.cold',best_of(cold)/20*1e6,'us/op',positions = size))
+    res.append(result('valuation.market_value.warm',best_of(warm)/20*1e6,'us/op',positions = size))
+    res.append(result('valuation.weights.warm',best_of(weights)/20*1e6,'us/op',positions = size))
+    p.executor.shutdown()
+    return res
+
+def bench_manager(portfolios,positions = 50):
+    symbols = 500
+    broker = SimBroker(cash = 1e12,positions = {'S{}'.format(i) : (10**6,10.0) for i in range(symbols)})
+    mgr = PortfolioMgr(name = 'bench',trader = broker)
+    for k in range(portfolios):
+        mgr.add_portfolio(name = 'p{}'.format(k),ini_bp = 1)
+        p = mgr.portfolios['p{}'.format(k)]
+        for i in range(positions):
+            p.portfolio_record.add('S{}'.format((k*positions + i) % symbols),1,10.0)
+    dt = best_of(mgr.update_allocatable_shares)
+    mgr.quit()
+    return dt
+
+def run(quick = False):
+    res = []
+    for size in ([10,1000] if quick else [10,100,1000,5000]):
+        res += bench_portfolio(size)
+    for n in ([10] if quick else [10,100,500]):
+        res.append(result('manager.update_allocatable_shares',bench_manager(n)*1e3,'ms',portfolios = n))
+    return res
+
+
+if __name__ == '__main__':
+    show(run())
@@ -0,0 +1,47 @@
+"""
+helpers shared by the benchmark scripts
+
+every benchmark returns a list of results, a result is a dict
+    benchmark (str): what is measured
+    params (dict): size of the run
+    value (float): the measurement
+    unit (str): unit of value
+    better (str): 'lower' or 'higher'
+"""
+import os
+import sys
+import time
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+
+
+def result(benchmark,value,unit,better = 'lower',**params):
+    return {
+        'benchmark' : benchmark,
+        'params' : params,
+        'value' : float(value),
+        'unit' : unit,
+        'better' : better
+    }
+
+def best_of(fn,repeat = 3):
+    """
+    run fn repeat times
+    return (float): the fastest run, in sec
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best,time.perf_counter() - t0)
+    return best
+
+def key(res):
+    """
+    name of a result, unique within a run
+    """
+    params = ','.join('{}={}'.format(k,v) for k,v in sorted(res['params'].items()))
+    return '{}[{}]'.format(res['benchmark'],params)
+
+def show(results):
+    for res in results:
+        print("{:<64} {:>14.3f} {}".format(key(res),res['value'],res['unit']))
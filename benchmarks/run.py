@@ -0,0 +1,88 @@
+"""
+run the whole benchmark suite offline against a SimBroker and write the results as json
+
+    python benchmarks/run.py --output bench.json
+    python benchmarks/run.py --quick --compare bench.json
+
+--compare prints the change of every result against an older run and exits with 1 if any
+result got worse by more than --tolerance
+"""
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+import numpy as np
+import pandas as pd
+from harness import key
+from harness import show
+import bench_optimizer
+import bench_orders
+import bench_siconverter
+import bench_snapshot
+import bench_trade_ledger
+import bench_valuation
+
+SUITES = {
+    'optimizer' : bench_optimizer,
+    'orders' : bench_orders,
+    'siconverter' : bench_siconverter,
+    'snapshot' : bench_snapshot,
+    'trade_ledger' : bench_trade_ledger,
+    'valuation' : bench_valuation
+}
+
+
+def revision():
+    try:
+        return subprocess.check_output(['git','rev-parse','HEAD'],stderr = subprocess.DEVNULL).decode().strip()
+    except:
+        return None
+
+def compare(results,old,tolerance):
+    """
+    return (int): number of results worse than old by more than tolerance
+    """
+    old = {key(res):res for res in old['results']}
+    worse = 0
+    for res in results:
+        prev = old.get(key(res))
+        if prev is None or not prev['value']:
+            continue
+        change = res['value']/prev['value'] - 1
+        regressed = change > tolerance if res['better'] == 'lower' else change < -tolerance
+        worse += regressed
+        print("{:<64} {:>+8.1%}{}".format(key(res),change,'  REGRESSION' if regressed else ''))
+    return worse
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--quick',action = 'store_true',help = 'fewer sizes, the sizes a claim is made for are kept')
+    parser.add_argument('--only',nargs = '+',choices = sorted(SUITES),help = 'suites to run')
+    parser.add_argument('--output',help = 'json file to write the results to')
+    parser.add_argument('--compare',help = 'json file of an older run')
+    parser.add_argument('--tolerance',type = float,default = 0.2)
+    args = parser.parse_args()
+
+    results = []
+    for name in (args.only or sorted(SUITES)):
+        results += SUITES[name].run(quick = args.quick)
+    show(results)
+    run = {
+        'time' : datetime.datetime.now().isoformat(),
+        'revision' : revision(),
+        'quick' : args.quick,
+        'python' : platform.python_version(),
+        'numpy' : np.__version__,
+        'pandas' : pd.__version__,
+        'machine' : platform.machine(),
+        'results' : results
+    }
+    if args.output is not None:
+        with open(args.output,'w') as f:
+            json.dump(run,f,indent = 1)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            sys.exit(1 if compare(results,json.load(f),args.tolerance) else 0)
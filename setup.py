@@ -8,6 +8,7 @@ __version__ = "0.0.2.13"
 REQUIRES = [
     'pandas>=0.20.1',
     'numpy>=1.12.1',
+    'scipy>=0.19.0',
 ] 
 setup(
     name = 'Robinhood_Portfolio',
@@ -0,0 +1,12 @@
+import pytest
+
+
+@pytest.fixture
+def confirm_all():
+    """
+    check every order of a portfolio now, however long until its next check
+    """
+    def confirm(p):
+        p.queue.make_all_due()
+        p.confirm_pass()
+    return confirm
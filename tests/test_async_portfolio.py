@@ -0,0 +1,102 @@
+import asyncio
+import itertools
+from Portfolio.AsyncPortfolio import AsyncPortfolio
+
+
+class FakeOrder:
+    ids = itertools.count()
+
+    def __init__(self,side,scode,n,price):
+        self.order = {'id' : str(next(FakeOrder.ids))}
+        self.side = side
+        self.scode = scode
+        self.n = n
+        self.price = price
+        self.checks = 0
+        self.cancelled = False
+
+    async def async_check(self):
+        await asyncio.sleep(0)
+        self.checks += 1
+        filled = self.checks >= 2
+        return {
+            'state' : 'filled' if filled else 'confirmed',
+            'executions' : [{'quantity' : str(self.n),'price' : str(self.price)}] if filled else [],
+            'quantity' : str(self.n),
+            'trigger' : 'immediate',
+            'type' : 'market',
+            'side' : self.side
+        }
+
+    async def async_cancel(self):
+        self.cancelled = True
+
+class FakeBroker:
+    def __init__(self):
+        self.placed = 0
+        self.quote_requests = 0
+
+    def get_account(self):
+        return {'margin_balances' : {'unallocated_margin_cash' : '1000000'}}
+
+    def instruments(self,scode):
+        return {'url' : 'https://api.robinhood.com/instruments/{}/'.format(scode)}
+
+    async def async_last_trade_price(self,scodes):
+        self.quote_requests += 1
+        await asyncio.sleep(0)
+        return [[10.0,scode] for scode in scodes.split(',')]
+
+    async def async_place_market_buy_order(self,instrument,scode,n,time_in_force = 'gfd'):
+        await asyncio.sleep(0)
+        self.placed += 1
+        return FakeOrder('buy',scode,n,10.0)
+
+    async def async_place_market_sell_order(self,instrument,scode,n,time_in_force = 'gfd'):
+        await asyncio.sleep(0)
+        self.placed += 1
+        return FakeOrder('sell',scode,n,10.0)
+
+
+def test_thousands_of_orders_on_one_loop():
+    broker = FakeBroker()
+    p = AsyncPortfolio(trader = broker,name = 'async',iniFund = 100000)
+    async def run():
+        scodes = ['S{}'.format(i % 50) for i in range(1000)]
+        orders = await asyncio.gather(*[p.async_market_buy(scode,1) for scode in scodes])
+        assert all(order is not None for order in orders)
+        assert len(p.queue) == 1000
+        for _ in range(2):
+            p.queue.make_all_due()
+            await p.async_confirm_pass()
+        assert len(p.queue) == 0
+        assert p.shares_owned('S7') == 20
+        await p.async_market_sell('S7',5)
+        return await p.async_get_market_value()
+    value = asyncio.run(run())
+    assert broker.placed == 1001
+    assert abs(p.bp - (100000 - 1000*10.0)) < 1e-6
+    assert abs(value - 100000) < 1e-6
+    assert broker.quote_requests <= 51
+
+def test_unquoted_symbol_is_not_bought():
+    broker = FakeBroker()
+    async def no_row(scodes):
+        return []
+    broker.async_last_trade_price = no_row
+    p = AsyncPortfolio(trader = broker,name = 'async',iniFund = 100)
+    assert asyncio.run(p.async_market_buy('ZZ',1000)) is None
+    assert broker.placed == 0
+
+def test_journal_is_compacted(tmp_path):
+    p = AsyncPortfolio(trader = FakeBroker(),name = 'async',iniFund = 100000,journal_dir = str(tmp_path/'p'),snapshot_every = 8)
+    async def run():
+        await asyncio.gather(*[p.async_market_buy('S{}'.format(i),1) for i in range(10)])
+        for _ in range(2):
+            p.queue.make_all_due()
+            await p.async_confirm_pass()
+    asyncio.run(run())
+    assert p.shares_owned('S3') == 1
+    assert p.snapshot_seq >= 8
+    assert p.journal.seq - p.snapshot_seq < 8
+    p.quit()
@@ -0,0 +1,96 @@
+import os
+from threading import Thread
+from Portfolio.PortfolioMgr import PortfolioMgr
+from Portfolio.SimBroker import SimBroker
+
+
+def make_mgr(broker,**kw):
+    return PortfolioMgr(name = 'mgr',trader = broker,**kw)
+
+def test_round_trip_without_asking_the_broker(tmp_path):
+    sav = str(tmp_path/'sav')
+    broker = SimBroker(cash = 10000,prices = {'AAPL' : 10.0,'MSFT' : 20.0},positions = {'AAPL' : (30,8.0),'MSFT' : (4,15.0)})
+    mgr = make_mgr(broker)
+    for name in ['a','b','c']:
+        mgr.add_portfolio(name = name,ini_bp = 1000,cancel_count = 3)
+    mgr.add_shares_to('a','AAPL',10)
+    mgr.transfer_shares('a','b','AAPL',4)
+    mgr.transfer_bp('c','a',250)
+    mgr.draw_bp_from('b',100)
+    mgr.regisiter['a'] = ['STOPED','trade']
+    first = mgr.checkpoint(sav)
+    mgr.draw_bp_from('c',50)
+    mgr.save(sav)
+    assert not os.path.exists(first)
+    mgr.quit()
+
+    broker.calls.clear()
+    neo = make_mgr(broker,load_from = sav)
+    assert broker.calls['securities_owned'] == 0
+    assert sorted(neo.portfolios) == ['a','b','c']
+    for name,p in mgr.portfolios.items():
+        q = neo.portfolios[name]
+        assert abs(q.bp - p.bp) < 1e-9
+        assert q.portfolio_record.to_frame().equals(p.portfolio_record.to_frame())
+        assert len(q.trading_record) == len(p.trading_record)
+        assert q.cancel_count == 3
+    assert abs(neo.unassigned_bp - mgr.unassigned_bp) < 1e-9
+    assert neo.unassigned_shares == {'AAPL' : 20,'MSFT' : 4}
+    assert neo.regisiter == {'a' : ['RESTORED','trade']}
+    neo.quit()
+
+def test_checkpoint_never_sees_half_a_transfer(tmp_path):
+    sav = str(tmp_path/'sav')
+    broker = SimBroker(cash = 10000)
+    mgr = make_mgr(broker)
+    mgr.add_portfolio(name = 'a',ini_bp = 1000)
+    mgr.add_portfolio(name = 'b',ini_bp = 1000)
+    done = []
+    def shuffle():
+        for i in range(300):
+            mgr.transfer_bp('a','b',1)
+            mgr.transfer_bp('b','a',1)
+        done.append(True)
+    t = Thread(target = shuffle)
+    t.start()
+    checked = 0
+    while not done or checked < 3:
+        mgr.checkpoint(sav)
+        neo = make_mgr(broker,load_from = sav)
+        assert abs(neo.portfolios['a'].bp + neo.portfolios['b'].bp - 2000) < 1e-9
+        neo.quit()
+        checked += 1
+    t.join()
+    mgr.quit()
+
+def test_restore_into_a_journaling_portfolio(tmp_path):
+    name = str(tmp_path/'mgr')
+    broker = SimBroker(cash = 10000)
+    mgr = PortfolioMgr(name = name,trader = broker,journal = True)
+    mgr.add_portfolio(name = 'a',ini_bp = 1000)
+    fdir = mgr.checkpoint(name)
+    mgr.draw_bp_from('a',300)
+    mgr.restore(fdir)
+    p = mgr.portfolios['a']
+    assert abs(p.bp - 1000) < 1e-9
+    mgr.quit()
+    neo = PortfolioMgr(name = name,trader = broker,journal = True)
+    neo.add_portfolio(name = 'a',ini_bp = 1)
+    assert abs(neo.portfolios['a'].bp - 1000) < 1e-9
+    neo.quit()
+
+def test_load_from_a_checkpoint_with_journals(tmp_path):
+    name = str(tmp_path/'mgr')
+    broker = SimBroker(cash = 10000)
+    mgr = PortfolioMgr(name = name,trader = broker,journal = True)
+    mgr.add_portfolio(name = 'a',ini_bp = 1000)
+    mgr.checkpoint(name)
+    mgr.draw_bp_from('a',300)
+    mgr.quit()
+    neo = PortfolioMgr(name = name,trader = broker,journal = True,load_from = name)
+    assert abs(neo.portfolios['a'].bp - 1000) < 1e-9
+    assert abs(neo.unassigned_bp + neo.portfolios['a'].bp - 10000) < 1e-9
+    neo.quit()
+    again = PortfolioMgr(name = name,trader = broker,journal = True,load_from = name)
+    assert abs(again.portfolios['a'].bp - 1000) < 1e-9
+    again.quit()
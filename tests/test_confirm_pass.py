@@ -0,0 +1,63 @@
+import threading
+from Portfolio.Portfolio import Portfolio
+from Portfolio.PortfolioMgr import PortfolioMgr
+from Portfolio.SimBroker import ManualClock
+from Portfolio.SimBroker import SimBroker
+
+
+class FlakyBroker(SimBroker):
+    down = False
+
+    def check_orders(self,orders):
+        if self.down:
+            raise IOError('check_orders down')
+        return SimBroker.check_orders(self,orders)
+
+def test_failed_batch_check_is_retried(confirm_all):
+    clock = ManualClock()
+    broker = FlakyBroker(prices = {'AAPL' : 10.0},fill_latency = 1,clock = clock)
+    p = Portfolio(trader = broker,name = 'p',iniFund = 1000)
+    p.market_buy('AAPL',3).result()
+    p.market_buy('AAPL',2).result()
+    clock.advance(1)
+    broker.down = True
+    confirm_all(p)
+    assert len(p.queue) == 2
+    assert p.queue.next_due() is not None
+    assert [e.message() for e in p.log.query(level = p.log.ERROR)] == ["fail to check 2 orders: OSError('check_orders down')"]
+    broker.down = False
+    confirm_all(p)
+    assert len(p.queue) == 0
+    assert p.shares_owned('AAPL') == 5
+
+def test_fill_latency_stats(confirm_all):
+    broker = SimBroker(prices = {'AAPL' : 10.0})
+    p = Portfolio(trader = broker,name = 'p',iniFund = 1000)
+    assert p.fill_latency_stats() == {"count" : 0}
+    for _ in range(4):
+        p.market_buy('AAPL',1).result()
+    confirm_all(p)
+    stats = p.fill_latency_stats()
+    assert stats['count'] == 4
+    assert 0 <= stats['p50'] <= stats['p95'] <= stats['max']
+    assert stats['mean'] <= stats['max']
+
+def test_one_confirm_loop_per_portfolio():
+    broker = SimBroker(prices = {'AAPL' : 10.0})
+    mgr = PortfolioMgr(name = 'mgr',trader = broker)
+    mgr.working_now = False
+    mgr.add_portfolio(name = 'p',ini_bp = 1000)
+    class Algo:
+        def trade(self,mgr,pname,args,misc):
+            pass
+    mgr.schedule(algo = Algo(),method = 'trade',portfolio_name = 'p',freq = 1)
+    for _ in range(20):
+        mgr.start_algo('p')
+        mgr.stop_algo('p')
+    mgr.start_algo('p')
+    loops = [t for t in threading.enumerate() if t.name == 'confirm p']
+    assert len(loops) == 1
+    assert mgr.portfolios['p'].confirm_loop is loops[0]
+    mgr.quit()
+    loops[0].join(timeout = 5)
+    assert not loops[0].is_alive()
@@ -0,0 +1,51 @@
+import os
+from Portfolio.EventLog import EventLog
+from Portfolio.Portfolio import Portfolio
+from Portfolio.SimBroker import SimBroker
+
+
+class Loud:
+    formatted = 0
+
+    def __format__(self,spec):
+        Loud.formatted += 1
+        return 'loud'
+
+def test_bounded_and_lazy():
+    log = EventLog(capacity = 3)
+    for i in range(5):
+        log.info("event {} {}",i,Loud())
+    assert len(log) == 3
+    assert Loud.formatted == 0
+    assert [e.args[0] for e in log.query()] == [2,3,4]
+    assert list(log)[-1].endswith("INFO: event 4 loud")
+    assert Loud.formatted == 3
+
+def test_query_by_level_and_symbol():
+    broker = SimBroker(prices = {'AAPL' : 10.0})
+    p = Portfolio(trader = broker,name = 'p',iniFund = 100)
+    p.market_buy('AAPL',1000).result()
+    p.add_shares_from_pool(scode = 'MSFT',n = 1)
+    p.log.info("nothing to see")
+    assert [e.scode for e in p.log.query(level = EventLog.WARNING)] == ['AAPL','MSFT']
+    assert p.log.query(scode = 'MSFT')[0].message() == "dont have MSFT in your pool"
+    assert [e.message() for e in p.log.query(limit = 1)] == ["nothing to see"]
+    assert p.log.query(level = EventLog.ERROR) == []
+
+def test_streams_and_rotates(tmp_path):
+    path = str(tmp_path/'events.log')
+    log = EventLog(capacity = 2,path = path,max_bytes = 200,backups = 2,flush_interval = 60)
+    for i in range(3):
+        log.warning("event {}",i,scode = 'AAPL',oid = i)
+    log.flush()
+    with open(path) as f:
+        lines = f.read().splitlines()
+    assert lines[0] == "1 events dropped before being written"
+    assert lines[-1].endswith("WARNING: event 2 scode=AAPL oid=2")
+    for i in range(10):
+        log.error("event {}",i)
+        log.flush()
+    log.close()
+    assert os.path.exists(path+'.1') and os.path.exists(path+'.2')
+    assert not os.path.exists(path+'.3')
+    assert os.path.getsize(path) <= 200
@@ -0,0 +1,86 @@
+import os
+from Portfolio.Journal import Journal
+from Portfolio.Portfolio import Portfolio
+from Portfolio.SimBroker import ManualClock
+from Portfolio.SimBroker import SimBroker
+
+
+def test_torn_tail_is_cut_off(tmp_path):
+    path = str(tmp_path/'journal.bin')
+    journal = Journal(path)
+    journal.write('bp',10.5)
+    journal.write('book','AAPL',3.0,12.25)
+    journal.close()
+    with open(path,'ab') as f:
+        f.write(Journal.RECORD.pack(100,3,0) + b'\x03half')
+    assert [r[0] for r in Journal.read(path)] == [1,2]
+    journal = Journal(path)
+    assert journal.write('done','x') == 3
+    journal.close()
+    assert Journal.read(path,after = 1) == [(2,'book',['AAPL',3.0,12.25]),(3,'done',['x'])]
+
+def test_recover_after_crash(tmp_path,confirm_all):
+    fdir = str(tmp_path/'p') + '/'
+    clock = ManualClock()
+    broker = SimBroker(prices = {'AAPL' : 10.0,'MSFT' : 20.0},clock = clock)
+    p = Portfolio(trader = broker,name = 'p',iniFund = 1000,journal_dir = fdir,snapshot_every = 4)
+    p.market_buy('AAPL',10).result()
+    p.market_buy('MSFT',5).result()
+    confirm_all(p)
+    p.change_bp(50)
+    p.add_shares('IBM',2,100.0)
+    pending = p.limit_buy('AAPL',1.0,1).result()
+    p.add_trading_record("None","None",50,1,"add bp")
+    broker.fill_latency = 1
+    broker.partial_fills = 2
+    late = p.market_buy('MSFT',4).result()
+    clock.advance(1)
+    confirm_all(p)
+    assert p.shares_owned('MSFT') == 7
+    p.journal.sync()
+    # crash: nothing saved, the journal is left open
+    clock.advance(10)
+    q = Portfolio(trader = broker,name = 'p',iniFund = 1,journal_dir = fdir)
+    assert q.snapshot_seq > 0
+    assert abs(q.bp - p.bp) < 1e-9
+    assert q.shares_owned('AAPL') == 10
+    assert q.shares_owned('MSFT') == 7
+    assert q.portfolio_record.cost_of('IBM') == 100.0
+    assert len(q.trading_record) == len(p.trading_record) == 4
+    # the open orders are back in the queue, the rest of the market buy is booked once
+    assert q.recovered_orders == {}
+    assert sorted(e.oid for e in q.queue.pending()) == sorted([pending.order['id'],late.order['id']])
+    confirm_all(q)
+    assert q.shares_owned('MSFT') == 9
+    assert broker.positions['MSFT'][0] == 9
+    assert len(q.trading_record) == 5
+    assert [e.oid for e in q.queue.pending()] == [pending.order['id']]
+    q.snapshot()
+    r = Portfolio(trader = broker,name = 'p',iniFund = 1,journal_dir = fdir)
+    assert r.shares_owned('MSFT') == 9
+    assert [e.oid for e in r.queue.pending()] == [pending.order['id']]
+
+def test_unknown_recovered_order_is_dropped(tmp_path):
+    fdir = str(tmp_path/'p') + '/'
+    broker = SimBroker(prices = {'AAPL' : 10.0})
+    p = Portfolio(trader = broker,name = 'p',iniFund = 1000,journal_dir = fdir)
+    order = p.limit_buy('AAPL',1.0,1).result()
+    p.journal.sync()
+    del broker.orders[order.order['id']]
+    q = Portfolio(trader = broker,name = 'p',iniFund = 1,journal_dir = fdir)
+    assert len(q.queue) == 0 and q.recovered_orders == {}
+    q.journal.sync()
+    r = Portfolio(trader = broker,name = 'p',iniFund = 1,journal_dir = fdir)
+    assert len(r.queue) == 0 and r.recovered_orders == {}
+    assert broker.calls['get_order'] == 1
+
+def test_save_only_flushes_the_journal(tmp_path):
+    root = str(tmp_path) + '/'
+    broker = SimBroker(prices = {'AAPL' : 10.0})
+    p = Portfolio(trader = broker,name = 'p',iniFund = 1000,journal_dir = root + 'p/')
+    p.change_bp(-100)
+    p.save(root_name = root)
+    assert not os.path.exists(root + 'p/trading.csv')
+    q = Portfolio(trader = broker,name = 'q',iniFund = 1)
+    q.load(savdir = 'p',root_name = root)
+    assert abs(q.bp - 900) < 1e-9
@@ -0,0 +1,55 @@
+import datetime
+from email.utils import format_datetime
+from Portfolio.MarketCalendar import MarketCalendar
+
+
+class Response:
+    def __init__(self,d,headers):
+        self.d = d
+        self.headers = headers
+
+    def json(self):
+        return self.d
+
+class FakeSession:
+    def __init__(self,server_skew = 0):
+        self.urls = []
+        self.server_skew = server_skew
+
+    def get(self,url):
+        self.urls.append(url)
+        day = datetime.date.fromisoformat(url.rstrip('/').split('/')[-1])
+        server = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds = self.server_skew)
+        headers = {'Date' : format_datetime(server,usegmt = True)}
+        if day.weekday() >= 5:
+            return Response({'is_open' : False,'opens_at' : None,'closes_at' : None},headers)
+        return Response({
+            'is_open' : True,
+            'opens_at' : '{}T13:30:00Z'.format(day.isoformat()),
+            'closes_at' : '{}T20:00:00Z'.format(day.isoformat())
+        },headers)
+
+class FakeTrader:
+    def __init__(self,server_skew = 0):
+        self.session = FakeSession(server_skew)
+
+
+def test_week_is_fetched_once():
+    trader = FakeTrader()
+    calendar = MarketCalendar(trader = trader)
+    monday = datetime.datetime(2021,3,1,15,0)
+    assert calendar.is_open(monday)
+    assert not calendar.is_open(monday.replace(hour = 21))
+    assert not calendar.is_open(datetime.datetime(2021,3,6,15,0))
+    for day in range(1,8):
+        calendar.is_open(datetime.datetime(2021,3,day,12,0))
+    assert len(trader.session.urls) == 7
+    assert trader.session.urls[0] == 'https://api.robinhood.com/markets/XNAS/hours/2021-03-01/'
+    assert calendar.next_open(datetime.datetime(2021,3,5,21,0)) == datetime.datetime(2021,3,8,13,30)
+
+def test_clock_offset_from_date_header():
+    calendar = MarketCalendar(trader = FakeTrader(server_skew = 120))
+    calendar.hours_of(datetime.date(2021,3,1))
+    assert 118 <= calendar.offset <= 122
+    skew = (calendar.now() - datetime.datetime.now(datetime.timezone.utc).replace(tzinfo = None)).total_seconds()
+    assert 118 <= skew <= 122
@@ -0,0 +1,51 @@
+from Portfolio.Metrics import Histogram
+from Portfolio.Metrics import InstrumentedBroker
+from Portfolio.Metrics import Metrics
+from Portfolio.PortfolioMgr import PortfolioMgr
+from Portfolio.SimBroker import SimBroker
+
+
+def test_histogram_percentiles():
+    hist = Histogram()
+    for _ in range(90):
+        hist.observe(0.001)
+    for _ in range(10):
+        hist.observe(0.5)
+    s = hist.summary()
+    assert s['count'] == 100
+    assert 0.001 <= s['p50'] <= 0.002
+    assert 0.5 <= s['p99'] <= 0.5
+    assert abs(s['mean'] - (0.09 + 5)/100) < 1e-12
+
+def test_manager_records_broker_calls(tmp_path,confirm_all):
+    broker = SimBroker(prices = {'AAPL' : 10.0},latency = lambda endpoint:0.002 if endpoint == 'check_orders' else 0)
+    path = str(tmp_path/'metrics.prom')
+    mgr = PortfolioMgr(name = 'm',trader = broker,metrics_file = path)
+    mgr.add_portfolio(name = 'a',ini_bp = 1000)
+    p = mgr.portfolios['a']
+    p.market_buy('AAPL',3).result()
+    confirm_all(p)
+    stats = mgr.stats()
+    assert stats['broker_latency']['endpoint=place_market_buy_order']['count'] == 1
+    assert stats['broker_latency']['endpoint=check_orders']['p50'] >= 0.002
+    assert stats['queue_depth']['portfolio=a'] == 0
+    assert stats['lock_wait']['lock=a.state']['count'] >= 1
+    assert p.shares_owned('AAPL') == 3
+    mgr.quit()
+    text = open(path).read()
+    assert '# TYPE robinhood_portfolio_broker_latency_seconds histogram' in text
+    assert 'robinhood_portfolio_broker_latency_seconds_count{endpoint="check_orders"} 1' in text
+    assert 'robinhood_portfolio_queue_depth{portfolio="a"} 0' in text
+
+def test_errors_counted():
+    metrics = Metrics()
+    class Failing(SimBroker):
+        def last_trade_price(self,scodes):
+            raise IOError('down')
+    broker = InstrumentedBroker(Failing(),metrics)
+    for _ in range(2):
+        try:
+            broker.last_trade_price('AAPL')
+        except IOError:
+            pass
+    assert metrics.stats()['broker_errors']['endpoint=last_trade_price'] == 2
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+import time
+from Portfolio.PortfolioMgr import PortfolioMgr
+from Portfolio.SimBroker import SimBroker
+
+
+def test_opposing_orders_are_crossed():
+    broker = SimBroker(cash = 10000,prices = {'AAPL' : 10.0,'MSFT' : 20.0},positions = {'AAPL' : (10,8.0)})
+    mgr = PortfolioMgr(name = 'mgr',trader = broker)
+    for name in ['a','b','c']:
+        mgr.add_portfolio(name = name,ini_bp = 1000)
+    mgr.add_shares_to('a','AAPL',10)
+    sell = mgr.market_order('a','AAPL',-6)
+    buy = mgr.market_order('b','AAPL',10)
+    small = mgr.market_order('c','AAPL',2)
+    both = [mgr.market_order('c','MSFT',3),mgr.market_order('c','MSFT',-3)]
+    assert mgr.net() == 9
+    assert sell.result() == (6,None)
+    crossed,order = buy.result()
+    assert crossed == 6 and order.order['quantity'] == '4'
+    assert small.result()[0] == 0 and small.result()[1] is not None
+    assert [f.result() for f in both] == [(3,None),(3,None)]
+    assert broker.calls['place_market_buy_order'] == 2
+    assert broker.calls['place_market_sell_order'] == 0
+    a,b,c = (mgr.portfolios[name] for name in 'abc')
+    assert a.shares_owned('AAPL') == 4 and abs(a.bp - 1060) < 1e-9
+    assert b.shares_owned('AAPL') == 6 and abs(b.bp - 940) < 1e-9
+    assert b.trading_record.to_frame()['ORDER_TYPE'].tolist()[-1] == 'internal cross'
+    assert mgr.net() == 0
+    mgr.quit()
+
+def test_failed_netting_fails_the_orders():
+    broker = SimBroker(cash = 10000,prices = {'AAPL' : 10.0})
+    mgr = PortfolioMgr(name = 'mgr',trader = broker)
+    mgr.add_portfolio(name = 'a',ini_bp = 1000)
+    f = mgr.market_order('a','AAPL',1)
+    def down(*scodes):
+        raise IOError('quotes down')
+    mgr.quotes.last_trade_price = down
+    try:
+        mgr.net()
+        assert False
+    except IOError:
+        pass
+    assert isinstance(f.exception(timeout = 1),IOError)
+    mgr.quit()
+
+def test_no_cross_without_a_quote():
+    broker = SimBroker(cash = 10000,prices = {'AAPL' : 10.0},positions = {'AAPL' : (10,8.0)})
+    mgr = PortfolioMgr(name = 'mgr',trader = broker)
+    mgr.add_portfolio(name = 'a',ini_bp = 1000)
+    mgr.add_portfolio(name = 'b',ini_bp = 1000)
+    mgr.add_shares_to('a','AAPL',10)
+    a,b = mgr.portfolios['a'],mgr.portfolios['b']
+    with pytest.raises(AssertionError):
+        b.cross_shares(a,'AAPL',1,np.nan)
+    mgr.quotes.last_trade_price = lambda *scodes: np.full(len(scodes),np.nan)
+    sell = mgr.market_order('a','AAPL',-5)
+    buy = mgr.market_order('b','AAPL',5)
+    assert mgr.net() == 0
+    assert sell.result()[0] == 0 and sell.result()[1] is not None
+    assert buy.result() == (0,None)
+    assert broker.calls['place_market_buy_order'] == 0
+    assert a.bp == b.bp == 1000
+    assert b.shares_owned('AAPL') == 0
+    mgr.quit()
+
+def test_scheduled_strategies_cross():
+    broker = SimBroker(cash = 10000,prices = {'AAPL' : 10.0},positions = {'AAPL' : (10,8.0)})
+    mgr = PortfolioMgr(name = 'mgr',trader = broker)
+    mgr.working_now = False
+    mgr.add_portfolio(name = 'a',ini_bp = 1000)
+    mgr.add_portfolio(name = 'b',ini_bp = 1000)
+    mgr.add_shares_to('a','AAPL',10)
+    results = []
+    class Algo:
+        def __init__(self,n):
+            self.n = n
+            self.ticks = 0
+        def trade(self,mgr,pname,args,misc):
+            self.ticks += 1
+            if self.ticks == 1:
+                results.append(mgr.market_order(pname,'AAPL',self.n))
+    mgr.schedule(algo = Algo(-4),method = 'trade',portfolio_name = 'a',freq = 1)
+    mgr.schedule(algo = Algo(4),method = 'trade',portfolio_name = 'b',freq = 1)
+    mgr.scheduler.resume('a','b')
+    deadline = time.time() + 5
+    while len(results) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert [f.result(timeout = 5) for f in results] == [(4,None),(4,None)]
+    assert mgr.portfolios['b'].shares_owned('AAPL') == 4
+    assert broker.calls['place_market_buy_order'] == broker.calls['place_market_sell_order'] == 0
+    mgr.quit()
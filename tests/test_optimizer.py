@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+from Portfolio.Optimizer import Optimizer
+from Portfolio.Portfolio import Portfolio
+from Portfolio.SimBroker import SimBroker
+
+
+def history(T = 400,N = 6,seed = 1):
+    rng = np.random.default_rng(seed)
+    common = rng.normal(0,0.01,(T,1))
+    vol = np.linspace(0.01,0.03,N)
+    drift = np.linspace(0.0002,0.0012,N)
+    return pd.DataFrame(
+        drift + common + rng.normal(0,1,(T,N))*vol,
+        columns = ['S{}'.format(i) for i in range(N)]
+    )
+
+def test_solutions_match_the_closed_forms():
+    opt = Optimizer(history(),shrinkage = None)
+    C = opt.cov
+    free = np.linalg.solve(C,np.ones(len(C)))
+    assert (free > 0).all()
+    w = opt.min_variance()
+    assert np.allclose(list(w.values()),free/free.sum(),atol = 1e-5)
+    assert np.allclose(list(opt.min_variance(long_only = False).values()),free/free.sum())
+    sharpe = opt.risk(opt.max_sharpe())['sharpe']
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        assert opt.risk(rng.dirichlet(np.ones(len(C))))['sharpe'] <= sharpe + 1e-9
+    rp = np.array(list(opt.risk_parity().values()))
+    contrib = rp*(C@rp)
+    assert np.allclose(contrib,contrib.mean(),rtol = 1e-4)
+
+def test_shrinkage_and_weights_for_rebalance():
+    returns = history(T = 60,N = 40)
+    opt = Optimizer(returns)
+    assert 0 < opt.shrink < 1
+    assert np.linalg.eigvalsh(opt.cov).min() > 0
+    assert Optimizer(returns,shrinkage = 1.0).cov[0,1] == 0
+    weights = opt.max_sharpe()
+    assert abs(sum(weights.values()) - 1) < 1e-9 and min(weights.values()) >= 0
+    broker = SimBroker(prices = {scode:10.0 for scode in returns.columns})
+    p = Portfolio(trader = broker,name = 'p',iniFund = 10000)
+    placed = p.rebalance_to(weights)
+    assert {scode for scode,_,_ in placed} == {scode for scode,w in weights.items() if w*10000 >= 10}
@@ -0,0 +1,31 @@
+import time
+from threading import Event
+from threading import Thread
+from Portfolio.OrderExecutor import OrderExecutor
+
+
+def test_results_and_nothing_retained():
+    executor = OrderExecutor(workers = 4,max_pending = 8)
+    futures = [executor.submit(lambda i = i: i*i) for i in range(100)]
+    assert [f.result() for f in futures] == [i*i for i in range(100)]
+    executor.join()
+    assert executor.queue_depth() == 0
+    executor.shutdown()
+
+def test_submit_blocks_when_full():
+    executor = OrderExecutor(workers = 2,max_pending = 2)
+    gate = Event()
+    executor.submit(gate.wait)
+    executor.submit(gate.wait)
+    submitted = Event()
+    def third():
+        executor.submit(lambda: None)
+        submitted.set()
+    t = Thread(target = third)
+    t.start()
+    time.sleep(0.1)
+    assert not submitted.is_set()
+    gate.set()
+    t.join(1)
+    assert submitted.is_set()
+    executor.shutdown()
@@ -0,0 +1,59 @@
+from Portfolio.OrderQueue import OrderQueue
+
+
+class FakeOrder:
+    def __init__(self,oid):
+        self.order = {'id' : oid}
+
+
+def test_market_orders_due_first_and_backoff():
+    q = OrderQueue(market_delay = 1,base_delay = 5,max_delay = 40)
+    limit = q.push('AAPL',FakeOrder('a'),placed_at = 0)
+    market = q.push('MSFT',FakeOrder('b'),market = True,placed_at = 0)
+    assert q.pop_due(now = 0.5) == []
+    assert q.pop_due(now = 1) == [market]
+    assert q.pop_due(now = 5) == [limit]
+    delays = []
+    now = 5
+    for _ in range(6):
+        q.reschedule(limit,now = now)
+        delays.append(limit.next_check - now)
+        now = limit.next_check
+        assert q.pop_due(now = now) == [limit]
+    assert delays == [5,10,20,40,40,40]
+    assert limit.cc == 6
+
+def test_lookup_and_cancel_by_symbol():
+    q = OrderQueue()
+    a1 = q.push('AAPL',FakeOrder('1'),placed_at = 0)
+    a2 = q.push('AAPL',FakeOrder('2'),placed_at = 0)
+    m = q.push('MSFT',FakeOrder('3'),placed_at = 0)
+    assert q.get('3') is m
+    assert set(q.by_symbol('AAPL')) == {a1,a2}
+    assert q.remove(a1) and q.remove(a2)
+    assert len(q) == 1
+    assert q.by_symbol('AAPL') == []
+    assert q.pop_due(now = 100) == [m]
+    assert q.remove(m)
+    assert not q.remove(m)
+    assert len(q) == 0
+
+def test_removed_orders_are_not_rescheduled():
+    q = OrderQueue()
+    e = q.push('AAPL',FakeOrder('1'),placed_at = 0)
+    assert q.pop_due(now = 100) == [e]
+    assert q.remove(e)
+    q.reschedule(e,now = 100)
+    assert q.pop_due(now = 10**6) == []
+
+def test_make_all_due_keeps_the_check_count():
+    q = OrderQueue(base_delay = 5)
+    e = q.push('AAPL',FakeOrder('a'),placed_at = 0)
+    q.make_all_due(now = 1)
+    assert q.pop_due(now = 1) == [e]
+    assert e.cc == 0
+    q.make_all_due(now = 2)
+    assert q.pop_due(now = 2) == []
+    q.reschedule(e,now = 2)
+    q.make_all_due(now = 3)
+    assert q.pop_due(now = 3) == [e] and e.cc == 1
@@ -0,0 +1,63 @@
+from Portfolio.Portfolio import Portfolio
+from Portfolio.SimBroker import ManualClock
+from Portfolio.SimBroker import SimBroker
+
+
+def test_many_orders_filled_in_pieces(confirm_all):
+    clock = ManualClock()
+    prices = {'S{}'.format(i) : 10.0 + i for i in range(10)}
+    broker = SimBroker(cash = 10**7,prices = prices,fill_latency = 1,partial_fills = 4,clock = clock)
+    p = Portfolio(trader = broker,name = 'p',iniFund = 10**6)
+    futures = [p.market_buy('S{}'.format(i % 10),13) for i in range(200)]
+    for f in futures:
+        assert f.result() is not None
+    confirm_all(p)
+    assert len(p.queue) == 200
+    clock.advance(1)
+    confirm_all(p)
+    # 13 shares come in executions of 4, 3, 3 and 3
+    assert len(p.queue) == 200
+    assert p.shares_owned('S0') == 20*4
+    assert len(p.trading_record) == 200
+    clock.advance(1)
+    confirm_all(p)
+    confirm_all(p)
+    assert p.shares_owned('S0') == 20*7
+    clock.advance(10)
+    confirm_all(p)
+    assert len(p.queue) == 0
+    assert len(p.trading_record) == 800
+    for scode,(shares,cost) in broker.positions.items():
+        assert p.shares_owned(scode) == shares == 20*13
+        assert abs(p.portfolio_record.cost_of(scode) - cost) < 1e-9
+    assert abs((10**6 - p.bp) - (10**7 - broker.cash)) < 1e-6
+    assert p.fill_latency_stats()['count'] == 200
+
+def test_cancelled_after_a_partial_fill(confirm_all):
+    clock = ManualClock()
+    broker = SimBroker(prices = {'AAPL' : 10.0},fill_latency = 1,partial_fills = 4,clock = clock)
+    p = Portfolio(trader = broker,name = 'p',iniFund = 1000,cancel_count = 1)
+    order = p.limit_buy('AAPL',10.0,8).result()
+    clock.advance(1)
+    confirm_all(p)
+    confirm_all(p)
+    assert len(p.queue) == 1
+    assert p.shares_owned('AAPL') == 2
+    order.cancel()
+    clock.advance(10)
+    confirm_all(p)
+    assert len(p.queue) == 0
+    assert p.shares_owned('AAPL') == 2
+    assert abs(p.bp - 980) < 1e-9
+
+def test_cancel_books_what_executed_before():
+    clock = ManualClock()
+    broker = SimBroker(prices = {'AAPL' : 10.0},fill_latency = 1,partial_fills = 4,clock = clock)
+    p = Portfolio(trader = broker,name = 'p',iniFund = 1000)
+    p.limit_buy('AAPL',10.0,8).result()
+    p.limit_buy('MSFT',1.0,8).result()
+    clock.advance(1)
+    p.cancel_all_orders_in_queue()
+    assert len(p.queue) == 0
+    assert broker.positions['AAPL'][0] == p.shares_owned('AAPL') == 2
+    assert abs(p.bp - 980) < 1e-9
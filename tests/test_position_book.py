@@ -0,0 +1,61 @@
+import numpy as np
+from Portfolio.PositionBook import PositionBook
+
+
+def test_buy_sell_and_average_cost():
+    book = PositionBook(capacity = 1)
+    book.add('AAPL',10,100)
+    book.add('AAPL',10,110)
+    assert book.shares_of('AAPL') == 20
+    assert book.cost_of('AAPL') == 105
+    book.add('AAPL',-5)
+    assert book.get('AAPL').shares == 15
+    assert book.cost_of('AAPL') == 105
+    book.add('AAPL',-15)
+    assert 'AAPL' not in book
+    assert book.shares_of('AAPL') == 0
+
+def test_remove_keeps_slots_dense():
+    book = PositionBook(capacity = 2)
+    for i,scode in enumerate(['A','B','C','D']):
+        book.set(scode,1.0+i,10*(i+1))
+    book.remove('B')
+    assert len(book) == 3
+    assert book.symbols() == ['A','D','C']
+    assert list(book.share_array()) == [10,40,30]
+    assert book.market_value(np.array([1,2,3])) == 10+80+90
+
+def test_frame_round_trip():
+    book = PositionBook()
+    book.set('AAPL',100.0,3)
+    book.set('MSFT',50.0,7)
+    df = book.to_frame()
+    assert list(df.columns) == PositionBook.COLUMNS
+    assert df.loc['MSFT','SHARES'] == 7
+    back = PositionBook.from_frame(df)
+    assert back.get('AAPL').avg_cost == 100.0
+
+def test_snapshot_is_copied_once_per_change():
+    book = PositionBook()
+    book.set('AAPL',100.0,3)
+    snap = book.snapshot()
+    assert book.snapshot() is snap
+    book.add('AAPL',2,100.0)
+    assert snap.shares_of('AAPL') == 3
+    assert book.snapshot() is not snap
+    assert book.snapshot().shares_of('AAPL') == 5
+
+def test_concurrent_updates():
+    from threading import Thread
+    book = PositionBook(capacity = 1)
+    def worker(k):
+        for i in range(500):
+            book.add('S{}'.format(i % 20),1,float(k))
+            book.snapshot()
+    threads = [Thread(target = worker,args = (k,)) for k in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(book) == 20
+    assert book.share_array().sum() == 8*500
@@ -0,0 +1,100 @@
+import time
+import numpy as np
+from threading import Lock
+from threading import Thread
+from Portfolio.EventLog import EventLog
+from Portfolio.Portfolio import Portfolio
+from Portfolio.QuoteCache import QuoteCache
+from Portfolio.SimBroker import SimBroker
+
+
+class FakeTrader:
+    def __init__(self,delay = 0,unknown = ()):
+        self.delay = delay
+        self.unknown = set(unknown)
+        self.calls = []
+        self.lock = Lock()
+
+    def last_trade_price(self,scodes):
+        time.sleep(self.delay)
+        with self.lock:
+            self.calls.append(scodes)
+        return [[len(s),s] for s in scodes.split(',') if s not in self.unknown]
+
+
+def test_fresh_prices_are_shared():
+    trader = FakeTrader()
+    quotes = QuoteCache(trader = trader,max_age = 60)
+    assert list(quotes.last_trade_price('A','BB','CCC')) == [1,2,3]
+    assert quotes.get('BB') == 2
+    assert list(quotes.last_trade_price('CCC','DDDD')) == [3,4]
+    assert trader.calls == ['A,BB,CCC','DDDD']
+    assert quotes.stats()['hits'] == 2
+
+def test_stale_prices_are_requested_again():
+    trader = FakeTrader()
+    quotes = QuoteCache(trader = trader,max_age = 0)
+    quotes.get('A')
+    time.sleep(0.01)
+    quotes.get('A')
+    assert len(trader.calls) == 2
+
+def test_concurrent_requests_coalesce():
+    trader = FakeTrader(delay = 0.1)
+    quotes = QuoteCache(trader = trader,max_age = 60)
+    res = []
+    threads = [Thread(target = lambda: res.append(list(quotes.last_trade_price('AA','BBB')))) for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert res == [[2,3]]*10
+    assert len(trader.calls) == 1
+    assert quotes.stats()['requests'] == 1
+
+def test_missing_rows_are_nan():
+    trader = FakeTrader(unknown = ['ZZ'])
+    quotes = QuoteCache(trader = trader,max_age = 60)
+    res = quotes.last_trade_price('A','ZZ','CCC')
+    assert res[0] == 1 and np.isnan(res[1]) and res[2] == 3
+    assert np.isnan(quotes.get('ZZ'))
+
+def test_invalidate_while_waiting():
+    trader = FakeTrader(delay = 0.1)
+    quotes = QuoteCache(trader = trader,max_age = 60)
+    res = []
+    threads = [Thread(target = lambda: res.append(list(quotes.last_trade_price('AA','BBB')))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    time.sleep(0.05)
+    quotes.invalidate()
+    for t in threads:
+        t.join()
+    assert res == [[2,3]]*5
+
+class PartialBroker(SimBroker):
+    """
+    answers last_trade_price without a row for the symbols in unquoted
+    """
+    unquoted = {'ZZ'}
+
+    def last_trade_price(self,scodes):
+        return [row for row in SimBroker.last_trade_price(self,scodes) if row[1] not in self.unquoted]
+
+def test_unquoted_symbols_are_not_traded():
+    broker = PartialBroker(cash = 1e6,prices = {'AAPL' : 10.0,'ZZ' : 5.0})
+    p = Portfolio(trader = broker,name = 'p',iniFund = 100)
+    assert p.market_buy('ZZ',1000).result() is None
+    assert p.limit_buy('ZZ',5.0,1000).result() is None
+    assert p.l_market_buy('ZZ',10,force_buy = True).result() is None
+    assert broker.calls['place_market_buy_order'] == broker.calls['place_limit_buy_order'] == 0
+    assert len(p.log.query(level = EventLog.ERROR,scode = 'ZZ')) == 3
+    assert p.market_buy('AAPL',5).result() is not None
+
+def test_unquoted_positions_are_valued_at_cost():
+    broker = PartialBroker(cash = 1e6,prices = {'AAPL' : 10.0,'ZZ' : 5.0})
+    p = Portfolio(trader = broker,name = 'p',iniFund = 100)
+    p.add_shares('AAPL',2,8.0)
+    p.add_shares('ZZ',4,3.0)
+    assert p.get_market_value() == 100 + 2*10.0 + 4*3.0
+    assert abs(p.get_weights('ZZ')['ZZ'] - 12/132) < 1e-12
@@ -0,0 +1,32 @@
+from Portfolio.Portfolio import Portfolio
+from Portfolio.SimBroker import ManualClock
+from Portfolio.SimBroker import SimBroker
+
+
+def test_rebalance_to_weights(confirm_all):
+    clock = ManualClock()
+    prices = {'AAPL' : 10.0,'MSFT' : 20.0,'IBM' : 50.0,'T' : 3.0}
+    broker = SimBroker(cash = 100000,prices = prices,clock = clock)
+    p = Portfolio(trader = broker,name = 'p',iniFund = 1000)
+    p.add_shares('IBM',10,50.0)
+    p.add_shares('T',1,3.0)
+    broker.calls.clear()
+    placed = p.rebalance_to({'AAPL' : 0.5,'MSFT' : 0.25,'IBM' : 0.1},lot = 5,min_trade = 5.0)
+    assert broker.calls['last_trade_price'] == 1
+    # market value 1500 + 3: AAPL 75.15 -> 75, MSFT 18.7875 -> 15, IBM 3.006 - 10 -> -5, T sold whole
+    assert [(scode,n) for scode,n,_ in placed] == [('IBM',-5),('T',-1),('AAPL',75),('MSFT',15)]
+    for _,_,f in placed:
+        assert f.result() is not None
+    clock.advance(1)
+    confirm_all(p)
+    assert len(p.queue) == 0
+    assert p.shares_owned('AAPL') == 75 and p.shares_owned('MSFT') == 15 and p.shares_owned('IBM') == 5
+    assert p.shares_owned('T') == 0
+    assert abs(p.bp - (1000 + 250 + 3 - 750 - 300)) < 1e-9
+
+def test_buys_are_scaled_to_the_budget():
+    broker = SimBroker(cash = 100000,prices = {'AAPL' : 10.0,'MSFT' : 20.0})
+    p = Portfolio(trader = broker,name = 'p',iniFund = 1000)
+    placed = p.rebalance_to({'AAPL' : 0.5,'MSFT' : 0.5},reserve = 0.1)
+    assert [(scode,n) for scode,n,_ in placed] == [('AAPL',45),('MSFT',22)]
+    assert p.rebalance_to({}) == []
@@ -0,0 +1,81 @@
+import pytest
+import time
+from threading import Event
+from Portfolio.EventLog import EventLog
+from Portfolio.PortfolioMgr import PortfolioMgr
+from Portfolio.Scheduler import Scheduler
+from Portfolio.SimBroker import SimBroker
+
+
+def test_ticks_at_cadence_and_pause_resume():
+    scheduler = Scheduler(workers = 2)
+    ticks = []
+    scheduler.add('a',lambda: ticks.append(time.monotonic()),0.05)
+    time.sleep(0.52)
+    scheduler.pause('a')
+    n = len(ticks)
+    assert 9 <= n <= 12
+    time.sleep(0.2)
+    assert len(ticks) == n
+    scheduler.resume('a')
+    time.sleep(0.12)
+    assert len(ticks) > n
+    stats = scheduler.stats()['a']
+    assert stats['ticks'] == len(ticks)
+    assert stats['overruns'] == 0
+    scheduler.shutdown()
+
+def test_slow_ticks_are_counted_as_overruns():
+    scheduler = Scheduler(workers = 2)
+    gate = Event()
+    scheduler.add('slow',lambda: gate.wait(0.3),0.05)
+    time.sleep(0.35)
+    gate.set()
+    time.sleep(0.05)
+    stats = scheduler.stats()['slow']
+    assert stats['overruns'] >= 4
+    assert stats['latency_max'] >= 0.25
+    scheduler.shutdown()
+
+def test_errors_dont_stop_the_job(caplog):
+    scheduler = Scheduler()
+    def boom():
+        raise ValueError()
+    scheduler.add('boom',boom,0.02)
+    time.sleep(0.1)
+    assert scheduler.stats()['boom']['errors'] >= 3
+    scheduler.shutdown()
+    assert 'tick of boom failed' in caplog.text
+    assert 'ValueError' in caplog.text
+
+def test_strategy_errors_reach_the_portfolio_log():
+    mgr = PortfolioMgr(name = 'mgr',trader = SimBroker(cash = 1000))
+    mgr.add_portfolio(name = 'a',ini_bp = 100)
+    mgr.working_now = False
+    class Algo:
+        def trade(self,mgr,pname,args,misc):
+            raise KeyError('AAPL')
+    mgr.schedule(algo = Algo(),method = 'trade',portfolio_name = 'a',freq = 1)
+    with pytest.raises(KeyError):
+        mgr.scheduler.jobs['a'].fn()
+    event, = mgr.portfolios['a'].log.query(level = EventLog.ERROR)
+    assert event.message() == "trade failed: KeyError('AAPL')"
+    assert 'raise KeyError' in event.fields['traceback']
+    mgr.quit()
+
+def test_after_cycle_runs_once_the_ticks_started_together_return():
+    seen = []
+    scheduler = Scheduler(workers = 2,after_cycle = lambda: seen.append(sorted(ran)))
+    ran = []
+    def job(name,wait):
+        def fn():
+            time.sleep(wait)
+            ran.append(name)
+        return fn
+    scheduler.add('fast',job('fast',0),10,paused = True,align = True)
+    scheduler.add('slow',job('slow',0.1),10,paused = True,align = True)
+    scheduler.resume('fast','slow')
+    time.sleep(0.3)
+    scheduler.shutdown()
+    assert seen == [['fast','slow']]
+    assert scheduler.jobs['fast'].next_run == scheduler.jobs['slow'].next_run
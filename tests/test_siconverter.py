@@ -0,0 +1,169 @@
+import sqlite3
+from Portfolio.SIconverter import SIconverter
+
+
+class FakeSession:
+    def __init__(self,trader):
+        self.trader = trader
+
+    def get(self,instrument):
+        self.trader.requests += 1
+        scode = instrument.rstrip('/').split('/')[-1]
+        class Response:
+            def json(self):
+                return {'symbol' : scode}
+        return Response()
+
+class FakeTrader:
+    def __init__(self):
+        self.requests = 0
+        self.session = FakeSession(self)
+
+    def instruments(self,scode):
+        self.requests += 1
+        return {'url' : 'https://api.robinhood.com/instruments/{}/'.format(scode)}
+
+
+def test_both_directions():
+    trader = FakeTrader()
+    converter = SIconverter(trader = trader)
+    instrument = converter('AAPL')
+    assert instrument == 'https://api.robinhood.com/instruments/AAPL/'
+    assert converter(instrument) == 'AAPL'
+    assert converter('https://api.robinhood.com/instruments/MSFT/') == 'MSFT'
+    assert converter('MSFT') == 'https://api.robinhood.com/instruments/MSFT/'
+    assert trader.requests == 2
+    assert converter.stats()['hits'] == 2
+    assert converter.stats()['misses'] == 2
+
+def test_evicts_least_frequently_used():
+    converter = SIconverter(buffer_size = 3,trader = FakeTrader())
+    for scode in ['A','A','A','B','B','C']:
+        converter(scode)
+    converter('D')
+    assert 'C' not in converter.SI
+    assert 'https://api.robinhood.com/instruments/C/' not in converter.IS
+    assert set(converter.SI) == {'A','B','D'}
+    assert converter.stats()['evictions'] == 1
+    converter('E')
+    assert set(converter.SI) == {'A','B','E'}
+
+def test_aging_lets_old_favourites_go():
+    converter = SIconverter(buffer_size = 2,trader = FakeTrader())
+    for _ in range(10):
+        converter('OLD')
+    for _ in range(40):
+        converter('NEW1')
+        converter('NEW2')
+    assert 'OLD' not in converter.SI
+    assert len(converter.SI) == 2
+
+def test_on_disk_index_warm_start(tmp_path):
+    path = str(tmp_path/'instruments.db')
+    trader = FakeTrader()
+    converter = SIconverter(trader = trader,load = path)
+    for scode in ['AAPL','MSFT','BAC']:
+        converter(scode)
+    converter.close()
+    assert trader.requests == 3
+
+    trader = FakeTrader()
+    converter = SIconverter(trader = trader,load = path)
+    assert converter('MSFT') == 'https://api.robinhood.com/instruments/MSFT/'
+    assert converter('https://api.robinhood.com/instruments/BAC/') == 'BAC'
+    assert trader.requests == 0
+
+    reader = SIconverter(buffer_size = 1,trader = FakeTrader(),load = path,readonly = True)
+    assert reader('AAPL') == 'https://api.robinhood.com/instruments/AAPL/'
+    assert reader('BAC') == 'https://api.robinhood.com/instruments/BAC/'
+    assert reader.trader.requests == 0
+    assert reader.stats()['disk_hits'] >= 1
+    reader('TSLA')
+    assert reader.trader.requests == 1
+    reader.close()
+    converter.close()
+
+class BrokenIndex:
+    def execute(self,*args):
+        raise sqlite3.OperationalError('database is locked')
+
+    def close(self):
+        pass
+
+def test_broken_index_is_not_fatal(tmp_path):
+    trader = FakeTrader()
+    converter = SIconverter(trader = trader,load = str(tmp_path/'instruments.db'))
+    converter.db.close()
+    converter.db = BrokenIndex()
+    assert converter('AAPL') == 'https://api.robinhood.com/instruments/AAPL/'
+    assert converter('https://api.robinhood.com/instruments/MSFT/') == 'MSFT'
+    assert not converter.db_lock.locked()
+    assert converter('AAPL') == 'https://api.robinhood.com/instruments/AAPL/'
+    assert trader.requests == 2
+    assert converter.stats()['index_errors'] == 4
+
+def test_prefetch_resolves_batch_once():
+    trader = FakeTrader()
+    converter = SIconverter(trader = trader)
+    converter('AAPL')
+    res = converter.prefetch([
+        'AAPL','MSFT','MSFT',
+        'https://api.robinhood.com/instruments/BAC/',
+        {'url' : 'https://api.robinhood.com/instruments/BAC/'}
+    ])
+    assert res['AAPL'] == 'https://api.robinhood.com/instruments/AAPL/'
+    assert res['MSFT'] == 'https://api.robinhood.com/instruments/MSFT/'
+    assert res['https://api.robinhood.com/instruments/BAC/'] == 'BAC'
+    assert trader.requests == 3
+    assert converter('BAC') == 'https://api.robinhood.com/instruments/BAC/'
+    assert trader.requests == 3
+
+def test_concurrent_misses_share_one_request():
+    import time
+    from threading import Thread,Lock
+    class SlowTrader(FakeTrader):
+        def __init__(self):
+            FakeTrader.__init__(self)
+            self.lock = Lock()
+
+        def instruments(self,scode):
+            time.sleep(0.05)
+            with self.lock:
+                self.requests += 1
+            return {'url' : 'https://api.robinhood.com/instruments/{}/'.format(scode)}
+    trader = SlowTrader()
+    converter = SIconverter(trader = trader)
+    res = []
+    threads = [Thread(target = lambda: res.append(converter('AAPL'))) for _ in range(64)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert trader.requests == 1
+    assert res == ['https://api.robinhood.com/instruments/AAPL/']*64
+
+def test_stress_many_threads_small_cache():
+    from threading import Thread
+    import random
+    converter = SIconverter(buffer_size = 16,trader = FakeTrader())
+    errors = []
+    def hammer(seed):
+        rnd = random.Random(seed)
+        try:
+            for _ in range(2000):
+                i = rnd.randrange(64)
+                if rnd.random() < 0.5:
+                    assert converter('S{}'.format(i)) == 'https://api.robinhood.com/instruments/S{}/'.format(i)
+                else:
+                    assert converter('https://api.robinhood.com/instruments/S{}/'.format(i)) == 'S{}'.format(i)
+        except Exception as e:
+            errors.append(e)
+    threads = [Thread(target = hammer,args = (seed,)) for seed in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert len(converter.SI) == len(converter.IS) == len(converter.count) <= 16
+    assert sum(len(b) for b in converter.buckets.values()) == len(converter.SI)
+    assert not converter.inflight
@@ -0,0 +1,55 @@
+from Portfolio.Portfolio import Portfolio
+from Portfolio.SimBroker import ManualClock
+from Portfolio.SimBroker import SimBroker
+
+
+def test_partial_fills_follow_the_clock():
+    clock = ManualClock()
+    broker = SimBroker(prices = {'AAPL' : 10.0},fill_latency = 2,partial_fills = 3,clock = clock)
+    order = broker.place_market_buy_order(None,'AAPL',10)
+    assert order.check()['state'] == 'confirmed'
+    clock.advance(2)
+    d = order.check()
+    assert d['state'] == 'partially_filled'
+    assert [e['quantity'] for e in d['executions']] == ['4']
+    clock.advance(10)
+    d = order.check()
+    assert d['state'] == 'filled'
+    assert [e['quantity'] for e in d['executions']] == ['4','3','3']
+    assert broker.cash == 100000 - 100
+    assert broker.securities_owned()['results'][0]['quantity'] == '10.0'
+
+def test_limits_stops_and_rejects():
+    clock = ManualClock()
+    runs = []
+    for _ in range(2):
+        broker = SimBroker(prices = {'MSFT' : 50.0},clock = clock,reject_rate = 0.5,seed = 3)
+        runs.append([broker.place_market_buy_order(None,'MSFT',1).check()['state'] for _ in range(20)])
+    assert runs[0] == runs[1]
+    assert 0 < runs[0].count('rejected') < 20
+    broker = SimBroker(prices = {'MSFT' : 50.0},clock = clock)
+    limit = broker.place_limit_buy_order(None,'MSFT',1,price = 45)
+    stop = broker.place_stop_loss_sell_order(None,'MSFT',1,stop_price = 48)
+    assert broker.place_market_buy_order(None,'MSFT',10**6).check()['state'] == 'rejected'
+    assert [d['state'] for d in broker.check_orders([limit,stop])] == ['confirmed','confirmed']
+    broker.set_price('MSFT',44)
+    assert [d['state'] for d in broker.check_orders([limit,stop])] == ['filled','filled']
+    assert broker.calls['check_orders'] == 2
+
+def test_portfolio_on_simulator(confirm_all):
+    clock = ManualClock()
+    broker = SimBroker(prices = {'AAPL' : 10.0,'MSFT' : 20.0},fill_latency = 1,clock = clock)
+    p = Portfolio(trader = broker,name = 'sim',iniFund = 1000)
+    assert p.market_buy('AAPL',10).result() is not None
+    assert p.limit_buy('MSFT',15.0,5).result() is not None
+    p.confirm_pass()
+    assert len(p.queue) == 2
+    clock.advance(1)
+    broker.set_price('MSFT',15.0)
+    confirm_all(p)
+    assert len(p.queue) == 0
+    assert p.shares_owned('AAPL') == 10
+    assert p.shares_owned('MSFT') == 5
+    assert abs(p.bp - (1000 - 100 - 75)) < 1e-9
+    p.quotes.invalidate()
+    assert abs(p.get_market_value() - 1000) < 1e-9
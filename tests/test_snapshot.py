@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from Portfolio.PositionBook import PositionBook
+from Portfolio.Snapshot import Snapshot
+from Portfolio.TradeLedger import TradeLedger
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path/'p.snap')
+    ledger = TradeLedger()
+    ledger.append('buy','AAPL',10.5,3,'market')
+    ledger.append('None','None','None',100,'add bp')
+    ledger.append('sell','AAPL',11.0,1,'limit')
+    book = PositionBook()
+    book.add('AAPL',2,10.5)
+    book.add('MSFT',5,20.0)
+    Snapshot.write(path,ledger,book,bp = 123.5,orders = {'7' : 'AAPL'})
+    snap = Snapshot.read(path)
+    assert snap.meta == {'bp' : 123.5,'orders' : {'7' : 'AAPL'}}
+    a,b = ledger.to_frame(),snap.ledger.to_frame()
+    assert list(a.index) == list(b.index)
+    assert list(a['SIDE']) == list(b['SIDE'])
+    assert list(a['SCODE']) == list(b['SCODE'])
+    assert np.isnan(b['PRICE'].iloc[1])
+    assert snap.book.shares_of('MSFT') == 5 and snap.book.cost_of('AAPL') == 10.5
+
+def test_mapped_ledger_copied_on_append(tmp_path):
+    path = str(tmp_path/'p.snap')
+    ledger = TradeLedger()
+    for i in range(100):
+        ledger.append('buy','S{}'.format(i % 7),float(i),1,'market')
+    Snapshot.write(path,ledger,PositionBook())
+    snap = Snapshot.read(path)
+    assert isinstance(snap.ledger.price.base,np.memmap)
+    snap.ledger.append('sell','S1',1.0,1,'market')
+    assert len(snap.ledger) == 101
+    assert not isinstance(snap.ledger.price.base,np.memmap)
+    Snapshot.write(path,snap.ledger,PositionBook())
+    assert len(Snapshot.read(path).ledger) == 101
+
+def test_newer_version_refused(tmp_path):
+    path = str(tmp_path/'p.snap')
+    Snapshot.write(path,TradeLedger(),PositionBook())
+    with open(path,'r+b') as f:
+        f.write(Snapshot.HEADER.pack(Snapshot.MAGIC,Snapshot.VERSION + 1,0)[:6])
+    with pytest.raises(ValueError):
+        Snapshot.read(path)
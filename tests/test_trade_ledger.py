@@ -0,0 +1,33 @@
+import datetime
+import numpy as np
+from Portfolio.TradeLedger import TradeLedger
+
+
+def test_append_grow_and_frame():
+    ledger = TradeLedger(capacity = 2)
+    t0 = datetime.datetime(2020,1,2,9,30)
+    for i in range(10):
+        ledger.append('buy' if i % 2 else 'sell','S{}'.format(i % 3),10.0+i,i,'market',when = t0+datetime.timedelta(seconds = i))
+    ledger.append('None','AAPL','None',3,'add share',when = t0)
+    assert len(ledger) == 11
+    df = ledger.to_frame()
+    assert list(df.columns) == TradeLedger.COLUMNS
+    assert df['SIDE'].iloc[1] == 'buy'
+    assert df['SCODE'].iloc[5] == 'S2'
+    assert df['PRICE'].iloc[9] == 19.0
+    assert np.isnan(df['PRICE'].iloc[10])
+    assert df.index[3] == t0+datetime.timedelta(seconds = 3)
+
+def test_same_timestamp_records_are_kept():
+    ledger = TradeLedger()
+    t0 = datetime.datetime(2020,1,2,9,30)
+    ledger.append('buy','AAPL',1,1,'market',when = t0)
+    ledger.append('buy','AAPL',2,1,'market',when = t0)
+    assert len(ledger.to_frame()) == 2
+
+def test_frame_round_trip():
+    ledger = TradeLedger()
+    ledger.append('sell','MSFT',100.5,2,'limit')
+    ledger.append('None','None',500,1,'add bp')
+    back = TradeLedger.from_frame(ledger.to_frame())
+    assert back.to_frame().astype(str).equals(ledger.to_frame().astype(str))